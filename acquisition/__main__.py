@@ -1,84 +1,507 @@
+import argparse
+import itertools
+import multiprocessing
 import os
 import time
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
 
 import pandas as pd
 from spotipy import Spotify
 from spotipy.oauth2 import SpotifyClientCredentials
 
-from .network import Network
+from .cache import DAY, ResponseCache
+from .checkpoint import Checkpoint
+from .features import FeatureMatrix
+from .graph import Graph, create_graph
+from .metrics import metrics
+from .network import (ARTISTS_BATCH_SIZE, Network, classify_spotify_error, fetched_key, graph_from_chunks,
+                      graph_from_dataframe, spotify_session)
+from .ratelimit import RateLimiter
+from .scheduler import Budget, Frontier, Score, parse_score, stale_artists
+from .seen import SeenStore
+from .snapshot import SnapshotWriter
+from .storage import read_edge_chunks, read_edges, read_vertex_chunks, read_vertices
 from .artist import Artist
+from .track import AUDIO_FEATURES, Track
+
+REFRESH_ENDPOINTS = ("artists", "artist_top_tracks", "artist_related_artists")
 
 
 def main():
-    vertices_path = os.environ.get("VERTICES_PATH")
-    edges_path = os.environ.get("EDGES_PATH")
-    playlists_path = os.environ.get("PLAYLISTS_PATH")
+    parser = argparse.ArgumentParser(description="crawl spotify artists and tracks via seed playlists")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from the last checkpoint in SNAPSHOT_PATH")
+    parser.add_argument("--processes", type=int, default=int(os.environ.get("CRAWL_PROCESSES", 1)),
+                        help="split the seed playlists across this many worker processes")
+    parser.add_argument("--schedule", choices=["depth", "priority"], default=os.environ.get("CRAWL_SCHEDULE", "depth"),
+                        help="crawl two layers out from each playlist in turn, or the best scored artists first")
+    parser.add_argument("--score", default=os.environ.get("CRAWL_SCORE", "popularity,degree:10,distance:25"),
+                        help="how priority crawls rank artists: comma separated popularity, degree and distance terms, "
+                             "each with an optional :weight")
+    parser.add_argument("--max-calls", type=int, default=optional_int(os.environ.get("CRAWL_MAX_CALLS")),
+                        help="stop a priority crawl or refresh after this many spotify requests")
+    parser.add_argument("--max-seconds", type=float, default=optional_float(os.environ.get("CRAWL_MAX_SECONDS")),
+                        help="stop a priority crawl or refresh after this many seconds")
+    parser.add_argument("--max-distance", type=int, default=optional_int(os.environ.get("CRAWL_MAX_DISTANCE")),
+                        help="only crawl artists up to this many steps from the seed playlists")
+    parser.add_argument("--refresh", action="store_true",
+                        help="instead of crawling, re-fetch what is older than --max-age-days for artists already "
+                             "in the graph, best scored first")
+    parser.add_argument("--max-age-days", type=float, default=float(os.environ.get("REFRESH_MAX_AGE_DAYS", 7)),
+                        help="how old fetched data can get before a refresh fetches it again")
+    parser.add_argument("--refresh-endpoints", default=os.environ.get("REFRESH_ENDPOINTS", ",".join(REFRESH_ENDPOINTS)),
+                        help=f"comma separated endpoints a refresh fetches again, out of {', '.join(REFRESH_ENDPOINTS)}")
+    args = parser.parse_args()
+    settings = read_settings()
+    if args.resume and args.processes > 1:
+        parser.error("--resume is not supported with --processes")
+    if settings['graph_backend'] == "sqlite" and args.processes > 1:
+        parser.error("--processes is not supported with GRAPH_BACKEND=sqlite")
+    if args.schedule == "priority" and args.processes > 1:
+        parser.error("--processes is not supported with --schedule priority")
+    if args.schedule == "priority" and args.max_calls is None and args.max_seconds is None \
+            and args.max_distance is None:
+        parser.error("priority crawls need --max-calls, --max-seconds or --max-distance")
+    if args.refresh and (args.resume or args.processes > 1):
+        parser.error("--refresh is not supported with --resume or --processes")
+    refresh_endpoints = [endpoint.strip() for endpoint in args.refresh_endpoints.split(",") if endpoint.strip()]
+    if any(endpoint not in REFRESH_ENDPOINTS for endpoint in refresh_endpoints):
+        parser.error(f"--refresh-endpoints must be out of {', '.join(REFRESH_ENDPOINTS)}")
+    score = parse_score(args.score)
+
+    features = FeatureMatrix(settings['features_path'] or settings['snapshot_path'], AUDIO_FEATURES)
+    writer = SnapshotWriter(settings['snapshot_path'], settings['snapshot_format'], AUDIO_FEATURES, features)
+    checkpoint = Checkpoint(writer, settings['checkpoint_interval'])
+    state = checkpoint.load() if args.resume else None
+
+    if settings['graph_backend'] == "sqlite":
+        graph = load_graph_chunks(settings, writer if state or args.refresh else None)
+        network = build_network(settings, graph=graph)
+    else:
+        vertices, edges = load_graph(settings)
+        if state or args.refresh:
+            print("Loading graph written since the last run started")
+            vertices, edges = merge_snapshot(vertices, edges, *writer.read())
+        network = build_network(settings, vertices, edges)
+    if args.refresh and len(network.graph.nodes) <= 0:
+        parser.error("--refresh needs a graph, from VERTICES_PATH and EDGES_PATH or SNAPSHOT_PATH")
+    if state or args.refresh:
+        load_artist_graph(network.graph, writer)
+    playlist_names = read_lines(settings['playlists_path'])
+
+    if args.processes > 1:
+        start_time = time.time()
+        crawl_sharded(network, playlist_names, settings, args.processes)
+        print_progress(network, writer.flush(network.graph, "shards"), start_time)
+    elif args.refresh:
+        max_age = args.max_age_days * DAY
+        if network.cache:
+            # a cached response older than max_age would only hand back the stale data again
+            network.cache.cap_ttls(max_age)
+        print(f"Refreshing {', '.join(refresh_endpoints)} older than {args.max_age_days:g} days")
+        refresh_graph(network, refresh_endpoints, max_age, score, Budget(args.max_calls, args.max_seconds),
+                      settings['workers'], writer, settings['checkpoint_interval'])
+    elif args.schedule == "priority":
+        print("Adding new tracks and artists via the best scored artists reachable from the seed playlists")
+        frontier = Frontier(network.graph, score, args.max_distance)
+        budget = Budget(args.max_calls, args.max_seconds)
+        crawl_prioritized(network, playlist_names, settings['workers'], frontier, budget, checkpoint, state,
+                          settings['metrics_path'])
+    else:
+        print("Adding new tracks and artists via seed playlists")
+        crawl_playlists(network, playlist_names, settings['workers'], checkpoint, state, settings['metrics_path'])
+
+    metrics.write(settings['metrics_path'])
+    print(f"Wrote metrics to {settings['metrics_path']}")
+    if network.graph.seen_store is not None:
+        network.graph.seen_store.close()
+    network.graph.close()
+    network.close()
+
+
+def read_settings() -> Dict[str, Any]:
+    return {
+        'vertices_path': os.environ.get("VERTICES_PATH"),
+        'edges_path': os.environ.get("EDGES_PATH"),
+        'playlists_path': os.environ.get("PLAYLISTS_PATH"),
+        'workers': int(os.environ.get("CRAWL_WORKERS", 1)),
+        'cache_path': os.environ.get("CACHE_PATH"),
+        'snapshot_path': os.environ.get("SNAPSHOT_PATH", "snapshots"),
+        'snapshot_format': os.environ.get("SNAPSHOT_FORMAT", "csv"),
+        'checkpoint_interval': int(os.environ.get("CHECKPOINT_INTERVAL", 50)),
+        'spotify_rate': float(os.environ.get("SPOTIFY_RATE", 10)),
+        'graph_backend': os.environ.get("GRAPH_BACKEND", "networkx"),
+        'graph_path': os.environ.get("GRAPH_PATH"),
+        'metrics_path': os.environ.get("METRICS_PATH", "metrics"),
+        'page_workers': int(os.environ.get("PAGE_WORKERS", 4)),
+        'seen_path': os.environ.get("SEEN_PATH"),
+        'features_path': os.environ.get("FEATURES_PATH"),
+    }
+
 
-    spotify = Spotify(auth_manager=SpotifyClientCredentials())
-    audio_features = [
-        "danceability", "energy", "key", "loudness", "mode", "speechiness", "acousticness", "instrumentalness",
-        "liveness", "valence", "tempo", "duration_ms", "time_signature"
-    ]
+def load_graph(settings: Dict[str, Any]) -> Tuple[Union[pd.DataFrame, None], Union[pd.DataFrame, None]]:
+    if not settings['vertices_path'] or not settings['edges_path']:
+        return None, None
 
-    if vertices_path and edges_path:
+    print("Loading graph from file")
+    return read_vertices(settings['vertices_path'], AUDIO_FEATURES), read_edges(settings['edges_path'])
+
+
+def load_artist_graph(graph: Graph, writer: SnapshotWriter):
+    # snapshot rows hold a pair's absolute counts; only a graph holding the snapshot's tracks too can count on from
+    # them, as it won't count those tracks again when they are put
+    graph.artist_graph.load(writer.read_artist_edges())
+    graph.artist_graph.clear_changes()
+
+
+def load_graph_chunks(settings: Dict[str, Any], writer: SnapshotWriter = None) -> Union[Graph, None]:
+    # read a chunk at a time straight into the graph, so a graph kept on disk never has to fit in memory
+    vertex_chunks, edge_chunks = [], []
+    if settings['vertices_path'] and settings['edges_path']:
         print("Loading graph from file")
-        vertices = pd.read_csv(vertices_path)
-        edges = pd.read_csv(edges_path)
+        vertex_chunks.append(read_vertex_chunks(settings['vertices_path'], AUDIO_FEATURES))
+        edge_chunks.append(read_edge_chunks(settings['edges_path']))
+    if writer is not None:
+        print("Loading graph written since the last run started")
+        segment_vertices, segment_edges = writer.read_chunks()
+        vertex_chunks.append(segment_vertices)
+        edge_chunks.append(segment_edges)
+    if not vertex_chunks:
+        return None
+    return graph_from_chunks(itertools.chain.from_iterable(vertex_chunks), itertools.chain.from_iterable(edge_chunks),
+                             settings['graph_backend'], settings['graph_path'])
+
+
+def build_network(settings: Dict[str, Any], vertices: pd.DataFrame = None, edges: pd.DataFrame = None,
+                  processes: int = 1, graph: Graph = None) -> Network:
+    # retries are left to the rate limiter, which needs to see every 429 and its Retry-After header
+    spotify = Spotify(auth_manager=SpotifyClientCredentials(), requests_session=spotify_session(), retries=0,
+                      status_retries=0)
+    spotify_rate = settings['spotify_rate'] / processes
+    limiter = RateLimiter(rate=spotify_rate, max_rate=spotify_rate * 2, classify=classify_spotify_error)
 
-        network = Network.from_dataframe(spotify=spotify, audio_features=audio_features,
-                                         max_tracks=50, vertices=vertices, edges=edges)
-        print(f"Loaded {len(network.graph.nodes)} nodes and {len(network.graph.edges)}")
+    cache = None
+    if settings['cache_path']:
+        cache = ResponseCache(settings['cache_path'])
+
+    if graph is None and vertices is not None:
+        graph = graph_from_dataframe(vertices, edges, settings['graph_backend'], settings['graph_path'])
+    if graph is None:
+        graph = create_graph(settings['graph_backend'], settings['graph_path'])
     else:
-        network = Network(spotify=spotify, audio_features=audio_features, max_tracks=50)
+        print(f"Loaded {len(graph.nodes)} nodes and {len(graph.edges)}")
+    network = Network(spotify=spotify, audio_features=AUDIO_FEATURES, max_tracks=50, graph=graph, cache=cache,
+                      limiter=limiter, page_workers=settings['page_workers'])
 
-    print("Adding new tracks and artists via seed playlists")
-    playlist_names = read_lines(playlists_path)
-    for name, playlist_id in playlist_names:
-        start_time = time.time()
-        playlist = network.get_playlist(playlist_id=playlist_id)
-        if not playlist:
+    if settings['seen_path']:
+        # artists seen in a loaded graph are recorded too, so later crawls can skip loading it
+        seen_store = SeenStore(settings['seen_path'])
+        seen_store.add(network.graph.iter_seen_artists())
+        network.graph.seen_store = seen_store
+        print(f"Seen store: {seen_store.stats()}")
+    return network
+
+
+def crawl_playlists(network: Network, playlist_names: List[Tuple[str, str]], workers: int,
+                    checkpoint: Checkpoint = None, state: Dict[str, Any] = None, metrics_path: str = None):
+    for index, (name, playlist_id) in enumerate(playlist_names):
+        if state and index < state['playlist']:
             continue
 
-        print(f"Exploring via playlist: {playlist.name} ({playlist.id})")
-        add_artists(network, playlist.get_artists(), 0, 2)
+        start_time = time.time()
+        if checkpoint:
+            checkpoint.start_playlist(index, name)
+        if state and index == state['playlist'] and state['frontier'] + state['next_frontier']:
+            print(f"Resuming playlist {name} at layer {state['depth']}")
+            crawl_layer(network, state['frontier'], state['next_frontier'], state['depth'], 2, workers, checkpoint)
+        else:
+            playlist = network.get_playlist(playlist_id=playlist_id)
+            if not playlist:
+                continue
+
+            print(f"Exploring via playlist: {playlist.name} ({playlist.id})")
+            add_artists(network, playlist.get_artists(), 0, 2, workers, checkpoint)
+
+        print_progress(network, checkpoint.finish_playlist(network.graph) if checkpoint else None, start_time)
+        if metrics_path:
+            metrics.write(metrics_path)
+
+
+def crawl_prioritized(network: Network, playlist_names: List[Tuple[str, str]], workers: int, frontier: Frontier,
+                      budget: Budget, checkpoint: Checkpoint = None, state: Dict[str, Any] = None,
+                      metrics_path: str = None):
+    # every seed playlist feeds one frontier, which is crawled best first until the budget runs out
+    if state and not state.get('schedule') and state['playlist'] > 0:
+        print("Priority crawl already finished")
+        return
+
+    start_time = time.time()
+    if checkpoint:
+        checkpoint.start_playlist(0, "priority crawl")
+    budget.start(network.requests)
+
+    if state and state.get('schedule'):
+        print(f"Resuming priority crawl with {len(state['schedule']['entries'])} artists in the frontier")
+        budget.spent_calls = state['schedule']['spent_calls']
+        budget.spent_seconds = state['schedule']['spent_seconds']
+        for artist, distance in state['schedule']['entries']:
+            frontier.push([artist], distance)
+    else:
+        for name, playlist_id in playlist_names:
+            playlist = network.get_playlist(playlist_id=playlist_id)
+            if playlist:
+                print(f"Seeding frontier via playlist: {playlist.name} ({playlist.id})")
+                frontier.push(playlist.get_artists(), 0)
+
+    crawl_frontier(network, frontier, budget, workers, checkpoint)
+    print(f"Spent {budget.calls(network.requests)} requests and {budget.seconds():.0f}s, "
+          f"{len(frontier.entries())} artists left in the frontier")
+
+    print_progress(network, checkpoint.finish_playlist(network.graph) if checkpoint else None, start_time)
+    if metrics_path:
+        metrics.write(metrics_path)
+
+
+def crawl_frontier(network: Network, frontier: Frontier, budget: Budget, workers: int = 1,
+                   checkpoint: Checkpoint = None):
+    # sequential crawls take one artist at a time, so every score sees the graph as of the previous artist
+    crawled = 0
+    while not budget.exhausted(network.requests):
+        batch = frontier.pop(max(workers, 1))
+        if not batch:
+            break
+
+        artists = [artist for artist, _ in batch]
+        for (seed_artist, distance), fetched in zip(batch, fetch_artists(network, artists, workers)):
+            frontier.push(put_artist(network, seed_artist, *fetched), distance + 1)
+
+        crawled += len(batch)
+        if checkpoint and crawled >= checkpoint.interval:
+            network.flush_audio_features()
+            checkpoint.save_schedule(network.graph, frontier.entries(), budget.calls(network.requests),
+                                     budget.seconds())
+            crawled = 0
+    network.flush_audio_features()
+
+
+def refresh_graph(network: Network, endpoints: List[str], max_age: float, score: Score, budget: Budget,
+                  workers: int = 1, writer: SnapshotWriter = None, interval: int = 50):
+    # stale artists are updated in place and flushed as they are done, so an interrupted refresh carries on
+    # where it stopped when run again
+    start_time = time.time()
+    now = time.time()
+    budget.start(network.requests)
+
+    if "artists" in endpoints:
+        stale = stale_artists(network.graph, ["artists"], max_age, score, now)
+        print(f"{len(stale)} artists with stale popularity and genres")
+        batch_size = ARTISTS_BATCH_SIZE * max(network.page_workers, 1)
+        pending = 0
+        for start in range(0, len(stale), batch_size):
+            if budget.exhausted(network.requests):
+                break
+            pending += network.refresh_artists(stale[start:start + batch_size])
+            if writer and pending >= interval * ARTISTS_BATCH_SIZE:
+                writer.flush(network.graph, "refresh")
+                pending = 0
+
+    per_artist = [endpoint for endpoint in endpoints if endpoint != "artists"]
+    if per_artist:
+        stale = stale_artists(network.graph, per_artist, max_age, score, now, crawled_artists(network.graph))
+        print(f"{len(stale)} crawled artists with stale {' or '.join(per_artist)}")
+        fetch = partial(fetch_stale, endpoints=per_artist, max_age=max_age, now=now)
+        pending = 0
+        for start in range(0, len(stale), max(workers, 1)):
+            if budget.exhausted(network.requests):
+                break
+            batch = stale[start:start + max(workers, 1)]
+            for artist, fetched in zip(batch, fetch_artists(network, batch, workers, fetch)):
+                put_refreshed(network, artist, *fetched)
+
+            pending += len(batch)
+            if writer and pending >= interval:
+                network.flush_audio_features()
+                writer.flush(network.graph, "refresh")
+                pending = 0
+    network.flush_audio_features()
+
+    print(f"Spent {budget.calls(network.requests)} requests and {budget.seconds():.0f}s")
+    print_progress(network, writer.flush(network.graph, "refresh") if writer else None, start_time)
+
 
-        print(f"Writing {len(network.graph.nodes)} nodes and {len(network.graph.edges())} edges to file")
-        vertices, edges = network.graph.to_dataframe()
-        vertices.to_csv(f"vertices_{name}.csv", index=False)
-        edges.to_csv(f"edges_{name}.csv", index=False)
-        print(f"Completed: {time.time() - start_time}")
+def crawled_artists(graph: Graph) -> Callable[[Artist], bool]:
+    # only crawled artists had their tracks and related artists fetched in the first place, and each was searched
+    # for; in graphs crawled before fetch times were recorded, every seen artist counts
+    searched = fetched_key("search")
+    if any(searched in artist.attr for artist in graph.get_node_attributes("artist").values()):
+        return lambda artist: searched in artist.attr
+    return lambda artist: graph.is_seen(artist.id)
 
 
-def add_artists(network: Network, seed_artists: List[Artist], curr_depth: int, max_depth: int):
+def fetch_stale(network: Network, artist: Artist, endpoints: List[str], max_age: float,
+                now: float) -> Tuple[List[Tuple[Track, List[Artist]]], Union[List[Artist], None]]:
+    # only the endpoints that are stale for this artist are fetched again
+    def is_stale(endpoint: str) -> bool:
+        return endpoint in endpoints and now - (artist.attr.get(fetched_key(endpoint)) or 0.0) > max_age
+
+    tracks = network.get_top_tracks(artist, True) if is_stale("artist_top_tracks") else []
+    related_artists = network.get_related_artists(artist) if is_stale("artist_related_artists") else None
+    return tracks, related_artists
+
+
+def put_refreshed(network: Network, artist: Artist, tracks: List[Tuple[Track, List[Artist]]],
+                  related_artists: Union[List[Artist], None]):
+    # new tracks and collaborators are added, but unlike a crawl nothing new is queued for crawling
+    for track, artists in tracks:
+        network.graph.put_track(track, artists)
+    network.queue_audio_features([track for track, _ in tracks])
+    if related_artists is not None:
+        network.graph.add_related(artist, related_artists)
+    keep_fetch_times(network, artist)
+
+
+def crawl_sharded(network: Network, playlist_names: List[Tuple[str, str]], settings: Dict[str, Any],
+                  processes: int):
+    # playlists are dealt out round-robin and the shard graphs merged back in shard order, so a given
+    # playlist list and process count always produce the same merge
+    shards = [playlist_names[shard::processes] for shard in range(processes)]
+    print(f"Adding new tracks and artists via {len(playlist_names)} seed playlists across {processes} processes")
+
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.starmap(crawl_shard, [(settings, shard, processes) for shard in shards])
+
+    for vertices, edges, artist_edges, shard_metrics in results:
+        merge_shard(network.graph, vertices, edges, artist_edges)
+        metrics.merge(shard_metrics)
+
+
+def merge_shard(graph: Graph, vertices: pd.DataFrame, edges: pd.DataFrame, artist_edges: pd.DataFrame):
+    if len(vertices) <= 0:
+        return
+    shard_graph = graph_from_dataframe(vertices, edges)
+    shard_graph.artist_graph.load(artist_edges)
+    graph.merge(shard_graph)
+
+
+def crawl_shard(settings: Dict[str, Any], playlist_names: List[Tuple[str, str]],
+                processes: int) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, Dict[str, Any]]:
+    # forked workers start with a copy of the parent's metrics, which the parent already counts
+    metrics.reset()
+    network = build_network(settings, *load_graph(settings), processes=processes)
+    crawl_playlists(network, playlist_names, settings['workers'])
+
+    # the store stays with this process; the parent records the merged graph's seen artists in its own
+    if network.graph.seen_store is not None:
+        network.graph.seen_store.close()
+        network.graph.seen_store = None
+
+    # the parent already has the loaded graph, so only what this shard added or changed is sent back, with each
+    # changed artist's seen flag
+    artist_edges = network.graph.artist_graph.pop_changes()
+    vertices, edges = network.graph.pop_changes()
+    network.close()
+    return vertices, edges, artist_edges, metrics.state()
+
+
+def print_progress(network: Network, segment: Union[Dict[str, Any], None], start_time: float):
+    if segment:
+        print(f"Wrote {segment['vertex_count']} new or updated nodes and {segment['edge_count']} new edges "
+              f"to {segment['vertices']} and {segment['edges']}")
+    print(f"Graph has {len(network.graph.nodes)} nodes and {len(network.graph.edges())} edges")
+    if network.cache:
+        print(f"Response cache: {network.cache.stats()}")
+    if network.limiter:
+        print(f"Rate limiter: {network.limiter.stats()}")
+    if network.graph.seen_store is not None:
+        print(f"Seen store: {network.graph.seen_store.stats()}")
+    print(f"Completed: {time.time() - start_time}")
+
+
+def merge_snapshot(vertices: pd.DataFrame, edges: pd.DataFrame, snapshot_vertices: pd.DataFrame,
+                   snapshot_edges: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    if vertices is None:
+        return snapshot_vertices, snapshot_edges
+
+    vertices = pd.concat([vertices, snapshot_vertices], ignore_index=True)
+    edges = pd.concat([edges, snapshot_edges], ignore_index=True)
+    return vertices.drop_duplicates(subset='id', keep='last'), edges.drop_duplicates()
+
+
+def add_artists(network: Network, seed_artists: List[Artist], curr_depth: int, max_depth: int, workers: int = 1,
+                checkpoint: Checkpoint = None):
     if curr_depth == max_depth or len(seed_artists) <= 0:
         return
 
     unseen_seed_artists = network.graph.get_unseen_artists(seed_artists)
     print(f"{len(unseen_seed_artists)} unseen artists in layer {curr_depth} of network")
 
-    next_seed_artists = []
-    for seed_artist in unseen_seed_artists:
-        next_seed_artists += add_artist(network, seed_artist)
+    crawl_layer(network, unseen_seed_artists, [], curr_depth, max_depth, workers, checkpoint)
+
+
+def crawl_layer(network: Network, frontier: List[Artist], next_seed_artists: List[Artist], curr_depth: int,
+                max_depth: int, workers: int = 1, checkpoint: Checkpoint = None):
+    interval = checkpoint.interval if checkpoint else max(len(frontier), 1)
+    for start in range(0, len(frontier), interval):
+        batch = frontier[start:start + interval]
+        for seed_artist, fetched in zip(batch, fetch_artists(network, batch, workers)):
+            next_seed_artists += put_artist(network, seed_artist, *fetched)
+
+        if checkpoint:
+            network.flush_audio_features()
+            checkpoint.save(network.graph, curr_depth, frontier[start + interval:], next_seed_artists)
+    network.flush_audio_features()
+
+    add_artists(network, next_seed_artists, curr_depth+1, max_depth, workers, checkpoint)
+
 
-    add_artists(network, next_seed_artists, curr_depth+1, max_depth)
+def fetch_artists(network: Network, seed_artists: List[Artist], workers: int,
+                  fetch: Callable[[Network, Artist], tuple] = None) -> Iterable[tuple]:
+    # sequential crawls interleave fetching and putting one artist at a time; concurrent crawls fetch the
+    # whole layer up front, and only the calling thread ever modifies the graph
+    fetch = fetch or fetch_artist
+    if workers <= 1:
+        return map(lambda seed_artist: fetch(network, seed_artist), seed_artists)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda seed_artist: fetch(network, seed_artist), seed_artists))
 
 
 def add_artist(network: Network, seed_artist: Artist):
-    found_tracks = network.search_tracks(seed_artist.name)
+    unseen_associated_artists = put_artist(network, seed_artist, *fetch_artist(network, seed_artist))
+    network.flush_audio_features()
+    return unseen_associated_artists
+
+
+def fetch_artist(network: Network, seed_artist: Artist) -> Tuple[List[Tuple[Track, List[Artist]]], List[Artist]]:
+    found_tracks = network.search_tracks(seed_artist.name, artist=seed_artist)
     top_tracks = network.get_top_tracks(seed_artist, True)
-    network.put_audio_features([tup[0] for tup in found_tracks + top_tracks])
 
     related_artists = network.get_related_artists(seed_artist)
+    return found_tracks + top_tracks, related_artists
+
+
+def put_artist(network: Network, seed_artist: Artist, tracks: List[Tuple[Track, List[Artist]]],
+               related_artists: List[Artist]):
+    # artists fetched concurrently may have been seen by the time they are put
+    for artist in related_artists + [artist for _, artists in tracks for artist in artists]:
+        if network.graph.is_seen(artist.id):
+            artist.attr['seen'] = True
+
     collaborators = {}
-    for track, artists in found_tracks + top_tracks:
+    for track, artists in tracks:
         network.graph.put_track(track, artists)
         for artist in artists:
             collaborators[artist.name] = artist
 
+    network.graph.add_related(seed_artist, related_artists)
+    keep_fetch_times(network, seed_artist)
+    network.queue_audio_features([track for track, _ in tracks])
+
     unseen_associated_artists = network.graph.get_unseen_artists(related_artists + list(collaborators.values()))
     print(
-        f"Tracks: {len(found_tracks + top_tracks)}\t",
+        f"Tracks: {len(tracks)}\t",
         f"Associated artists: {len(unseen_associated_artists)}\t",
         f"Artist: {seed_artist.name}"
     )
@@ -86,6 +509,24 @@ def add_artist(network: Network, seed_artist: Artist):
     return unseen_associated_artists
 
 
+def keep_fetch_times(network: Network, artist: Artist):
+    # fetch times are recorded on the artist that was fetched, which need not be the object the graph holds
+    node = network.graph.get_artist(artist.id)
+    if node is None:
+        return
+    if node is not artist:
+        node.attr = {**node.attr, **{k: v for k, v in artist.attr.items() if k.startswith("fetched_")}}
+    network.graph.touch(artist.id, node)
+
+
+def optional_int(value: Union[str, None]) -> Union[int, None]:
+    return int(value) if value else None
+
+
+def optional_float(value: Union[str, None]) -> Union[float, None]:
+    return float(value) if value else None
+
+
 def read_lines(path: str) -> List[Tuple[str, str]]:
     with open(path) as f:
         lines = f.readlines()
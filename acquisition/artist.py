@@ -1,18 +1,40 @@
-from typing import Any, Dict
+import sys
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Tuple
+
+# how many distinct sets of genres are kept interned at once
+GENRE_CACHE_SIZE = 1 << 16
 
 
 class Artist:
+	__slots__ = ('id', 'name', 'attr')
+	node_type = 'artist'
+
 	def __init__(self, artist_id: str, name: str, attr: Dict[str, Any] = None):
 		self.attr = {}
 		if attr:
-			self.attr = attr
+			self.attr = dict(attr)
+			if isinstance(attr.get('genres'), (list, tuple)):
+				self.attr['genres'] = intern_genres(attr['genres'])
 
 		self.id = artist_id
 		self.name = name
-		self.node_type = 'artist'
+
+	def to_dict(self) -> Dict[str, Any]:
+		return {'attr': self.attr, 'id': self.id, 'name': self.name, 'node_type': self.node_type}
 
 	def __eq__(self, other):
 		return self.id == other.id and self.name == other.name
 
 	def __hash__(self):
 		return hash(('id', self.id, 'name', self.name))
+
+
+def intern_genres(genres: Iterable[str]) -> Tuple[str, ...]:
+	# artists with the same genres share one tuple of interned strings, which can't be changed under them
+	return interned_genres(tuple(genres))
+
+
+@lru_cache(maxsize=GENRE_CACHE_SIZE)
+def interned_genres(genres: Tuple[str, ...]) -> Tuple[str, ...]:
+	return tuple(sys.intern(genre) if isinstance(genre, str) else genre for genre in genres)
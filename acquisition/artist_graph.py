@@ -0,0 +1,110 @@
+from typing import Dict, Iterable, List, Tuple
+
+import pandas as pd
+
+COLUMNS = ['source', 'target', 'collaborations', 'related']
+
+
+class ArtistGraph:
+	# undirected, weighted artist-artist adjacency kept up to date as tracks and related artists are added: each
+	# pair of artists maps to how many tracks they share, and whether Spotify lists either as related to the other
+	def __init__(self):
+		self.adjacency: Dict[str, Dict[str, List]] = {}
+		# pairs added or updated since the last call to pop_changes
+		self.changed_pairs = {}
+
+	def __contains__(self, artist_id: str) -> bool:
+		return artist_id in self.adjacency
+
+	def __len__(self) -> int:
+		return len(self.adjacency)
+
+	def pair(self, a: str, b: str) -> List:
+		edge = self.adjacency.setdefault(a, {}).get(b)
+		if edge is None:
+			# both directions share one [collaborations, related] list
+			edge = self.adjacency[a][b] = [0, False]
+			self.adjacency.setdefault(b, {})[a] = edge
+		self.changed_pairs[(a, b) if a < b else (b, a)] = None
+		return edge
+
+	def add_collaboration(self, artist_ids: Iterable[str], count: int = 1):
+		artist_ids = list(dict.fromkeys(artist_ids))
+		for i, a in enumerate(artist_ids):
+			for b in artist_ids[i + 1:]:
+				self.pair(a, b)[0] += count
+
+	def add_related(self, artist_id: str, related_ids: Iterable[str]):
+		for related_id in related_ids:
+			if related_id != artist_id:
+				self.pair(artist_id, related_id)[1] = True
+
+	def degree(self, artist_id: str) -> int:
+		return len(self.adjacency.get(artist_id, ()))
+
+	def collaborations(self, artist_id: str) -> int:
+		return sum(edge[0] for edge in self.adjacency.get(artist_id, {}).values())
+
+	def neighbours(self, artist_id: str) -> Dict[str, Tuple[int, bool]]:
+		return {neighbour: tuple(edge) for neighbour, edge in self.adjacency.get(artist_id, {}).items()}
+
+	def collaborators(self, artist_id: str) -> Dict[str, int]:
+		return {neighbour: edge[0] for neighbour, edge in self.adjacency.get(artist_id, {}).items() if edge[0]}
+
+	def related(self, artist_id: str) -> List[str]:
+		return [neighbour for neighbour, edge in self.adjacency.get(artist_id, {}).items() if edge[1]]
+
+	def merge(self, other: 'ArtistGraph'):
+		# collaborations are counted from tracks by Graph.merge, which knows which tracks are new
+		for a, neighbours in other.adjacency.items():
+			for b, edge in neighbours.items():
+				if a < b and edge[1]:
+					self.pair(a, b)[1] = True
+
+	def load(self, edges: pd.DataFrame):
+		# replaces the pairs in an exported table with its values
+		for a, b, collaborations, related in zip(*(edges[column].tolist() for column in COLUMNS)):
+			edge = self.pair(str(a), str(b))
+			edge[0] = int(collaborations)
+			edge[1] = bool(related)
+
+	def edge_rows(self, pairs: Iterable[Tuple[str, str]]) -> pd.DataFrame:
+		rows = [(a, b, *self.adjacency[a][b]) for a, b in pairs]
+		return pd.DataFrame(rows, columns=COLUMNS)
+
+	def to_dataframe(self) -> pd.DataFrame:
+		# one row per pair, with the smaller ID as the source
+		return self.edge_rows(
+			(a, b) for a, neighbours in self.adjacency.items() for b in neighbours if a < b
+		)
+
+	def clear_changes(self):
+		self.changed_pairs = {}
+
+	def pop_changes(self) -> pd.DataFrame:
+		edges = self.edge_rows(self.changed_pairs)
+		self.clear_changes()
+		return edges
+
+
+def from_track_edges(edges: pd.DataFrame) -> ArtistGraph:
+	# rebuilds the collaboration counts of a loaded graph from its track -> artist edges
+	artist_graph = ArtistGraph()
+	if len(edges) <= 0:
+		return artist_graph
+
+	# only tracks with more than one artist make pairs
+	shared = edges[edges['source'].duplicated(keep=False)]
+	for artist_ids in shared.groupby('source', sort=False)['target'].agg(list):
+		artist_graph.add_collaboration(str(artist_id) for artist_id in artist_ids)
+	artist_graph.clear_changes()
+	return artist_graph
+
+
+def from_successor_lists(successor_lists: Iterable[List[str]]) -> ArtistGraph:
+	# the same counts, from the artists of each track of a graph too large to export its edges at once
+	artist_graph = ArtistGraph()
+	for artist_ids in successor_lists:
+		artist_graph.add_collaboration(artist_ids)
+	artist_graph.clear_changes()
+	return artist_graph
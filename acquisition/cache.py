@@ -0,0 +1,127 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Tuple, Union
+
+DAY = 24 * 60 * 60
+
+# how long a cached response stays valid, in seconds, by spotipy method name
+DEFAULT_TTLS = {
+	'search': 3 * DAY,
+	'artist_top_tracks': 7 * DAY,
+	'artist_related_artists': 7 * DAY,
+	'artists': 7 * DAY,
+	'audio_features': 90 * DAY,
+	'playlist': DAY,
+	'playlist_tracks': DAY,
+}
+
+
+class ResponseCache:
+	def __init__(self, path: str, ttls: Dict[str, float] = None, default_ttl: float = DAY, max_size: int = 1 << 30):
+		self.ttls = dict(DEFAULT_TTLS)
+		if ttls:
+			self.ttls.update(ttls)
+		self.default_ttl = default_ttl
+		self.max_size = max_size
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+		# spotify calls may be made from the crawler's worker threads
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, check_same_thread=False)
+		# shard processes share one cache file, and wait for each other's writes
+		self.connection.execute("PRAGMA busy_timeout=30000")
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("PRAGMA synchronous=NORMAL")
+		self.connection.execute("""
+			CREATE TABLE IF NOT EXISTS responses (
+				endpoint TEXT NOT NULL,
+				params TEXT NOT NULL,
+				response TEXT NOT NULL,
+				size INTEGER NOT NULL,
+				created REAL NOT NULL,
+				accessed REAL NOT NULL,
+				PRIMARY KEY (endpoint, params)
+			)
+		""")
+		self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+		self.connection.commit()
+		self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+	def cap_ttls(self, max_age: float):
+		# responses older than max_age are fetched again, however long their endpoint's TTL
+		self.ttls = {endpoint: min(ttl, max_age) for endpoint, ttl in self.ttls.items()}
+		self.default_ttl = min(self.default_ttl, max_age)
+
+	@staticmethod
+	def key(args: Tuple, kwargs: Dict[str, Any]) -> str:
+		return json.dumps([list(args), kwargs], sort_keys=True, default=list)
+
+	def get(self, endpoint: str, params: str) -> Tuple[bool, Any, Union[float, None]]:
+		# a hit also hands back when its response was fetched from spotify
+		now = time.time()
+		with self.lock:
+			row = self.connection.execute(
+				"SELECT response, created FROM responses WHERE endpoint = ? AND params = ?", (endpoint, params)
+			).fetchone()
+
+			if not row or now - row[1] > self.ttls.get(endpoint, self.default_ttl):
+				self.misses += 1
+				return False, None, None
+
+			self.connection.execute(
+				"UPDATE responses SET accessed = ? WHERE endpoint = ? AND params = ?", (now, endpoint, params)
+			)
+			self.connection.commit()
+			self.hits += 1
+		return True, json.loads(row[0]), row[1]
+
+	def put(self, endpoint: str, params: str, response: Any, fetched: float = None):
+		now = time.time()
+		fetched = now if fetched is None else fetched
+		text = json.dumps(response)
+		with self.lock:
+			previous = self.connection.execute(
+				"SELECT size FROM responses WHERE endpoint = ? AND params = ?", (endpoint, params)
+			).fetchone()
+			if previous:
+				self.size -= previous[0]
+
+			self.connection.execute(
+				"INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+				(endpoint, params, text, len(text), fetched, now)
+			)
+			self.size += len(text)
+			if self.size > self.max_size:
+				self.evict()
+			self.connection.commit()
+
+	def evict(self):
+		# least recently used responses go first, until the cache is back under its size limit
+		while self.size > self.max_size:
+			rows = self.connection.execute(
+				"SELECT endpoint, params, size FROM responses ORDER BY accessed LIMIT 100"
+			).fetchall()
+			if not rows:
+				self.size = 0
+				return
+
+			for endpoint, params, size in rows:
+				if self.size <= self.max_size:
+					break
+				self.connection.execute(
+					"DELETE FROM responses WHERE endpoint = ? AND params = ?", (endpoint, params)
+				)
+				self.size -= size
+				self.evictions += 1
+
+	def stats(self) -> Dict[str, int]:
+		return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': self.size}
+
+	def close(self):
+		with self.lock:
+			self.connection.close()
@@ -0,0 +1,74 @@
+from typing import Any, Dict, List, Tuple, Union
+
+from .artist import Artist
+from .graph import Graph
+from .snapshot import SnapshotWriter
+
+
+class Checkpoint:
+	def __init__(self, writer: SnapshotWriter, interval: int):
+		self.writer = writer
+		self.interval = max(interval, 1)
+		self.playlist = 0
+		self.name = None
+
+	def start_playlist(self, index: int, name: str):
+		self.playlist = index
+		self.name = name
+
+	def save(self, graph: Graph, depth: int, frontier: List[Artist], next_frontier: List[Artist]):
+		self.writer.flush(graph, f"{self.name} (checkpoint)", {
+			'playlist': self.playlist,
+			'name': self.name,
+			'depth': depth,
+			'frontier': [artist_to_dict(artist) for artist in frontier],
+			'next_frontier': [artist_to_dict(artist) for artist in next_frontier]
+		})
+
+	def save_schedule(self, graph: Graph, entries: List[Tuple[Artist, int]], spent_calls: int, spent_seconds: float):
+		self.writer.flush(graph, f"{self.name} (checkpoint)", {
+			'playlist': self.playlist,
+			'name': self.name,
+			'depth': 0,
+			'frontier': [],
+			'next_frontier': [],
+			'schedule': {
+				'entries': [{**artist_to_dict(artist), 'distance': distance} for artist, distance in entries],
+				'spent_calls': spent_calls,
+				'spent_seconds': spent_seconds
+			}
+		})
+
+	def finish_playlist(self, graph: Graph) -> Union[Dict[str, Any], None]:
+		return self.writer.flush(graph, self.name, {
+			'playlist': self.playlist + 1,
+			'name': None,
+			'depth': 0,
+			'frontier': [],
+			'next_frontier': []
+		})
+
+	def load(self) -> Union[Dict[str, Any], None]:
+		state = self.writer.manifest.get('checkpoint')
+		if not state:
+			return None
+
+		state = {
+			**state,
+			'frontier': [artist_from_dict(artist) for artist in state['frontier']],
+			'next_frontier': [artist_from_dict(artist) for artist in state['next_frontier']]
+		}
+		if state.get('schedule'):
+			state['schedule'] = {
+				**state['schedule'],
+				'entries': [(artist_from_dict(entry), entry['distance']) for entry in state['schedule']['entries']]
+			}
+		return state
+
+
+def artist_to_dict(artist: Artist) -> Dict[str, Any]:
+	return {'id': artist.id, 'name': artist.name, 'attr': artist.attr}
+
+
+def artist_from_dict(artist: Dict[str, Any]) -> Artist:
+	return Artist(artist_id=artist['id'], name=artist['name'], attr=artist['attr'])
@@ -0,0 +1,153 @@
+import ast
+import json
+import os
+import struct
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .storage import read_vertices
+from .track import AUDIO_FEATURES
+
+MAGIC = b'\x93NUMPY\x01\x00'
+# a fixed-size .npy header, so the row count can be rewritten in place as rows are appended
+HEADER_SIZE = 128
+DTYPE = np.dtype('<f4')
+
+
+def main():
+	vertices_path = os.environ["VERTICES_PATH"]
+	directory = os.environ.get("FEATURES_PATH") or os.path.dirname(vertices_path)
+	matrix = FeatureMatrix(directory, AUDIO_FEATURES)
+	appended = matrix.update(read_vertices(vertices_path, AUDIO_FEATURES))
+	print(f"Appended {appended} tracks to {matrix.path}, which now holds {len(matrix)}")
+
+
+class FeatureMatrix:
+	# audio features of every track with any, as a float32 matrix in a .npy file that downstream jobs can
+	# np.load(mmap_mode='r'); row i belongs to the track ID on line i of the .ids file, and rows are only ever
+	# appended or overwritten, never moved
+	def __init__(self, directory: str, audio_features: List[str], name: str = 'features'):
+		self.audio_features = list(audio_features)
+		self.path = os.path.join(directory, f"{name}.npy")
+		self.ids_path = os.path.join(directory, f"{name}.ids")
+		self.columns_path = os.path.join(directory, f"{name}.json")
+		os.makedirs(directory, exist_ok=True)
+
+		if os.path.exists(self.columns_path):
+			with open(self.columns_path) as f:
+				columns = json.load(f)['columns']
+			if columns != self.audio_features:
+				raise ValueError(f"{self.path} holds features {columns}, not {self.audio_features}")
+		else:
+			with open(self.columns_path, "w") as f:
+				json.dump({'columns': self.audio_features}, f)
+
+		if not os.path.exists(self.path):
+			with open(self.path, "wb") as f:
+				f.write(self.header(0))
+		self.rows = self.read_rows()
+
+		# anything past the recorded row count was written by an append that never finished
+		with open(self.path, "r+b") as f:
+			f.truncate(HEADER_SIZE + self.rows * self.row_size)
+		self.ids = self.read_ids()
+		if len(self.ids) < self.rows:
+			raise ValueError(f"{self.ids_path} lists {len(self.ids)} track IDs for {self.rows} rows of {self.path}")
+		if len(self.ids) > self.rows:
+			self.ids = self.ids[:self.rows]
+			with open(self.ids_path, "w") as f:
+				f.writelines(f"{track_id}\n" for track_id in self.ids)
+		self.index = {track_id: row for row, track_id in enumerate(self.ids)}
+
+	@property
+	def row_size(self) -> int:
+		return DTYPE.itemsize * len(self.audio_features)
+
+	def header(self, rows: int) -> bytes:
+		header = repr({'descr': DTYPE.str, 'fortran_order': False, 'shape': (rows, len(self.audio_features))})
+		header = header.encode().ljust(HEADER_SIZE - len(MAGIC) - 2 - 1) + b'\n'
+		return MAGIC + struct.pack('<H', len(header)) + header
+
+	def read_rows(self) -> int:
+		with open(self.path, "rb") as f:
+			prefix = f.read(HEADER_SIZE)
+		if not prefix.startswith(MAGIC):
+			raise ValueError(f"{self.path} is not a feature matrix")
+		header_size = struct.unpack('<H', prefix[len(MAGIC):len(MAGIC) + 2])[0]
+		return ast.literal_eval(prefix[len(MAGIC) + 2:len(MAGIC) + 2 + header_size].decode())['shape'][0]
+
+	def read_ids(self) -> List[str]:
+		if not os.path.exists(self.ids_path):
+			return []
+		with open(self.ids_path) as f:
+			return f.read().splitlines()
+
+	def __len__(self) -> int:
+		return self.rows
+
+	def update(self, vertices: pd.DataFrame) -> int:
+		columns = [f"attr.{name}" for name in self.audio_features]
+		if 'node_type' not in vertices.columns or not any(column in vertices.columns for column in columns):
+			return 0
+
+		tracks = vertices[vertices['node_type'] == 'track'].reindex(columns=['id'] + columns)
+		values = tracks[columns].to_numpy(dtype=DTYPE, na_value=np.nan)
+		present = ~np.isnan(values).all(axis=1)
+		ids = tracks['id'].astype(str).to_numpy()[present]
+		values = values[present]
+
+		rows = np.array([self.index.get(track_id, -1) for track_id in ids], dtype=np.int64)
+		known = rows >= 0
+		if known.any():
+			matrix = np.load(self.path, mmap_mode='r+')
+			matrix[rows[known]] = values[known]
+			matrix.flush()
+			del matrix
+
+		_, first = np.unique(ids[~known], return_index=True)
+		order = np.sort(first)
+		self.append(list(ids[~known][order]), values[~known][order])
+		return len(order)
+
+	def append(self, ids: List[str], values: np.ndarray):
+		if not ids:
+			return
+
+		# rows and IDs go first; the header's row count is what makes them part of the matrix
+		with open(self.path, "r+b") as f:
+			f.seek(HEADER_SIZE + self.rows * self.row_size)
+			f.write(np.ascontiguousarray(values, dtype=DTYPE).tobytes())
+			f.flush()
+			os.fsync(f.fileno())
+		with open(self.ids_path, "a") as f:
+			f.writelines(f"{track_id}\n" for track_id in ids)
+			f.flush()
+			os.fsync(f.fileno())
+		with open(self.path, "r+b") as f:
+			f.write(self.header(self.rows + len(ids)))
+			f.flush()
+			os.fsync(f.fileno())
+
+		for track_id in ids:
+			self.index[track_id] = len(self.ids)
+			self.ids.append(track_id)
+		self.rows += len(ids)
+
+
+def load_features(directory: str, name: str = 'features') -> Tuple[np.ndarray, pd.Index]:
+	# a read-only memory map of the matrix, and the track IDs of its rows
+	path = os.path.join(directory, f"{name}.npy")
+	matrix = np.load(path, mmap_mode='r') if os.path.getsize(path) > HEADER_SIZE else np.load(path)
+	ids_path = os.path.join(directory, f"{name}.ids")
+	with open(ids_path) as f:
+		ids = f.read().splitlines()
+	# IDs past the matrix's rows belong to an append that never finished; too few would mislabel the rows
+	if len(ids) < len(matrix):
+		raise ValueError(f"{ids_path} lists {len(ids)} track IDs for {len(matrix)} rows of {path}")
+	return matrix, pd.Index(ids[:len(matrix)])
+
+
+if __name__ == '__main__':
+	main()
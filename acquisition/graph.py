@@ -1,9 +1,15 @@
-from typing import Dict, Any, List
+import itertools
+from array import array
+from typing import Dict, Any, Iterable, Iterator, List, Tuple, Union
 
 import networkx as nx
+import numpy as np
 import pandas as pd
 
 from acquisition.artist import Artist
+from acquisition.artist_graph import ArtistGraph
+from acquisition.metrics import timed
+from acquisition.seen import SeenStore
 from acquisition.track import Track
 
 
@@ -14,39 +20,440 @@ class Graph:
 			self.nx_graph = nx_graph
 		self.nodes = self.nx_graph.nodes
 		self.edges = self.nx_graph.edges
+		self.seen_artists = set(nx.get_node_attributes(self.nx_graph, 'seen'))
+		# artists seen by earlier crawls, which need not be in this graph
+		self.seen_store: Union[SeenStore, None] = None
+		# artist-artist collaborations and related links, projected as tracks and related artists come in
+		self.artist_graph = ArtistGraph()
+
+		# nodes and edges added or updated since the last call to pop_changes
+		self.changed_nodes = {}
+		self.new_edges = []
 
 	def add_artist(self, artist: Artist, **attr):
 		self.nx_graph.add_node(artist.id, artist=artist, **attr)
+		self.changed_nodes[artist.id] = None
+		if 'seen' not in attr:
+			return
+		if attr['seen']:
+			self.seen_artists.add(artist.id)
+			if self.seen_store is not None:
+				self.seen_store.add([artist.id])
+		else:
+			self.seen_artists.discard(artist.id)
+
+	def add_artists(self, artists: List[Artist], seen: List[bool]):
+		self.nx_graph.add_nodes_from(
+			(artist.id, {'artist': artist, 'seen': True} if is_seen else {'artist': artist})
+			for artist, is_seen in zip(artists, seen)
+		)
+		self.changed_nodes.update(dict.fromkeys(artist.id for artist in artists))
+		seen_ids = [artist.id for artist, is_seen in zip(artists, seen) if is_seen]
+		self.seen_artists.update(seen_ids)
+		if self.seen_store is not None:
+			self.seen_store.add(seen_ids)
 
 	def add_track(self, track: Track, **attr):
 		self.nx_graph.add_node(track.id, track=track, **attr)
+		self.changed_nodes[track.id] = None
+
+	def add_tracks(self, tracks: List[Track]):
+		self.nx_graph.add_nodes_from((track.id, {'track': track}) for track in tracks)
+		self.changed_nodes.update(dict.fromkeys(track.id for track in tracks))
 
 	def add_edge(self, a, b, **attr):
+		if not self.nx_graph.has_edge(a, b):
+			self.new_edges.append((a, b))
 		self.nx_graph.add_edge(a, b, **attr)
 
+	def add_edges(self, edges: Iterable[Tuple[str, str]]):
+		edges = [edge for edge in dict.fromkeys(edges) if not self.nx_graph.has_edge(*edge)]
+		self.new_edges += edges
+		self.nx_graph.add_edges_from(edges)
+
+	def touch(self, node_id: str, node: Union[Artist, Track] = None):
+		# callers that changed a node pass it along, for backends that don't keep every node in memory
+		if node_id in self.nodes:
+			self.changed_nodes[node_id] = None
+
+	def clear_changes(self):
+		self.changed_nodes = {}
+		self.new_edges = []
+		self.artist_graph.clear_changes()
+
+	def pop_changes(self) -> (pd.DataFrame, pd.DataFrame):
+		nodes = [self.nodes[node_id] for node_id in self.changed_nodes]
+		tracks = [node['track'].to_dict() for node in nodes if 'track' in node]
+		artists = [
+			{**node['artist'].to_dict(), 'seen': bool(node.get('seen'))}
+			for node in nodes if 'artist' in node
+		]
+		vertices = pd.json_normalize(tracks + artists)
+		edges = pd.DataFrame(self.new_edges, columns=['source', 'target'])
+
+		self.clear_changes()
+		return vertices, edges
+
+	def get_track(self, track_id: str) -> Track:
+		if track_id not in self.nodes:
+			return None
+		return self.nodes[track_id].get('track')
+
+	def get_artist(self, artist_id: str) -> Artist:
+		if artist_id not in self.nodes:
+			return None
+		return self.nodes[artist_id].get('artist')
+
 	def get_node_attributes(self, attr_name: str) -> Dict[str, Any]:
 		return nx.get_node_attributes(self.nx_graph, attr_name)
 
 	def to_dataframe(self) -> (pd.DataFrame, pd.DataFrame):
-		tracks = [track.__dict__ for track in self.get_node_attributes('track').values()]
-		artists = [artist.__dict__ for artist in self.get_node_attributes('artist').values()]
+		tracks = [track.to_dict() for track in self.get_node_attributes('track').values()]
+		artists = [artist.to_dict() for artist in self.get_node_attributes('artist').values()]
 		vertices = pd.json_normalize(tracks + artists)
 		edges = nx.to_pandas_edgelist(self.nx_graph)
 		return vertices, edges
 
+	def is_seen(self, artist_id: str) -> bool:
+		if artist_id in self.seen_artists:
+			return True
+		return self.seen_store is not None and artist_id in self.seen_store
+
+	def iter_seen_artists(self) -> Iterator[str]:
+		return iter(list(self.seen_artists))
+
+	def in_degree(self, node_id: str) -> int:
+		if node_id not in self.nodes:
+			return 0
+		return self.nx_graph.in_degree(node_id)
+
+	def successors(self, node_id: str) -> List[str]:
+		if node_id not in self.nodes:
+			return []
+		return list(self.nx_graph.successors(node_id))
+
+	def successor_lists(self) -> Iterator[List[str]]:
+		# the successors of every node that has more than one, which for a track are the artists sharing it
+		for node_id in self.nodes:
+			successors = self.successors(node_id)
+			if len(successors) > 1:
+				yield successors
+
+	def nodes_since(self, position: int) -> Tuple[List[str], int]:
+		# nodes are never removed, so the ones added since a call returned position come after it in insertion order
+		node_ids = list(itertools.islice(self.nx_graph, position, None))
+		return node_ids, position + len(node_ids)
+
+	@timed('graph_operation_seconds', operation='get_unseen_artists')
 	def get_unseen_artists(self, artists: List[Artist]) -> List[Artist]:
 		unique_artists = list(set(artists))
-		seen_artists = self.get_node_attributes('seen')
-		return [artist for artist in unique_artists if artist.id not in seen_artists]
+		return [artist for artist in unique_artists if not self.is_seen(artist.id)]
+
+	def merge(self, other: 'Graph'):
+		# collaborations are only counted for tracks this graph didn't have yet
+		new_tracks = []
+		for node_id, data in other.nodes(data=True):
+			if 'track' in data:
+				if self.get_track(node_id) is None:
+					new_tracks.append(node_id)
+				self.merge_node(node_id, 'track', data['track'], False)
+			elif 'artist' in data:
+				self.merge_node(node_id, 'artist', data['artist'], bool(data.get('seen')))
+		self.add_edges(other.edges)
+
+		for track_id in new_tracks:
+			self.artist_graph.add_collaboration(self.successors(track_id))
+		self.artist_graph.merge(other.artist_graph)
+
+	def add_related(self, artist: Artist, related_artists: List[Artist]):
+		self.artist_graph.add_related(artist.id, [related.id for related in related_artists])
+
+	def merge_node(self, node_id: str, node_type: str, node: Union[Artist, Track], seen: bool):
+		if node_id not in self.nodes or node_type not in self.nodes[node_id]:
+			if node_type == 'track':
+				self.add_track(node)
+			elif seen:
+				self.add_artist(node, seen=True)
+			else:
+				self.add_artist(node)
+			return
 
+		existing = self.nodes[node_id][node_type]
+		attr = {**existing.attr, **{k: v for k, v in node.attr.items() if v is not None}}
+		changed = attr != existing.attr
+		existing.attr = attr
+
+		if seen and not self.is_seen(node_id):
+			self.add_artist(existing, seen=True)
+		elif changed:
+			self.touch(node_id, existing)
+
+	def close(self):
+		# in-memory graphs hold nothing to release
+		pass
+
+	@timed('graph_operation_seconds', operation='put_track')
 	def put_track(self, track: Track, artists: List[Artist]):
 		if track.id in self.nodes:
 			return
 
 		self.add_track(track)
 		for artist in artists:
+			keep_attrs(self.get_artist(artist.id), artist)
 			if artist.attr.get('seen') or artist.id in self.nx_graph.nodes:
 				self.add_artist(artist, seen=True)
 			else:
 				self.add_artist(artist)
 			self.add_edge(track.id, artist.id)
+		self.artist_graph.add_collaboration(artist.id for artist in artists)
+
+
+class ArrayGraph(Graph):
+	# same interface as Graph, but nodes are numbered densely in insertion order and edges kept in flat int
+	# arrays, with each node's out-edges chained through next_edge, instead of networkx's nested dicts
+	def __init__(self):
+		self.index = {}
+		self.ids = []
+		self.objects = []
+		self.seen = bytearray()
+
+		self.sources = array('i')
+		self.targets = array('i')
+		self.next_edge = array('i')
+		self.first_edge = array('i')
+		self.in_degrees = array('i')
+
+		self.nodes = ArrayNodeView(self)
+		self.edges = ArrayEdgeView(self)
+		self.seen_store = None
+		self.artist_graph = ArtistGraph()
+
+		self.changed_nodes = {}
+		self.new_edges = []
+
+	@property
+	def seen_artists(self):
+		return {self.ids[i] for i, is_seen in enumerate(self.seen) if is_seen}
+
+	def node_index(self, node_id: str) -> int:
+		i = self.index.get(node_id)
+		if i is None:
+			i = len(self.ids)
+			self.index[node_id] = i
+			self.ids.append(node_id)
+			self.objects.append(None)
+			self.seen.append(0)
+			self.first_edge.append(-1)
+			self.in_degrees.append(0)
+		return i
+
+	def node_data(self, i: int) -> Dict[str, Any]:
+		node = self.objects[i]
+		if node is None:
+			return {}
+		data = {node.node_type: node}
+		if self.seen[i]:
+			data['seen'] = True
+		return data
+
+	def add_artist(self, artist: Artist, **attr):
+		i = self.node_index(artist.id)
+		self.objects[i] = artist
+		self.changed_nodes[artist.id] = None
+		if 'seen' in attr:
+			self.seen[i] = bool(attr['seen'])
+			if attr['seen'] and self.seen_store is not None:
+				self.seen_store.add([artist.id])
+
+	def add_artists(self, artists: List[Artist], seen: List[bool]):
+		for artist, is_seen in zip(artists, seen):
+			i = self.node_index(artist.id)
+			self.objects[i] = artist
+			if is_seen:
+				self.seen[i] = 1
+		self.changed_nodes.update(dict.fromkeys(artist.id for artist in artists))
+		if self.seen_store is not None:
+			self.seen_store.add(artist.id for artist, is_seen in zip(artists, seen) if is_seen)
+
+	def add_track(self, track: Track, **attr):
+		self.objects[self.node_index(track.id)] = track
+		self.changed_nodes[track.id] = None
+
+	def add_tracks(self, tracks: List[Track]):
+		for track in tracks:
+			self.objects[self.node_index(track.id)] = track
+		self.changed_nodes.update(dict.fromkeys(track.id for track in tracks))
+
+	def has_edge(self, a: str, b: str) -> bool:
+		source = self.index.get(a)
+		target = self.index.get(b)
+		if source is None or target is None:
+			return False
+
+		edge = self.first_edge[source]
+		while edge != -1:
+			if self.targets[edge] == target:
+				return True
+			edge = self.next_edge[edge]
+		return False
+
+	def add_edge(self, a, b, **attr):
+		if self.has_edge(a, b):
+			return
+
+		source = self.node_index(a)
+		target = self.node_index(b)
+		self.sources.append(source)
+		self.targets.append(target)
+		self.next_edge.append(self.first_edge[source])
+		self.first_edge[source] = len(self.sources) - 1
+		self.in_degrees[target] += 1
+		self.new_edges.append((a, b))
+
+	def add_edges(self, edges: Iterable[Tuple[str, str]]):
+		for a, b in dict.fromkeys(edges):
+			self.add_edge(a, b)
+
+	def get_track(self, track_id: str) -> Track:
+		i = self.index.get(track_id)
+		node = self.objects[i] if i is not None else None
+		return node if isinstance(node, Track) else None
+
+	def get_artist(self, artist_id: str) -> Artist:
+		i = self.index.get(artist_id)
+		node = self.objects[i] if i is not None else None
+		return node if isinstance(node, Artist) else None
+
+	def get_node_attributes(self, attr_name: str) -> Dict[str, Any]:
+		if attr_name == 'seen':
+			return {self.ids[i]: True for i, is_seen in enumerate(self.seen) if is_seen}
+		return {
+			node_id: node for node_id, node in zip(self.ids, self.objects)
+			if node is not None and node.node_type == attr_name
+		}
+
+	def to_dataframe(self) -> (pd.DataFrame, pd.DataFrame):
+		tracks = [node.to_dict() for node in self.objects if isinstance(node, Track)]
+		artists = [node.to_dict() for node in self.objects if isinstance(node, Artist)]
+		vertices = pd.json_normalize(tracks + artists)
+
+		# edges come out grouped by source node, in the order networkx would list them
+		ids = np.array(self.ids, dtype=object)
+		sources = np.array(self.sources, dtype=np.int64)
+		order = np.argsort(sources, kind='stable')
+		edges = pd.DataFrame({
+			'source': ids[sources[order]],
+			'target': ids[np.array(self.targets, dtype=np.int64)[order]],
+		})
+		return vertices, edges
+
+	def is_seen(self, artist_id: str) -> bool:
+		i = self.index.get(artist_id)
+		if i is not None and self.seen[i]:
+			return True
+		return self.seen_store is not None and artist_id in self.seen_store
+
+	def in_degree(self, node_id: str) -> int:
+		i = self.index.get(node_id)
+		return self.in_degrees[i] if i is not None else 0
+
+	def successors(self, node_id: str) -> List[str]:
+		i = self.index.get(node_id)
+		if i is None:
+			return []
+
+		# edges are chained newest first
+		successors = []
+		edge = self.first_edge[i]
+		while edge != -1:
+			successors.append(self.ids[self.targets[edge]])
+			edge = self.next_edge[edge]
+		return successors[::-1]
+
+	def nodes_since(self, position: int) -> Tuple[List[str], int]:
+		return self.ids[position:], len(self.ids)
+
+	@timed('graph_operation_seconds', operation='get_unseen_artists')
+	def get_unseen_artists(self, artists: List[Artist]) -> List[Artist]:
+		unique_artists = list(set(artists))
+		return [artist for artist in unique_artists if not self.is_seen(artist.id)]
+
+	@timed('graph_operation_seconds', operation='put_track')
+	def put_track(self, track: Track, artists: List[Artist]):
+		if track.id in self.index:
+			return
+
+		self.add_track(track)
+		for artist in artists:
+			keep_attrs(self.get_artist(artist.id), artist)
+			if artist.attr.get('seen') or artist.id in self.index:
+				self.add_artist(artist, seen=True)
+			else:
+				self.add_artist(artist)
+			self.add_edge(track.id, artist.id)
+		self.artist_graph.add_collaboration(artist.id for artist in artists)
+
+
+class ArrayNodeView:
+	def __init__(self, graph: ArrayGraph):
+		self.graph = graph
+
+	def __call__(self, data: bool = False):
+		if not data:
+			return self
+		return ((node_id, self.graph.node_data(i)) for i, node_id in enumerate(self.graph.ids))
+
+	def __getitem__(self, node_id: str) -> Dict[str, Any]:
+		return self.graph.node_data(self.graph.index[node_id])
+
+	def __contains__(self, node_id: str) -> bool:
+		return node_id in self.graph.index
+
+	def __iter__(self) -> Iterator[str]:
+		return iter(self.graph.ids)
+
+	def __len__(self) -> int:
+		return len(self.graph.ids)
+
+
+class ArrayEdgeView:
+	def __init__(self, graph: ArrayGraph):
+		self.graph = graph
+
+	def __call__(self):
+		return self
+
+	def __contains__(self, edge: Tuple[str, str]) -> bool:
+		return self.graph.has_edge(*edge)
+
+	def __iter__(self) -> Iterator[Tuple[str, str]]:
+		ids = self.graph.ids
+		return ((ids[a], ids[b]) for a, b in zip(self.graph.sources, self.graph.targets))
+
+	def __len__(self) -> int:
+		return len(self.graph.sources)
+
+
+def sqlite_graph(path: str = None) -> Graph:
+	# imported on first use, since the sqlite backend builds on this module
+	from acquisition.sqlite_graph import SQLiteGraph
+	return SQLiteGraph(path)
+
+
+GRAPH_BACKENDS = {'networkx': Graph, 'array': ArrayGraph, 'sqlite': sqlite_graph}
+
+
+def keep_attrs(existing: Union[Artist, None], artist: Artist):
+	# artists in track responses carry no popularity, genres or fetch times, so a known artist keeps its own
+	if existing is not None and existing is not artist:
+		artist.attr = {**existing.attr, **{k: v for k, v in artist.attr.items() if v is not None}}
+
+
+def create_graph(backend: str = 'networkx', path: str = None) -> Graph:
+	if backend not in GRAPH_BACKENDS:
+		raise ValueError(f"unknown graph backend {backend}, expected one of {', '.join(GRAPH_BACKENDS)}")
+	if backend == 'sqlite':
+		return GRAPH_BACKENDS[backend](path)
+	if path is not None:
+		raise ValueError(f"the {backend} graph backend is kept in memory, only the sqlite backend takes a path")
+	return GRAPH_BACKENDS[backend]()
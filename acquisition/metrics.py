@@ -0,0 +1,197 @@
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+# upper bounds in seconds, wide enough for both in-memory graph operations and slow API calls
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Metrics:
+	def __init__(self):
+		self.counters = {}
+		self.histograms = {}
+		self.lock = threading.Lock()
+
+	@staticmethod
+	def key(name: str, labels: Dict[str, Any]) -> Key:
+		return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+	def increment(self, name: str, value: float = 1, **labels):
+		key = self.key(name, labels)
+		with self.lock:
+			self.counters[key] = self.counters.get(key, 0) + value
+
+	def observe(self, name: str, seconds: float, **labels):
+		key = self.key(name, labels)
+		with self.lock:
+			histogram = self.histograms.get(key)
+			if histogram is None:
+				histogram = self.histograms[key] = {'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0}
+			for i, bound in enumerate(BUCKETS):
+				if seconds <= bound:
+					histogram['buckets'][i] += 1
+					break
+			histogram['count'] += 1
+			histogram['sum'] += seconds
+
+	@contextlib.contextmanager
+	def timer(self, name: str, **labels) -> Iterator[None]:
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe(name, time.perf_counter() - start, **labels)
+
+	def state(self) -> Dict[str, Any]:
+		# plain dicts, so worker processes can send their metrics back to be merged
+		with self.lock:
+			return {
+				'counters': dict(self.counters),
+				'histograms': {key: {**h, 'buckets': list(h['buckets'])} for key, h in self.histograms.items()}
+			}
+
+	def merge(self, state: Dict[str, Any]):
+		with self.lock:
+			for key, value in state['counters'].items():
+				self.counters[key] = self.counters.get(key, 0) + value
+			for key, other in state['histograms'].items():
+				histogram = self.histograms.setdefault(key, {'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0})
+				histogram['buckets'] = [a + b for a, b in zip(histogram['buckets'], other['buckets'])]
+				histogram['count'] += other['count']
+				histogram['sum'] += other['sum']
+
+	def reset(self):
+		with self.lock:
+			self.counters = {}
+			self.histograms = {}
+
+	def summary(self) -> Dict[str, Any]:
+		state = self.state()
+		return {
+			'counters': {series_name(*key): value for key, value in sorted(state['counters'].items())},
+			'histograms': {
+				series_name(*key): {
+					'count': h['count'],
+					'sum': h['sum'],
+					'mean': h['sum'] / h['count'] if h['count'] else 0.0,
+					'p50': quantile(h, 0.5),
+					'p95': quantile(h, 0.95),
+					'p99': quantile(h, 0.99)
+				}
+				for key, h in sorted(state['histograms'].items())
+			}
+		}
+
+	def to_prometheus(self) -> str:
+		state = self.state()
+		lines = []
+		for kind, series in (('counter', state['counters']), ('histogram', state['histograms'])):
+			typed = set()
+			for (name, labels), value in sorted(series.items()):
+				if name not in typed:
+					lines.append(f"# TYPE {name} {kind}")
+					typed.add(name)
+				if kind == 'counter':
+					lines.append(f"{series_name(name, labels)} {value}")
+					continue
+
+				cumulative = 0
+				for bound, count in zip(BUCKETS, value['buckets']):
+					cumulative += count
+					lines.append(f"{series_name(name + '_bucket', labels + (('le', str(bound)),))} {cumulative}")
+				lines.append(f"{series_name(name + '_bucket', labels + (('le', '+Inf'),))} {value['count']}")
+				lines.append(f"{series_name(name + '_sum', labels)} {value['sum']}")
+				lines.append(f"{series_name(name + '_count', labels)} {value['count']}")
+		return "\n".join(lines) + "\n"
+
+	def write(self, directory: str):
+		# both files are replaced whole, as the node exporter's textfile collector expects
+		os.makedirs(directory, exist_ok=True)
+		for name, text in (('metrics.json', json.dumps(self.summary(), indent=2)), ('metrics.prom', self.to_prometheus())):
+			path = os.path.join(directory, name)
+			with open(path + ".tmp", "w") as f:
+				f.write(text)
+			os.replace(path + ".tmp", path)
+
+
+def series_name(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+	if not labels:
+		return name
+	return name + "{" + ",".join(f'{label}="{value}"' for label, value in labels) + "}"
+
+
+def quantile(histogram: Dict[str, Any], q: float) -> float:
+	# the upper bound of the bucket holding the quantile
+	rank = q * histogram['count']
+	cumulative = 0
+	for bound, count in zip(BUCKETS, histogram['buckets']):
+		cumulative += count
+		if cumulative >= rank and count:
+			return bound
+	return float('inf') if histogram['count'] else 0.0
+
+
+def error_label(e: Exception) -> str:
+	status = getattr(e, 'http_status', None) or getattr(e, 'status', None)
+	return str(status) if status else type(e).__name__
+
+
+# shared by everything in the process, like the rate limiter is shared by the crawler's threads
+metrics = Metrics()
+
+
+def timed(name: str, **labels) -> Callable:
+	def decorator(f: Callable) -> Callable:
+		if asyncio.iscoroutinefunction(f):
+			@functools.wraps(f)
+			async def wrapper(*args, **kwargs):
+				with metrics.timer(name, **labels):
+					return await f(*args, **kwargs)
+		else:
+			@functools.wraps(f)
+			def wrapper(*args, **kwargs):
+				with metrics.timer(name, **labels):
+					return f(*args, **kwargs)
+		return wrapper
+	return decorator
+
+
+def instrument_request(service: str, endpoint: str, request: Callable) -> Callable:
+	# wraps a single request so that each attempt the rate limiter makes is timed, and retries and errors counted
+	attempts = 0
+
+	def attempted():
+		nonlocal attempts
+		if attempts:
+			metrics.increment(f"{service}_retries_total", endpoint=endpoint)
+		attempts += 1
+
+	def failed(e: Exception):
+		metrics.increment(f"{service}_errors_total", endpoint=endpoint, error=error_label(e))
+
+	if asyncio.iscoroutinefunction(request):
+		async def wrapper(*args, **kwargs):
+			attempted()
+			with metrics.timer(f"{service}_request_seconds", endpoint=endpoint):
+				try:
+					return await request(*args, **kwargs)
+				except Exception as e:
+					failed(e)
+					raise
+	else:
+		def wrapper(*args, **kwargs):
+			attempted()
+			with metrics.timer(f"{service}_request_seconds", endpoint=endpoint):
+				try:
+					return request(*args, **kwargs)
+				except Exception as e:
+					failed(e)
+					raise
+	return wrapper
@@ -1,23 +1,62 @@
+import itertools
 import json
+import threading
+import time
 import traceback
-from typing import Any, Dict, List, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple, Union
 
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
 from spotipy import Spotify
+from spotipy.exceptions import SpotifyException
 import networkx as nx
+import numpy as np
 import pandas as pd
 
-from .artist import Artist
-from .graph import Graph
+from .artist import Artist, intern_genres
+from .artist_graph import from_successor_lists, from_track_edges
+from .cache import ResponseCache
+from .graph import Graph, create_graph
+from .metrics import instrument_request, metrics, timed
 from .playlist import Playlist
+from .ratelimit import RateLimiter
+from .storage import FETCHED_ENDPOINTS, is_missing
 from .track import Track
 
+AUDIO_FEATURES_BATCH_SIZE = 100
+SEARCH_PAGE_SIZE = 50
+PLAYLIST_PAGE_SIZE = 100
+ARTISTS_BATCH_SIZE = 50
+
 
 class Network:
-	def __init__(self, spotify: Spotify, audio_features: List[str], max_tracks: int, graph: nx.Graph = None):
-		self.graph = Graph(graph)
+	def __init__(
+			self,
+			spotify: Spotify,
+			audio_features: List[str],
+			max_tracks: int,
+			graph: Union[Graph, nx.DiGraph] = None,
+			cache: ResponseCache = None,
+			limiter: RateLimiter = None,
+			page_workers: int = 4
+	):
+		self.graph = graph if isinstance(graph, Graph) else Graph(graph)
 		self.spotify = spotify
 		self.audio_features = audio_features
 		self.max_tracks = max_tracks
+		self.cache = cache
+		self.limiter = limiter
+		self.pending_audio_features = {}
+		self.page_workers = page_workers
+		self.page_executor = None
+		# crawl workers may fetch pages at once, and must all share the one pool
+		self.page_executor_lock = threading.Lock()
+
+		# requests sent to spotify, which cache hits don't count towards
+		self.requests = 0
+		self.requests_lock = threading.Lock()
 
 	# TODO: test this
 	@classmethod
@@ -27,71 +66,125 @@ class Network:
 			audio_features: List[str],
 			max_tracks: int,
 			vertices: pd.DataFrame,
-			edges: pd.DataFrame
+			edges: pd.DataFrame,
+			cache: ResponseCache = None,
+			limiter: RateLimiter = None,
+			backend: str = 'networkx',
+			page_workers: int = 4,
+			graph_path: str = None
 	):
-		graph = Graph(nx.from_pandas_edgelist(edges))
-		records = vertices.to_dict('records')
-		for record in records:
-			attr = {}
-			for k, v in record.items():
-				if 'attr' in k:
-					attr[k.replace("attr.", "")] = v
-
-			if record['node_type'] == 'track':
-				graph.add_track(Track(
-					track_id=record['id'],
-					name=record['name'],
-					album=record['album'],
-					album_type=record['album_type'],
-					attr=attr
-				))
-			elif record['node_type'] == 'artist':
-				graph.add_artist(Artist(
-					artist_id=record['id'],
-					name=record['name'],
-					attr=attr
-				))
-			else:
-				print("weird node found; skipping")
-				continue
+		return cls(
+			graph=graph_from_dataframe(vertices, edges, backend, graph_path),
+			spotify=spotify,
+			audio_features=audio_features,
+			max_tracks=max_tracks,
+			cache=cache,
+			limiter=limiter,
+			page_workers=page_workers
+		)
 
-		return cls(graph=graph, spotify=spotify, audio_features=audio_features, max_tracks=max_tracks)
+	def call(self, endpoint: str, *args, **kwargs) -> Tuple[Any, float]:
+		# the response, and when it was fetched from spotify, which is earlier than now for cached responses
+		if not self.cache:
+			response = self.request(endpoint, *args, **kwargs)
+			return response, time.time()
+
+		params = self.cache.key(args, kwargs)
+		hit, response, fetched = self.cache.get(endpoint, params)
+		metrics.increment('spotify_cache_hits_total' if hit else 'spotify_cache_misses_total', endpoint=endpoint)
+		if hit:
+			return response, fetched
+
+		response = self.request(endpoint, *args, **kwargs)
+		fetched = time.time()
+		self.cache.put(endpoint, params, response, fetched)
+		return response, fetched
+
+	def request(self, endpoint: str, *args, **kwargs) -> Any:
+		with self.requests_lock:
+			self.requests += 1
+		request = instrument_request('spotify', endpoint, getattr(self.spotify, endpoint))
+		# includes time spent waiting on the rate limiter and retrying
+		with metrics.timer('spotify_call_seconds', endpoint=endpoint):
+			if not self.limiter:
+				return request(*args, **kwargs)
+			return self.limiter.call(request, *args, **kwargs)
 
 	# TODO: test this
-	def search_tracks(self, artist_name: str, seen: bool = False) -> List[Tuple[Track, List[Artist]]]:
+	@timed('network_operation_seconds', operation='search_tracks')
+	def search_tracks(self, artist_name: str, seen: bool = False,
+					  artist: Artist = None) -> List[Tuple[Track, List[Artist]]]:
+		# the artist searched for, if given, is stamped once the search succeeds
+		limit = SEARCH_PAGE_SIZE
+		first_page, fetched = self.search_page(artist_name, 0, limit)
+		if not first_page:
+			return []
+		if artist is not None:
+			stamp(artist, 'search', fetched)
+
+		total = first_page['tracks']['total']
+		offsets = list(range(limit, min(total, self.max_tracks + 1), limit))
+		pages = itertools.chain(
+			[first_page],
+			self.fetch_pages(lambda offset: self.search_page(artist_name, offset, limit)[0], offsets)
+		)
+
 		tracks = {}
-		limit = 50
-		offset = 0
-		total = 1
-		while offset <= total and offset <= self.max_tracks:
-			try:
-				results = self.spotify.search(artist_name, type='track', limit=limit, offset=offset)
-			except Exception as e:
-				print(
-					f"exception while searching, skipping batch of tracks:\n",
-					format_traceback(e)
-				)
-				offset += limit
+		for results in pages:
+			if not results:
 				continue
 
-			offset += limit
-			total = results['tracks']['total']
-
-			if 'artists' not in results['tracks']['items']:
-				continue
+			matches = [
+				result for result in results['tracks']['items']
+				if result and artist_name in [artist['name'] for artist in result['artists']]
+			]
+			# results are ordered by relevance, so once a page has none of the artist's tracks, later ones won't either
+			if not matches:
+				break
 
-			for result in results['tracks']['items']:
-				if artist_name in [artist['name'] for artist in result['artists']]:
-					tracks[result['name']] = (
-						self.track_from_response(result),
-						[self.artist_from_response(artist, seen) for artist in result['artists']]
-					)
+			for result in matches:
+				tracks[result['name']] = (
+					self.track_from_response(result),
+					[self.artist_from_response(artist, seen) for artist in result['artists']]
+				)
 
 		return list(tracks.values())
 
+	def search_page(self, artist_name: str, offset: int, limit: int) -> Tuple[Dict[str, Any], Union[float, None]]:
+		try:
+			return self.call('search', artist_name, type='track', limit=limit, offset=offset)
+		except Exception as e:
+			print(
+				f"exception while searching, skipping batch of tracks:\n",
+				format_traceback(e)
+			)
+			return {}, None
+
+	def fetch_pages(self, fetch: Callable[[int], Any], offsets: List[int]) -> Iterator[Any]:
+		# pages are requested page_workers at a time and yielded in offset order; a caller that stops early leaves
+		# the later batches unrequested, though the rest of the current batch has already been fetched
+		if self.page_workers <= 1:
+			yield from map(fetch, offsets)
+			return
+
+		with self.page_executor_lock:
+			if self.page_executor is None:
+				self.page_executor = ThreadPoolExecutor(max_workers=self.page_workers)
+			executor = self.page_executor
+		for start in range(0, len(offsets), self.page_workers):
+			yield from executor.map(fetch, offsets[start:start + self.page_workers])
+
+	def close(self):
+		# the page threads are started on first use, and would otherwise outlive the crawl
+		with self.page_executor_lock:
+			executor, self.page_executor = self.page_executor, None
+		if executor is not None:
+			executor.shutdown()
+
+	@timed('network_operation_seconds', operation='get_top_tracks')
 	def get_top_tracks(self, artist: Artist, seen: bool = False) -> List[Tuple[Track, List[Artist]]]:
 		try:
-			results = self.spotify.artist_top_tracks(artist.id)
+			results, fetched = self.call('artist_top_tracks', artist.id)
 		except Exception as e:
 			print(
 				f"exception while getting top tracks, skipping artist ({artist.name}):\n",
@@ -99,6 +192,7 @@ class Network:
 			)
 			return []
 
+		stamp(artist, 'artist_top_tracks', fetched)
 		tracks = {}
 		for result in results['tracks']:
 			tracks[result['name']] = (
@@ -108,9 +202,10 @@ class Network:
 
 		return list(tracks.values())
 
+	@timed('network_operation_seconds', operation='get_related_artists')
 	def get_related_artists(self, artist: Artist, seen: bool = False) -> List[Artist]:
 		try:
-			results = self.spotify.artist_related_artists(artist.id)
+			results, fetched = self.call('artist_related_artists', artist.id)
 		except Exception as e:
 			print(
 				f"exception while getting related artists, skipping artist ({artist.name}):\n",
@@ -118,12 +213,74 @@ class Network:
 			)
 			return []
 
+		stamp(artist, 'artist_related_artists', fetched)
 		if not results['artists']:
 			return []
 		return [self.artist_from_response(artist, seen) for artist in results['artists']]
 
+	@timed('network_operation_seconds', operation='refresh_artists')
+	def refresh_artists(self, artists: List[Artist]) -> int:
+		# popularity and genres of many artists at once, set on the artists in place
+		artists = list({artist.id: artist for artist in artists}.values())
+		n = ARTISTS_BATCH_SIZE
+		batches = [artists[i:i + n] for i in range(0, len(artists), n)]
+
+		refreshed = 0
+		for batch, (results, fetched) in zip(batches, self.fetch_pages(self.get_artists, [
+			[artist.id for artist in batch] for batch in batches
+		])):
+			responses = {result['id']: result for result in (results or {}).get('artists', []) if result}
+			for artist in batch:
+				if artist.id not in responses:
+					continue
+				response = responses[artist.id]
+				artist.attr = {
+					**artist.attr,
+					'popularity': response.get('popularity'),
+					'genres': intern_genres(response['genres']) if response.get('genres') is not None else None
+				}
+				stamp(artist, 'artists', fetched)
+				self.graph.touch(artist.id, artist)
+				refreshed += 1
+		return refreshed
+
+	def get_artists(self, artist_ids: List[str]) -> Tuple[Dict[str, Any], Union[float, None]]:
+		try:
+			return self.call('artists', artist_ids)
+		except Exception as e:
+			print(
+				f"exception while getting artists, skipping batch of artists:\n",
+				format_traceback(e)
+			)
+			return {}, None
+
+	def queue_audio_features(self, tracks: List[Track]):
+		for track in tracks:
+			# features are set on the track held by the graph, which may be a different object with the same ID
+			track = self.graph.get_track(track.id) or track
+			if track.id in self.pending_audio_features or self.has_audio_features(track):
+				continue
+
+			self.pending_audio_features[track.id] = track
+			if len(self.pending_audio_features) >= AUDIO_FEATURES_BATCH_SIZE:
+				self.flush_audio_features()
+
+	def flush_audio_features(self):
+		tracks = list(self.pending_audio_features.values())
+		self.pending_audio_features = {}
+		if tracks:
+			self.put_audio_features(tracks)
+		for track in tracks:
+			self.graph.touch(track.id, track)
+
+	def has_audio_features(self, track: Track) -> bool:
+		# or has been fetched without any
+		attr = track.attr
+		return fetched_key('audio_features') in attr or any(name in attr for name in self.audio_features)
+
+	@timed('network_operation_seconds', operation='put_audio_features')
 	def put_audio_features(self, tracks: List[Track]):
-		n = 100
+		n = AUDIO_FEATURES_BATCH_SIZE
 		batches = [tracks[i * n:(i+1) * n] for i in range((len(tracks) + n-1) // n)]
 
 		for batch in batches:
@@ -132,7 +289,7 @@ class Network:
 				tracks_map[track.id] = track
 
 			try:
-				results = self.spotify.audio_features(tracks_map.keys())
+				results, fetched = self.call('audio_features', tracks_map.keys())
 			except Exception as e:
 				print(
 					f"exception while getting audio features, skipping batch of tracks:\n",
@@ -140,10 +297,8 @@ class Network:
 				)
 				continue
 
-			if len(results) <= 0:
-				continue
-
-			for result in results:
+			returned = set()
+			for result in results or []:
 				if not result:
 					continue
 
@@ -154,12 +309,20 @@ class Network:
 				audio_features = {}
 				for name in self.audio_features:
 					audio_features[name] = result.get(name)
+				audio_features[fetched_key('audio_features')] = fetched
 				tracks_map[track_id].set_attrs(audio_features)
+				returned.add(track_id)
+
+			# tracks spotify has no features for are stamped all the same, so they aren't requested again
+			for track_id, track in tracks_map.items():
+				if track_id not in returned:
+					stamp(track, 'audio_features', fetched)
 
 	# TODO: test this
+	@timed('network_operation_seconds', operation='get_playlist')
 	def get_playlist(self, playlist_id: str) -> Union[Playlist, None]:
 		try:
-			playlist = self.spotify.playlist(playlist_id=playlist_id)
+			playlist, _ = self.call('playlist', playlist_id=playlist_id)
 		except Exception as e:
 			print(
 				f"exception while getting playlist, skipping playlist ({playlist_id}):\n",
@@ -170,13 +333,20 @@ class Network:
 		playlist_name = playlist['name']
 		total_tracks = playlist['tracks']['total']
 
-		entries = {}
-		offset = 0
-		limit = 50
-		while offset <= total_tracks:
-			results = self.get_playlist_tracks(playlist_id, offset, limit)
-			offset += limit
+		# the playlist object comes with its first page of tracks, which saves requesting it again
+		limit = PLAYLIST_PAGE_SIZE
+		first_page = playlist['tracks'] if playlist['tracks'].get('items') else None
+		start = len(first_page['items']) if first_page else 0
+		pages = itertools.chain(
+			[first_page] if first_page else [],
+			self.fetch_pages(
+				lambda offset: self.get_playlist_tracks(playlist_id, offset, limit),
+				list(range(start, total_tracks, limit))
+			)
+		)
 
+		entries = {}
+		for results in pages:
 			if not results:
 				continue
 			if len(results['items']) <= 0 or not results['items'][0]:
@@ -197,7 +367,7 @@ class Network:
 	# TODO: test this
 	def get_playlist_tracks(self, playlist_id: str, offset: int, limit: int) -> Dict[str, Any]:
 		try:
-			return self.spotify.playlist_tracks(playlist_id=playlist_id, offset=offset, limit=limit)
+			return self.call('playlist_tracks', playlist_id=playlist_id, offset=offset, limit=limit)[0]
 		except Exception as e:
 			print(
 				f"exception while getting playlist tracks, skipping batch of tracks ({playlist_id}):\n",
@@ -213,7 +383,7 @@ class Network:
 
 	def artist_from_response(self, response: Dict[str, Any], seen: bool = False) -> Artist:
 		attr = {'popularity': response.get('popularity'), 'genres': response.get('genres')}
-		if seen or response['id'] in self.graph.get_node_attributes('seen'):
+		if seen or self.graph.is_seen(response['id']):
 			attr['seen'] = True
 
 		return Artist(artist_id=response['id'], name=response['name'], attr=attr)
@@ -228,5 +398,99 @@ class Network:
 		)
 
 
+def graph_from_dataframe(vertices: pd.DataFrame, edges: pd.DataFrame, backend: str = 'networkx',
+						 graph_path: str = None) -> Graph:
+	graph = create_graph(backend, graph_path)
+	add_vertices(graph, vertices)
+	graph.add_edges(zip(edges['source'].tolist(), edges['target'].tolist()))
+	graph.artist_graph = from_track_edges(edges)
+	graph.clear_changes()
+	return graph
+
+
+def graph_from_chunks(vertex_chunks: Iterable[pd.DataFrame], edge_chunks: Iterable[pd.DataFrame],
+					  backend: str = 'networkx', graph_path: str = None) -> Graph:
+	# later chunks overwrite the nodes of earlier ones, and nothing is kept as a change, so a graph on disk is loaded
+	# without ever holding more than a chunk in memory
+	graph = create_graph(backend, graph_path)
+	for vertices in vertex_chunks:
+		add_vertices(graph, vertices)
+		graph.clear_changes()
+	for edges in edge_chunks:
+		graph.add_edges(zip(edges['source'].tolist(), edges['target'].tolist()))
+		graph.clear_changes()
+
+	# a track's edges may be split across chunks, so collaborations are counted once the graph holds them all
+	graph.artist_graph = from_successor_lists(graph.successor_lists())
+	return graph
+
+
+def add_vertices(graph: Graph, vertices: pd.DataFrame):
+	if len(vertices) <= 0:
+		return
+
+	# attr dicts are filled column by column, visiting only the cells that hold a value
+	attrs = [{} for _ in range(len(vertices))]
+	for column in [column for column in vertices.columns if 'attr' in column]:
+		name = column.replace("attr.", "")
+		values = vertices[column]
+		present = values.notna().to_numpy()
+		for row, value in zip(np.flatnonzero(present), values[present].tolist()):
+			attrs[row][name] = value
+
+	ids = vertices['id'].tolist()
+	names = vertices['name'].tolist()
+	node_types = vertices['node_type'].to_numpy()
+
+	track_rows = np.flatnonzero(node_types == 'track')
+	albums = vertices['album'].tolist() if 'album' in vertices.columns else [None] * len(vertices)
+	album_types = vertices['album_type'].tolist() if 'album_type' in vertices.columns else [None] * len(vertices)
+	graph.add_tracks([
+		Track(track_id=ids[row], name=names[row], album=albums[row], album_type=album_types[row], attr=attrs[row])
+		for row in track_rows
+	])
+
+	artist_rows = np.flatnonzero(node_types == 'artist')
+	seen_column = 'seen' if 'seen' in vertices.columns else 'attr.seen'
+	if seen_column in vertices.columns:
+		seen = [not is_missing(value) and bool(value) for value in vertices[seen_column].to_numpy()[artist_rows]]
+	else:
+		seen = [False] * len(artist_rows)
+	graph.add_artists([Artist(artist_id=ids[row], name=names[row], attr=attrs[row]) for row in artist_rows], seen)
+
+	weird_nodes = len(vertices) - len(track_rows) - len(artist_rows)
+	if weird_nodes > 0:
+		print(f"{weird_nodes} weird nodes found; skipping")
+
+
+def spotify_session() -> requests.Session:
+	# spotipy mounts urllib3 retries for 429s even when told to make none, which swallow the Retry-After header; plain
+	# adapters hand every response back, for the rate limiter to retry
+	session = requests.Session()
+	session.mount("https://", HTTPAdapter())
+	session.mount("http://", HTTPAdapter())
+	return session
+
+
+def classify_spotify_error(e: Exception) -> Tuple[bool, bool, Union[float, None]]:
+	if isinstance(e, SpotifyException):
+		if e.http_status == 429:
+			retry_after = (e.headers or {}).get('Retry-After')
+			return True, True, float(retry_after) if retry_after is not None else None
+		return (e.http_status or 0) >= 500, False, None
+	return isinstance(e, (ConnectionError, Timeout)), False, None
+
+
+def fetched_key(endpoint: str) -> str:
+	return f"fetched_{endpoint}"
+
+
+def stamp(node: Union[Artist, Track], endpoint: str, now: float = None):
+	# when the node was last fetched from this endpoint, in seconds since the epoch
+	if endpoint not in FETCHED_ENDPOINTS:
+		raise ValueError(f"unknown endpoint {endpoint}")
+	node.attr = {**node.attr, fetched_key(endpoint): time.time() if now is None else now}
+
+
 def format_traceback(e: Exception) -> str:
 	return json.dumps(traceback.format_tb(e.__traceback__), indent=3)
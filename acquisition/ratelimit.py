@@ -0,0 +1,135 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Callable, Tuple, Union
+
+# classifies a failed request as (retryable, rate limited, seconds to wait from a Retry-After header)
+Classifier = Callable[[Exception], Tuple[bool, bool, Union[float, None]]]
+
+
+class RateLimited(Exception):
+	def __init__(self, message: str, retry_after: float = None):
+		super().__init__(message)
+		self.retry_after = retry_after
+
+
+def classify_rate_limited(e: Exception) -> Tuple[bool, bool, Union[float, None]]:
+	if isinstance(e, RateLimited):
+		return True, True, e.retry_after
+	return False, False, None
+
+
+class RateLimiter:
+	def __init__(
+			self,
+			rate: float,
+			burst: int = None,
+			max_rate: float = None,
+			min_rate: float = None,
+			max_retries: int = 5,
+			base_delay: float = 1.0,
+			max_delay: float = 60.0,
+			classify: Classifier = classify_rate_limited
+	):
+		self.rate = rate
+		self.max_rate = max_rate or rate
+		self.min_rate = min_rate or rate / 16
+		self.capacity = burst or max(1, int(rate))
+		self.max_retries = max_retries
+		self.base_delay = base_delay
+		self.max_delay = max_delay
+		self.classify = classify
+
+		self.tokens = self.capacity
+		self.updated = time.monotonic()
+		self.blocked_until = 0.0
+
+		self.calls = 0
+		self.retries = 0
+		self.throttles = 0
+
+		# shared by the crawler's worker threads, or by every task on an event loop
+		self.lock = threading.Lock()
+
+	def reserve(self) -> float:
+		with self.lock:
+			now = time.monotonic()
+			self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+			self.updated = now
+			self.tokens -= 1
+			self.calls += 1
+			return max(0.0, -self.tokens / self.rate, self.blocked_until - now)
+
+	def acquire(self):
+		delay = self.reserve()
+		if delay > 0:
+			time.sleep(delay)
+
+	async def acquire_async(self):
+		delay = self.reserve()
+		if delay > 0:
+			await asyncio.sleep(delay)
+
+	def throttle(self, delay: float):
+		# halve the request rate and hold every caller back until the provider is ready again
+		with self.lock:
+			self.throttles += 1
+			self.rate = max(self.min_rate, self.rate / 2)
+			self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+	def succeed(self):
+		with self.lock:
+			self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+	def backoff(self, attempt: int) -> float:
+		return min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+	def failed(self, e: Exception, attempt: int) -> float:
+		retryable, rate_limited, retry_after = self.classify(e)
+		if not retryable or attempt >= self.max_retries:
+			raise e
+
+		with self.lock:
+			self.retries += 1
+		delay = self.backoff(attempt) if retry_after is None else retry_after
+		if rate_limited:
+			# the wait happens in the next acquire, alongside every other caller
+			self.throttle(delay)
+			return 0.0
+		return delay
+
+	def call(self, request: Callable[..., Any], *args, **kwargs) -> Any:
+		attempt = 0
+		while True:
+			self.acquire()
+			try:
+				result = request(*args, **kwargs)
+			except Exception as e:
+				delay = self.failed(e, attempt)
+				attempt += 1
+				if delay > 0:
+					time.sleep(delay)
+				continue
+
+			self.succeed()
+			return result
+
+	async def call_async(self, request: Callable[..., Any], *args, **kwargs) -> Any:
+		attempt = 0
+		while True:
+			await self.acquire_async()
+			try:
+				result = await request(*args, **kwargs)
+			except Exception as e:
+				delay = self.failed(e, attempt)
+				attempt += 1
+				if delay > 0:
+					await asyncio.sleep(delay)
+				continue
+
+			self.succeed()
+			return result
+
+	def stats(self):
+		return {'calls': self.calls, 'retries': self.retries, 'throttles': self.throttles, 'rate': self.rate}
@@ -0,0 +1,127 @@
+import heapq
+import itertools
+import time
+from typing import Callable, List, Tuple
+
+from .artist import Artist
+from .graph import Graph
+
+# each score term rates an artist reached at a given distance from the seed playlists; higher is crawled sooner
+SCORES = {
+	'popularity': lambda graph, artist, distance: artist.attr.get('popularity') or 0,
+	'degree': lambda graph, artist, distance: graph.in_degree(artist.id),
+	'distance': lambda graph, artist, distance: -distance,
+}
+
+Score = Callable[[Graph, Artist, int], float]
+
+
+def parse_score(spec: str) -> Score:
+	# a comma separated list of terms with optional weights, e.g. "popularity,distance:20"
+	terms = []
+	for term in spec.split(','):
+		name, _, weight = term.strip().partition(':')
+		if name not in SCORES:
+			raise ValueError(f"unknown score {name}, expected one of {', '.join(SCORES)}")
+		terms.append((SCORES[name], float(weight) if weight else 1.0))
+
+	return lambda graph, artist, distance: sum(weight * f(graph, artist, distance) for f, weight in terms)
+
+
+class Budget:
+	def __init__(self, max_calls: int = None, max_seconds: float = None, spent_calls: int = 0,
+				 spent_seconds: float = 0.0):
+		self.max_calls = max_calls
+		self.max_seconds = max_seconds
+		# a resumed crawl carries on with what is left of the budget
+		self.spent_calls = spent_calls
+		self.spent_seconds = spent_seconds
+		self.start_time = time.monotonic()
+		self.start_calls = 0
+
+	def start(self, calls: int):
+		self.start_time = time.monotonic()
+		self.start_calls = calls
+
+	def calls(self, calls: int) -> int:
+		return self.spent_calls + calls - self.start_calls
+
+	def seconds(self) -> float:
+		return self.spent_seconds + time.monotonic() - self.start_time
+
+	def exhausted(self, calls: int) -> bool:
+		if self.max_calls is not None and self.calls(calls) >= self.max_calls:
+			return True
+		return self.max_seconds is not None and self.seconds() >= self.max_seconds
+
+
+class Frontier:
+	def __init__(self, graph: Graph, score: Score, max_distance: int = None):
+		self.graph = graph
+		self.score = score
+		self.max_distance = max_distance
+		self.heap = []
+		self.order = itertools.count()
+		self.crawled = set()
+		# the live heap entry of each queued artist; entries it replaced stay in the heap and are skipped when popped
+		self.queued = {}
+
+	def push(self, artists: List[Artist], distance: int):
+		# an artist reached again is only queued again if it now scores better
+		if self.max_distance is not None and distance > self.max_distance:
+			return
+		for artist in artists:
+			if artist.id in self.crawled:
+				continue
+			entry = (-self.score(self.graph, artist, distance), next(self.order), distance, artist)
+			queued = self.queued.get(artist.id)
+			if queued is not None and queued[0] <= entry[0]:
+				continue
+			self.queued[artist.id] = entry
+			heapq.heappush(self.heap, entry)
+
+		if len(self.heap) > 2 * len(self.queued) + 64:
+			self.heap = list(self.queued.values())
+			heapq.heapify(self.heap)
+
+	def pop(self, n: int) -> List[Tuple[Artist, int]]:
+		batch = {}
+		while self.heap and len(batch) < n:
+			entry = heapq.heappop(self.heap)
+			_, _, distance, artist = entry
+			if self.queued.get(artist.id) is not entry:
+				continue
+			del self.queued[artist.id]
+			if not self.graph.is_seen(artist.id):
+				batch[artist.id] = (artist, distance)
+
+		self.crawled.update(batch)
+		return list(batch.values())
+
+	def entries(self) -> List[Tuple[Artist, int]]:
+		# each artist still waiting, best first
+		return [
+			(artist, distance) for _, _, distance, artist in sorted(self.queued.values())
+			if not self.graph.is_seen(artist.id)
+		]
+
+	def __len__(self) -> int:
+		return len(self.queued)
+
+
+def stale_artists(graph: Graph, endpoints: List[str], max_age: float, score: Score, now: float = None,
+				  include: Callable[[Artist], bool] = None) -> List[Artist]:
+	# artists with any of the endpoints last fetched more than max_age seconds ago, or never; best scored first,
+	# then least recently fetched
+	now = time.time() if now is None else now
+	keys = [f"fetched_{endpoint}" for endpoint in endpoints]
+
+	stale = []
+	for artist in graph.get_node_attributes('artist').values():
+		if include is not None and not include(artist):
+			continue
+		fetched = min(artist.attr.get(key) or 0.0 for key in keys)
+		if now - fetched > max_age:
+			stale.append((-score(graph, artist, 0), fetched, artist.id, artist))
+	stale.sort(key=lambda entry: entry[:3])
+	return [artist for _, _, _, artist in stale]
@@ -0,0 +1,138 @@
+import hashlib
+import itertools
+import math
+import os
+import sqlite3
+import threading
+from typing import Iterable, List
+
+import numpy as np
+
+
+class BloomFilter:
+	def __init__(self, capacity: int, error_rate: float):
+		self.capacity = max(capacity, 1)
+		self.error_rate = error_rate
+		self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+		self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+		self.bits = bytearray((self.size + 7) // 8)
+		self.count = 0
+
+	def positions(self, key: str) -> List[int]:
+		# double hashing: k positions from the two halves of a single digest
+		digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+		a = int.from_bytes(digest[:8], 'little')
+		b = int.from_bytes(digest[8:], 'little') | 1
+		return [(a + i * b) % self.size for i in range(self.hashes)]
+
+	def add(self, key: str):
+		bits = self.bits
+		for position in self.positions(key):
+			bits[position >> 3] |= 1 << (position & 7)
+		self.count += 1
+
+	def __contains__(self, key: str) -> bool:
+		bits = self.bits
+		return all(bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+class SeenStore:
+	# artist IDs seen by any earlier crawl, kept on disk so a new crawl can skip them without loading the graph;
+	# a bloom filter answers most lookups for unseen artists without touching the database
+	def __init__(self, path: str, capacity: int = 10_000_000, error_rate: float = 0.01, batch_size: int = 1000):
+		self.path = path
+		self.bloom_path = path + ".bloom.npz"
+		self.error_rate = error_rate
+		self.batch_size = batch_size
+		self.pending = set()
+
+		self.lookups = 0
+		self.bloom_rejections = 0
+
+		# lookups come from the crawler's worker threads
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, check_same_thread=False)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("PRAGMA synchronous=NORMAL")
+		self.connection.execute("PRAGMA busy_timeout=30000")
+		self.connection.execute("CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY) WITHOUT ROWID")
+		self.connection.commit()
+
+		self.count = self.connection.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+		self.bloom = self.load_bloom(max(capacity, self.count * 2))
+
+	def load_bloom(self, capacity: int) -> BloomFilter:
+		# the saved filter is only trusted if it covers exactly the IDs in the table
+		if os.path.exists(self.bloom_path):
+			saved = np.load(self.bloom_path)
+			if int(saved['count']) == self.count and int(saved['capacity']) >= self.count:
+				bloom = BloomFilter(int(saved['capacity']), float(saved['error_rate']))
+				bloom.bits = bytearray(saved['bits'].tobytes())
+				bloom.count = self.count
+				return bloom
+
+		bloom = BloomFilter(capacity, self.error_rate)
+		for (artist_id,) in self.connection.execute("SELECT id FROM seen"):
+			bloom.add(artist_id)
+		return bloom
+
+	def __contains__(self, artist_id: str) -> bool:
+		with self.lock:
+			self.lookups += 1
+			if artist_id in self.pending:
+				return True
+			if artist_id not in self.bloom:
+				self.bloom_rejections += 1
+				return False
+			return self.connection.execute("SELECT 1 FROM seen WHERE id = ?", (artist_id,)).fetchone() is not None
+
+	def add(self, artist_ids: Iterable[str]):
+		# taken batch_size at a time, so a long iterator of IDs is never held in memory at once
+		artist_ids = iter(artist_ids)
+		with self.lock:
+			while True:
+				batch = list(itertools.islice(artist_ids, self.batch_size))
+				if not batch:
+					return
+				self.pending.update(batch)
+				if len(self.pending) >= self.batch_size:
+					self.write()
+
+	def flush(self):
+		with self.lock:
+			self.write()
+
+	def write(self):
+		if not self.pending:
+			return
+
+		before = self.connection.total_changes
+		self.connection.executemany("INSERT OR IGNORE INTO seen VALUES (?)", ((i,) for i in self.pending))
+		self.connection.commit()
+		added = self.connection.total_changes - before
+
+		# IDs already in the table were already in the filter
+		if added:
+			for artist_id in self.pending:
+				self.bloom.add(artist_id)
+		self.count += added
+		self.pending = set()
+
+		if self.count > self.bloom.capacity:
+			self.bloom = self.load_bloom(self.count * 2)
+
+	def save_bloom(self):
+		# only written on close; after a crash the filter is rebuilt from the table instead
+		tmp_path = self.bloom_path + ".tmp.npz"
+		np.savez(tmp_path, bits=np.frombuffer(self.bloom.bits, dtype=np.uint8), count=self.count, capacity=self.bloom.capacity,
+				 error_rate=self.bloom.error_rate)
+		os.replace(tmp_path, self.bloom_path)
+
+	def stats(self):
+		return {'seen': self.count + len(self.pending), 'lookups': self.lookups, 'bloom_rejections': self.bloom_rejections}
+
+	def close(self):
+		with self.lock:
+			self.write()
+			self.save_bloom()
+			self.connection.close()
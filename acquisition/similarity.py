@@ -0,0 +1,279 @@
+import itertools
+from typing import Dict, Iterable, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .graph import Graph
+
+
+class SimilarityIndex:
+	# cosine similarity over unit vectors, answered exactly by brute force or, when approximate, from the rows
+	# sharing a random-hyperplane hash with the query in any of several tables
+	def __init__(self, dim: int, approximate: bool = False, tables: int = 8, bits: int = 12, seed: int = 0):
+		self.dim = dim
+		self.approximate = approximate
+		self.ids = []
+		self.index = {}
+		self.vectors = np.zeros((1024, dim), dtype=np.float32)
+
+		rng = np.random.default_rng(seed)
+		self.planes = rng.standard_normal((tables, dim, bits)).astype(np.float32)
+		self.powers = 1 << np.arange(bits, dtype=np.int64)
+		self.codes = np.zeros((1024, tables), dtype=np.int64)
+		self.buckets = [{} for _ in range(tables)]
+
+	def __len__(self) -> int:
+		return len(self.ids)
+
+	def __contains__(self, item_id: str) -> bool:
+		return item_id in self.index
+
+	def hash(self, vectors: np.ndarray) -> np.ndarray:
+		return np.stack([(vectors @ planes > 0) @ self.powers for planes in self.planes], axis=1)
+
+	def add(self, ids: List[str], vectors: np.ndarray):
+		# new IDs are appended, known ones have their vector replaced
+		vectors = normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim))
+		rows = np.empty(len(ids), dtype=np.int64)
+		for i, item_id in enumerate(ids):
+			row = self.index.get(item_id)
+			if row is None:
+				row = self.index[item_id] = len(self.ids)
+				self.ids.append(item_id)
+			elif self.approximate:
+				self.unbucket(row)
+			rows[i] = row
+
+		if len(self.ids) > len(self.vectors):
+			capacity = max(len(self.ids), 2 * len(self.vectors))
+			self.vectors = np.resize(self.vectors, (capacity, self.dim))
+			self.codes = np.resize(self.codes, (capacity, len(self.buckets)))
+		self.vectors[rows] = vectors
+
+		if self.approximate:
+			self.codes[rows] = self.hash(vectors)
+			for row in rows:
+				for table, code in zip(self.buckets, self.codes[row]):
+					table.setdefault(int(code), set()).add(int(row))
+
+	def unbucket(self, row: int):
+		for table, code in zip(self.buckets, self.codes[row]):
+			table[int(code)].discard(row)
+
+	def candidates(self, vector: np.ndarray) -> np.ndarray:
+		rows = set()
+		for table, code in zip(self.buckets, self.hash(vector[None, :])[0]):
+			rows.update(table.get(int(code), ()))
+		return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+	def query(self, vector: np.ndarray, k: int, exclude: str = None) -> List[Tuple[str, float]]:
+		vector = normalize(np.asarray(vector, dtype=np.float32).reshape(1, self.dim))[0]
+		rows = self.candidates(vector) if self.approximate else None
+		# too few candidates to fill the answer, so fall back to an exact search
+		if rows is not None and len(rows) <= k:
+			rows = None
+
+		vectors = self.vectors[:len(self.ids)] if rows is None else self.vectors[rows]
+		scores = vectors @ vector
+		if exclude in self.index:
+			excluded = self.index[exclude]
+			if rows is None:
+				scores[excluded] = -np.inf
+			else:
+				scores[rows == excluded] = -np.inf
+
+		top = top_k(scores, k)
+		top_rows = top if rows is None else rows[top]
+		return [(self.ids[row], float(score)) for row, score in zip(top_rows, scores[top]) if np.isfinite(score)]
+
+	def query_batch(self, vectors: np.ndarray, k: int, block_size: int = 1 << 26) -> List[List[Tuple[str, float]]]:
+		# exact answers for many queries at once, with as many queries per matrix product as keep the score
+		# block under block_size floats
+		if self.approximate:
+			return [self.query(vector, k) for vector in vectors]
+
+		vectors = normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+		size = len(self.ids)
+		block = max(1, block_size // max(size, 1))
+		results = []
+		for start in range(0, len(vectors), block):
+			scores = vectors[start:start + block] @ self.vectors[:size].T
+			if k < size:
+				top = np.argpartition(-scores, k, axis=1)[:, :k]
+			else:
+				top = np.broadcast_to(np.arange(size), scores.shape)
+			top_scores = np.take_along_axis(scores, top, axis=1)
+			order = np.argsort(-top_scores, axis=1, kind='stable')
+			top = np.take_along_axis(top, order, axis=1)
+			top_scores = np.take_along_axis(top_scores, order, axis=1)
+			results.extend(
+				[(self.ids[row], float(score)) for row, score in zip(rows, row_scores)]
+				for rows, row_scores in zip(top.tolist(), top_scores.tolist())
+			)
+		return results
+
+	def most_similar(self, item_id: str, k: int = 10) -> List[Tuple[str, float]]:
+		return self.query(self.vectors[self.index[item_id]], k, exclude=item_id)
+
+	def most_similar_batch(self, item_ids: List[str], k: int = 10) -> List[List[Tuple[str, float]]]:
+		# asks for one extra neighbour, since every item is its own nearest
+		rows = [self.index[item_id] for item_id in item_ids]
+		results = self.query_batch(self.vectors[rows], k + 1)
+		return [[(i, s) for i, s in result if i != item_id][:k] for item_id, result in zip(item_ids, results)]
+
+
+class GraphSimilarity:
+	# tracks are compared by their audio features, standardized with the mean and standard deviation of the tracks
+	# indexed so far, recomputed each time their number doubles; artists by their Last.fm tags when given, and
+	# otherwise by the mean features of the tracks they appear on
+	def __init__(self, graph: Graph, audio_features: List[str], artist_tags: pd.DataFrame = None,
+				 tags: pd.DataFrame = None, tag_dims: int = 128, approximate: bool = False):
+		self.graph = graph
+		self.audio_features = list(audio_features)
+		self.approximate = approximate
+		self.mean = None
+		self.std = None
+		# raw features of the indexed tracks, in the track index's row order, for when the statistics change
+		self.features = np.zeros((0, len(self.audio_features)), dtype=np.float32)
+		self.standardized_tracks = 0
+
+		# how far into the graph's nodes update has read, and the tracks read before their features came in
+		self.position = 0
+		self.waiting: Dict[str, None] = {}
+
+		self.tracks = SimilarityIndex(len(self.audio_features), approximate)
+		self.artist_tracks: Dict[str, List[str]] = {}
+		self.by_tags = artist_tags is not None
+		if self.by_tags:
+			self.tag_columns = top_tag_columns(artist_tags, tags, tag_dims)
+			self.artists = SimilarityIndex(max(len(self.tag_columns), 1), approximate)
+			self.add_artist_tags(artist_tags)
+		else:
+			self.artists = SimilarityIndex(len(self.audio_features), approximate)
+		self.update()
+
+	def update(self, artist_tags: pd.DataFrame = None) -> int:
+		# indexes the tracks added to the graph since the last call and those whose features have come in since,
+		# and refreshes the artists they appear on; when comparing by tags, artist_tags rows are indexed too
+		if artist_tags is not None and self.by_tags:
+			self.add_artist_tags(artist_tags)
+
+		node_ids, self.position = self.graph.nodes_since(self.position)
+		new_tracks = []
+		for track_id in itertools.chain(list(self.waiting), node_ids):
+			self.waiting.pop(track_id, None)
+			track = self.graph.get_track(track_id)
+			if track is None:
+				# a node named by an edge before its track was added
+				if self.graph.get_artist(track_id) is None:
+					self.waiting[track_id] = None
+				continue
+			if track_id in self.tracks:
+				continue
+
+			attr = track.attr
+			vector = [attr.get(name, np.nan) for name in self.audio_features]
+			if all(value is None or np.isnan(value) for value in vector):
+				# Spotify has no features for tracks stamped without any
+				if 'fetched_audio_features' not in attr:
+					self.waiting[track_id] = None
+				continue
+			new_tracks.append((track, vector))
+		if not new_tracks:
+			return 0
+
+		vectors = np.array([vector for _, vector in new_tracks], dtype=np.float64)
+		new_ids = [track.id for track, _ in new_tracks]
+		start = len(self.tracks)
+		if start + len(new_ids) > len(self.features):
+			self.features = np.resize(self.features, (max(start + len(new_ids), 2 * len(self.features)),
+													  len(self.audio_features)))
+		self.features[start:start + len(new_ids)] = vectors
+
+		changed = {}
+		for track_id in new_ids:
+			for artist_id in self.graph.successors(track_id):
+				self.artist_tracks.setdefault(artist_id, []).append(track_id)
+				changed[artist_id] = None
+
+		size = start + len(new_ids)
+		if size >= 2 * self.standardized_tracks:
+			features = self.features[:size].astype(np.float64)
+			self.mean = np.nanmean(features, axis=0)
+			self.std = np.nanstd(features, axis=0)
+			self.std[~(self.std > 0)] = 1.0
+			self.standardized_tracks = size
+			self.tracks.add(self.tracks.ids + new_ids, self.standardize(features))
+			changed = self.artist_tracks
+		else:
+			self.tracks.add(new_ids, self.standardize(vectors))
+
+		if not self.by_tags:
+			artist_ids = list(changed)
+			self.artists.add(artist_ids, np.array([
+				self.tracks.vectors[[self.tracks.index[t] for t in self.artist_tracks[a]]].mean(axis=0)
+				for a in artist_ids
+			], dtype=np.float32).reshape(len(artist_ids), len(self.audio_features)))
+		return len(new_ids)
+
+	def add_artist_tags(self, artist_tags: pd.DataFrame):
+		# each artist's rows replace whatever tags it was indexed with before
+		artist_ids, vectors = tag_vectors(artist_tags, self.tag_columns)
+		self.artists.add(artist_ids, vectors)
+
+	def standardize(self, vectors: np.ndarray) -> np.ndarray:
+		return np.nan_to_num((vectors - self.mean) / self.std)
+
+	def most_similar(self, artist_id: str, k: int = 10) -> List[Tuple[str, float]]:
+		return self.artists.most_similar(artist_id, k)
+
+	def most_similar_batch(self, artist_ids: List[str], k: int = 10) -> List[List[Tuple[str, float]]]:
+		return self.artists.most_similar_batch(artist_ids, k)
+
+	def similar_tracks(self, track_id: str, k: int = 10) -> List[Tuple[str, float]]:
+		return self.tracks.most_similar(track_id, k)
+
+	def similar_tracks_batch(self, track_ids: List[str], k: int = 10) -> List[List[Tuple[str, float]]]:
+		return self.tracks.most_similar_batch(track_ids, k)
+
+	def tracks_like(self, features: Dict[str, float], k: int = 10) -> List[Tuple[str, float]]:
+		vector = np.array([[features.get(name, np.nan) for name in self.audio_features]], dtype=np.float64)
+		return self.tracks.query(self.standardize(vector)[0], k)
+
+
+def top_tag_columns(artist_tags: pd.DataFrame, tags: Union[pd.DataFrame, None], dims: int) -> pd.Series:
+	# the most common tags, from the tables written by acquisition.tag_tables, and the column each becomes
+	if tags is not None:
+		top_tags = tags.sort_values(['artists', 'tag_id'], ascending=[False, True])['tag_id'].to_numpy()[:dims]
+	else:
+		top_tags = artist_tags['tag_id'].value_counts().index.to_numpy()[:dims]
+	return pd.Series(np.arange(len(top_tags)), index=top_tags)
+
+
+def tag_vectors(artist_tags: pd.DataFrame, columns: pd.Series) -> Tuple[List[str], np.ndarray]:
+	kept = artist_tags[artist_tags['tag_id'].isin(columns.index)]
+	artist_ids, rows = np.unique(kept['artist_id'].to_numpy(), return_inverse=True)
+	vectors = np.zeros((len(artist_ids), max(len(columns), 1)), dtype=np.float32)
+	np.add.at(vectors, (rows, columns[kept['tag_id'].to_numpy()].to_numpy()), kept['count'].to_numpy())
+	return list(artist_ids), vectors
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+	norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+	return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+	if k >= len(scores):
+		return np.argsort(-scores, kind='stable')
+	top = np.argpartition(-scores, k)[:k]
+	return top[np.argsort(-scores[top], kind='stable')]
+
+
+def to_dataframe(results: Iterable[List[Tuple[str, float]]], ids: List[str]) -> pd.DataFrame:
+	# flattens batched results into (id, neighbour, similarity) rows
+	return pd.DataFrame(
+		[(item_id, neighbour, score) for item_id, result in zip(ids, results) for neighbour, score in result],
+		columns=['id', 'neighbour', 'similarity']
+	)
@@ -0,0 +1,158 @@
+import json
+import os
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+import pandas as pd
+
+from .artist_graph import COLUMNS as ARTIST_EDGE_COLUMNS
+from .features import FeatureMatrix
+from .graph import Graph
+from .storage import FORMATS, read_edges, read_vertices, write_edges, write_vertices
+
+MANIFEST = "manifest.json"
+
+
+class SnapshotWriter:
+	def __init__(self, directory: str, file_format: str = 'csv', audio_features: List[str] = None,
+				 features: FeatureMatrix = None):
+		if file_format not in FORMATS:
+			raise ValueError(f"unknown snapshot format: {file_format}")
+
+		self.directory = directory
+		self.file_format = file_format
+		self.audio_features = audio_features or []
+		self.features = features
+		os.makedirs(directory, exist_ok=True)
+
+		self.manifest = {'next_segment': 0, 'segments': []}
+		if os.path.exists(self.path(MANIFEST)):
+			with open(self.path(MANIFEST)) as f:
+				self.manifest = json.load(f)
+
+	def path(self, filename: str) -> str:
+		return os.path.join(self.directory, filename)
+
+	def flush(self, graph: Graph, name: str, checkpoint: Dict[str, Any] = None) -> Union[Dict[str, Any], None]:
+		# a checkpoint is recorded in the same manifest write as the segment holding the graph up to that point
+		if checkpoint is not None:
+			self.manifest['checkpoint'] = checkpoint
+
+		# seen artists are recorded no later than the nodes that made them seen
+		if graph.seen_store is not None:
+			graph.seen_store.flush()
+
+		# popping the graph's changes clears the artist graph's too
+		artist_edges = graph.artist_graph.pop_changes()
+		vertices, edges = graph.pop_changes()
+		if len(vertices) <= 0 and len(edges) <= 0 and len(artist_edges) <= 0:
+			if checkpoint is not None:
+				self.write_manifest()
+			return None
+		if len(vertices) <= 0:
+			vertices = pd.DataFrame(columns=['id'])
+
+		index = self.manifest['next_segment']
+		segment = {
+			'name': name,
+			'vertices': f"vertices_{index:05d}.{self.file_format}",
+			'edges': f"edges_{index:05d}.{self.file_format}",
+			'vertex_count': len(vertices),
+			'edge_count': len(edges)
+		}
+		write_vertices(vertices, self.path(segment['vertices']), self.audio_features)
+		write_edges(edges, self.path(segment['edges']))
+		if len(artist_edges) > 0:
+			segment['artist_edges'] = f"artist_edges_{index:05d}.{self.file_format}"
+			segment['artist_edge_count'] = len(artist_edges)
+			write_edges(artist_edges, self.path(segment['artist_edges']))
+		if self.features is not None:
+			self.features.update(vertices)
+
+		self.manifest['next_segment'] = index + 1
+		self.manifest['segments'].append(segment)
+		self.write_manifest()
+		return segment
+
+	def read(self) -> (pd.DataFrame, pd.DataFrame):
+		segments = self.manifest['segments']
+		if not segments:
+			return pd.DataFrame(), pd.DataFrame(columns=['source', 'target'])
+
+		# nodes are rewritten whenever they change, so the last segment holding a node has its latest state
+		vertices = pd.concat(
+			[read_vertices(self.path(s['vertices']), self.audio_features) for s in segments], ignore_index=True
+		)
+		vertices = vertices.drop_duplicates(subset='id', keep='last').reset_index(drop=True)
+		edges = pd.concat([read_edges(self.path(s['edges'])) for s in segments], ignore_index=True)
+		edges = edges.drop_duplicates().reset_index(drop=True)
+		return vertices, edges
+
+	def read_chunks(self) -> Tuple[Iterator[pd.DataFrame], Iterator[pd.DataFrame]]:
+		# the segments' vertices and edges one segment at a time, oldest first, for graph_from_chunks
+		segments = list(self.manifest['segments'])
+		return (
+			(read_vertices(self.path(s['vertices']), self.audio_features) for s in segments),
+			(read_edges(self.path(s['edges'])) for s in segments)
+		)
+
+	def read_artist_edges(self) -> pd.DataFrame:
+		# pairs are rewritten whenever their counts change, so the last segment holding a pair has its latest counts
+		paths = [self.path(s['artist_edges']) for s in self.manifest['segments'] if s.get('artist_edges')]
+		if not paths:
+			return pd.DataFrame(columns=ARTIST_EDGE_COLUMNS)
+
+		artist_edges = pd.concat(
+			[read_edges(path, dtype={'source': str, 'target': str}) for path in paths], ignore_index=True
+		)
+		return artist_edges.drop_duplicates(subset=['source', 'target'], keep='last').reset_index(drop=True)
+
+	def compact(self) -> Dict[str, Any]:
+		vertices, edges = self.read()
+		artist_edges = self.read_artist_edges()
+		old_segments = self.manifest['segments']
+
+		segment = {
+			'name': 'compacted',
+			'vertices': f"vertices.{self.file_format}",
+			'edges': f"edges.{self.file_format}",
+			'vertex_count': len(vertices),
+			'edge_count': len(edges)
+		}
+		write_vertices(vertices, self.path("tmp_" + segment['vertices']), self.audio_features)
+		write_edges(edges, self.path("tmp_" + segment['edges']))
+		os.replace(self.path("tmp_" + segment['vertices']), self.path(segment['vertices']))
+		os.replace(self.path("tmp_" + segment['edges']), self.path(segment['edges']))
+		if len(artist_edges) > 0:
+			segment['artist_edges'] = f"artist_edges.{self.file_format}"
+			segment['artist_edge_count'] = len(artist_edges)
+			write_edges(artist_edges, self.path("tmp_" + segment['artist_edges']))
+			os.replace(self.path("tmp_" + segment['artist_edges']), self.path(segment['artist_edges']))
+
+		self.manifest['segments'] = [segment]
+		self.write_manifest()
+
+		kept = {segment['vertices'], segment['edges'], segment.get('artist_edges')}
+		for old in old_segments:
+			for filename in (old['vertices'], old['edges'], old.get('artist_edges')):
+				if filename and filename not in kept and os.path.exists(self.path(filename)):
+					os.remove(self.path(filename))
+		return segment
+
+	def write_manifest(self):
+		# segments are only visible to readers once the manifest naming them is in place
+		with open(self.path(MANIFEST + ".tmp"), "w") as f:
+			json.dump(self.manifest, f, indent=2)
+		os.replace(self.path(MANIFEST + ".tmp"), self.path(MANIFEST))
+
+
+def main():
+	writer = SnapshotWriter(
+		directory=os.environ.get("SNAPSHOT_PATH", "snapshots"),
+		file_format=os.environ.get("SNAPSHOT_FORMAT", "csv")
+	)
+	segment = writer.compact()
+	print(f"Compacted into {segment['vertex_count']} vertices and {segment['edge_count']} edges")
+
+
+if __name__ == '__main__':
+	main()
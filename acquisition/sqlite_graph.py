@@ -0,0 +1,389 @@
+import itertools
+import json
+import os
+import sqlite3
+import tempfile
+import weakref
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Union
+
+import pandas as pd
+
+from acquisition.artist import Artist
+from acquisition.artist_graph import ArtistGraph
+from acquisition.graph import Graph, keep_attrs
+from acquisition.metrics import timed
+from acquisition.track import Track
+
+Node = Union[Artist, Track]
+
+
+class SQLiteGraph(Graph):
+	# same interface as Graph, but nodes and edges live in SQLite tables, so a crawl is bounded by disk rather than
+	# memory; writes are buffered and committed batch_size at a time, and the objects handed out most recently are
+	# kept, so a caller can change one and touch it like with the in-memory graphs
+	def __init__(self, path: str = None, batch_size: int = 10_000, cache_size: int = 10_000):
+		self.path = path
+		self.remove = None
+		if path is None:
+			fd, self.path = tempfile.mkstemp(suffix=".db")
+			os.close(fd)
+			# without a path the database is scratch space, removed once the graph is closed or collected
+			self.remove = weakref.finalize(self, remove_database, self.path)
+		self.batch_size = batch_size
+		self.cache_size = cache_size
+
+		self.connection = sqlite3.connect(self.path)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("PRAGMA synchronous=NORMAL")
+		self.connection.execute("""
+			CREATE TABLE IF NOT EXISTS nodes (
+				rowid INTEGER PRIMARY KEY,
+				id TEXT NOT NULL UNIQUE,
+				node_type TEXT,
+				seen INTEGER,
+				data TEXT
+			)
+		""")
+		self.connection.execute("CREATE INDEX IF NOT EXISTS nodes_type ON nodes (node_type)")
+		self.connection.execute("CREATE INDEX IF NOT EXISTS nodes_seen ON nodes (seen) WHERE seen = 1")
+		self.connection.execute("""
+			CREATE TABLE IF NOT EXISTS edges (
+				source TEXT NOT NULL,
+				target TEXT NOT NULL,
+				UNIQUE (source, target)
+			)
+		""")
+		self.connection.execute("CREATE INDEX IF NOT EXISTS edges_target ON edges (target)")
+		self.connection.commit()
+
+		# written on the next batch: the latest (node_type, seen, node) of each node, with None for whatever a call
+		# left unchanged, and new edges grouped by source along with how many of them point at each node
+		self.pending_nodes: Dict[str, Tuple[Union[str, None], Union[bool, None], Union[Node, None]]] = {}
+		self.pending_edges: Dict[str, Dict[str, None]] = {}
+		self.pending_edge_count = 0
+		self.pending_in_degrees = Counter()
+		self.live: OrderedDict = OrderedDict()
+
+		self.nodes = SQLiteNodeView(self)
+		self.edges = SQLiteEdgeView(self)
+		self.seen_store = None
+		self.artist_graph = ArtistGraph()
+
+		self.changed_nodes = {}
+		self.new_edges = []
+
+	@property
+	def seen_artists(self):
+		return set(self.iter_seen_artists())
+
+	def iter_seen_artists(self) -> Iterator[str]:
+		# read from the seen index as they are consumed, rather than gathered into a set
+		self.write()
+		return (artist_id for (artist_id,) in self.connection.execute("SELECT id FROM nodes WHERE seen = 1"))
+
+	def write(self):
+		if not self.pending_nodes and not self.pending_edges:
+			return
+
+		with self.connection:
+			self.connection.executemany(
+				"""
+				INSERT INTO nodes (id, node_type, seen, data) VALUES (?, ?, ?, ?)
+				ON CONFLICT (id) DO UPDATE SET
+					node_type = COALESCE(excluded.node_type, node_type),
+					seen = COALESCE(excluded.seen, seen),
+					data = COALESCE(excluded.data, data)
+				""",
+				(
+					(node_id, node_type, None if seen is None else int(seen), None if node is None else encode(node))
+					for node_id, (node_type, seen, node) in self.pending_nodes.items()
+				)
+			)
+			self.connection.executemany(
+				"INSERT OR IGNORE INTO edges VALUES (?, ?)",
+				((a, b) for a, targets in self.pending_edges.items() for b in targets)
+			)
+		self.pending_nodes = {}
+		self.pending_edges = {}
+		self.pending_edge_count = 0
+		self.pending_in_degrees = Counter()
+
+	def write_if_full(self):
+		if len(self.pending_nodes) + self.pending_edge_count >= self.batch_size:
+			self.write()
+
+	def put_pending_edge(self, a: str, b: str):
+		self.pending_edges.setdefault(a, {})[b] = None
+		self.pending_edge_count += 1
+		self.pending_in_degrees[b] += 1
+		self.new_edges.append((a, b))
+
+	def put_node(self, node_id: str, node_type: str = None, seen: bool = None, node: Node = None):
+		previous = self.pending_nodes.get(node_id)
+		if previous is not None:
+			node_type = node_type or previous[0]
+			seen = previous[1] if seen is None else seen
+			node = node or previous[2]
+		self.pending_nodes[node_id] = (node_type, seen, node)
+		if node is not None:
+			self.remember(node)
+		self.write_if_full()
+
+	def remember(self, node: Node):
+		self.live[node.id] = node
+		self.live.move_to_end(node.id)
+		if len(self.live) > self.cache_size:
+			self.live.popitem(last=False)
+
+	def lookup(self, node_id: str) -> Union[Tuple[Union[str, None], bool, Union[Node, None]], None]:
+		# a node's type, seen flag and object, or None if the graph doesn't have it
+		pending = self.pending_nodes.get(node_id)
+		row = None
+		if pending is None or pending[0] is None or pending[1] is None:
+			row = self.connection.execute(
+				"SELECT node_type, seen, data FROM nodes WHERE id = ?", (node_id,)
+			).fetchone()
+		if pending is None and row is None:
+			return None
+
+		node_type, seen, node = pending or (None, None, None)
+		if row is not None:
+			node_type = node_type or row[0]
+			seen = row[1] if seen is None else seen
+			if node is None and row[2] is not None:
+				node = self.live.get(node_id) or decode(node_type, node_id, row[2])
+		if node is not None:
+			self.remember(node)
+		return node_type, bool(seen), node
+
+	def node_data(self, node_id: str) -> Dict[str, Any]:
+		found = self.lookup(node_id)
+		if found is None:
+			raise KeyError(node_id)
+		node_type, seen, node = found
+		if node is None:
+			return {}
+		data = {node_type: node}
+		if seen:
+			data['seen'] = True
+		return data
+
+	def add_artist(self, artist: Artist, **attr):
+		seen = bool(attr['seen']) if 'seen' in attr else None
+		self.put_node(artist.id, 'artist', seen, artist)
+		self.changed_nodes[artist.id] = None
+		if seen and self.seen_store is not None:
+			self.seen_store.add([artist.id])
+
+	def add_artists(self, artists: List[Artist], seen: List[bool]):
+		for artist, is_seen in zip(artists, seen):
+			self.put_node(artist.id, 'artist', True if is_seen else None, artist)
+		self.changed_nodes.update(dict.fromkeys(artist.id for artist in artists))
+		if self.seen_store is not None:
+			self.seen_store.add(artist.id for artist, is_seen in zip(artists, seen) if is_seen)
+
+	def add_track(self, track: Track, **attr):
+		self.put_node(track.id, 'track', None, track)
+		self.changed_nodes[track.id] = None
+
+	def add_tracks(self, tracks: List[Track]):
+		for track in tracks:
+			self.put_node(track.id, 'track', None, track)
+		self.changed_nodes.update(dict.fromkeys(track.id for track in tracks))
+
+	def has_edge(self, a: str, b: str) -> bool:
+		if b in self.pending_edges.get(a, ()):
+			return True
+		return self.connection.execute(
+			"SELECT 1 FROM edges WHERE source = ? AND target = ?", (a, b)
+		).fetchone() is not None
+
+	def add_edge(self, a, b, **attr):
+		if self.has_edge(a, b):
+			return
+
+		# like networkx, an edge adds any node it names that isn't in the graph yet
+		for node_id in (a, b):
+			if node_id not in self.nodes:
+				self.put_node(node_id)
+		self.put_pending_edge(a, b)
+		self.write_if_full()
+
+	def add_edges(self, edges: Iterable[Tuple[str, str]]):
+		for a, b in dict.fromkeys(edges):
+			self.add_edge(a, b)
+
+	def touch(self, node_id: str, node: Node = None):
+		# a changed node is rewritten from the object passed in, or else the one last handed out for it
+		node = node or self.live.get(node_id)
+		if node is not None:
+			self.put_node(node_id, node.node_type, None, node)
+			self.changed_nodes[node_id] = None
+		elif node_id in self.nodes:
+			self.changed_nodes[node_id] = None
+
+	def get_track(self, track_id: str) -> Track:
+		found = self.lookup(track_id)
+		return found[2] if found is not None and found[0] == 'track' else None
+
+	def get_artist(self, artist_id: str) -> Artist:
+		found = self.lookup(artist_id)
+		return found[2] if found is not None and found[0] == 'artist' else None
+
+	def get_node_attributes(self, attr_name: str) -> Dict[str, Any]:
+		self.write()
+		if attr_name == 'seen':
+			return {node_id: True for (node_id,) in self.connection.execute("SELECT id FROM nodes WHERE seen = 1")}
+		return {
+			node_id: self.live.get(node_id) or decode(attr_name, node_id, data)
+			for node_id, data in self.connection.execute(
+				"SELECT id, data FROM nodes WHERE node_type = ? ORDER BY rowid", (attr_name,)
+			)
+		}
+
+	def to_dataframe(self) -> (pd.DataFrame, pd.DataFrame):
+		self.write()
+		nodes = []
+		for node_type in ('track', 'artist'):
+			for node_id, data in self.connection.execute(
+					"SELECT id, data FROM nodes WHERE node_type = ? ORDER BY rowid", (node_type,)):
+				nodes.append((self.live.get(node_id) or decode(node_type, node_id, data)).to_dict())
+		vertices = pd.json_normalize(nodes)
+
+		# edges come out grouped by source node, in the order networkx would list them
+		edges = pd.read_sql_query(
+			"SELECT edges.source, edges.target FROM edges JOIN nodes ON nodes.id = edges.source "
+			"ORDER BY nodes.rowid, edges.rowid",
+			self.connection
+		)
+		return vertices, edges
+
+	def is_seen(self, artist_id: str) -> bool:
+		pending = self.pending_nodes.get(artist_id)
+		if pending is not None and pending[1] is not None:
+			seen = pending[1]
+		else:
+			row = self.connection.execute("SELECT seen FROM nodes WHERE id = ?", (artist_id,)).fetchone()
+			seen = bool(row and row[0])
+		if seen:
+			return True
+		return self.seen_store is not None and artist_id in self.seen_store
+
+	def in_degree(self, node_id: str) -> int:
+		stored = self.connection.execute("SELECT COUNT(*) FROM edges WHERE target = ?", (node_id,)).fetchone()[0]
+		return stored + self.pending_in_degrees[node_id]
+
+	def successors(self, node_id: str) -> List[str]:
+		stored = [target for (target,) in self.connection.execute(
+			"SELECT target FROM edges WHERE source = ? ORDER BY rowid", (node_id,)
+		)]
+		return stored + list(self.pending_edges.get(node_id, ()))
+
+	def successor_lists(self) -> Iterator[List[str]]:
+		# read in source order off the edges' unique index, one source's targets at a time
+		self.write()
+		rows = self.connection.execute("SELECT source, target FROM edges ORDER BY source")
+		for _, group in itertools.groupby(rows, key=lambda row: row[0]):
+			targets = [target for _, target in group]
+			if len(targets) > 1:
+				yield targets
+
+	def nodes_since(self, position: int) -> Tuple[List[str], int]:
+		# positions are rowids, which only grow
+		self.write()
+		rows = self.connection.execute("SELECT rowid, id FROM nodes WHERE rowid > ? ORDER BY rowid", (position,)).fetchall()
+		return [node_id for _, node_id in rows], rows[-1][0] if rows else position
+
+	@timed('graph_operation_seconds', operation='put_track')
+	def put_track(self, track: Track, artists: List[Artist]):
+		if track.id in self.nodes:
+			return
+
+		self.add_track(track)
+		for artist in artists:
+			existing = self.lookup(artist.id)
+			keep_attrs(existing[2] if existing is not None and existing[0] == 'artist' else None, artist)
+			if artist.attr.get('seen') or existing is not None:
+				self.add_artist(artist, seen=True)
+			else:
+				self.add_artist(artist)
+			# the track is new, so none of its edges can be in the graph yet
+			self.put_pending_edge(track.id, artist.id)
+		self.artist_graph.add_collaboration(artist.id for artist in artists)
+		self.write_if_full()
+
+	def close(self):
+		self.write()
+		self.connection.close()
+		if self.remove is not None:
+			self.remove()
+
+
+class SQLiteNodeView:
+	def __init__(self, graph: SQLiteGraph):
+		self.graph = graph
+
+	def __call__(self, data: bool = False):
+		if not data:
+			return self
+		self.graph.write()
+		return (
+			(node_id, self.graph.node_data(node_id))
+			for (node_id,) in self.graph.connection.execute("SELECT id FROM nodes ORDER BY rowid").fetchall()
+		)
+
+	def __getitem__(self, node_id: str) -> Dict[str, Any]:
+		return self.graph.node_data(node_id)
+
+	def __contains__(self, node_id: str) -> bool:
+		if node_id in self.graph.pending_nodes:
+			return True
+		return self.graph.connection.execute("SELECT 1 FROM nodes WHERE id = ?", (node_id,)).fetchone() is not None
+
+	def __iter__(self) -> Iterator[str]:
+		self.graph.write()
+		return (node_id for (node_id,) in self.graph.connection.execute("SELECT id FROM nodes ORDER BY rowid"))
+
+	def __len__(self) -> int:
+		self.graph.write()
+		return self.graph.connection.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+
+
+class SQLiteEdgeView:
+	def __init__(self, graph: SQLiteGraph):
+		self.graph = graph
+
+	def __call__(self):
+		return self
+
+	def __contains__(self, edge: Tuple[str, str]) -> bool:
+		return self.graph.has_edge(*edge)
+
+	def __iter__(self) -> Iterator[Tuple[str, str]]:
+		self.graph.write()
+		return iter(self.graph.connection.execute("SELECT source, target FROM edges ORDER BY rowid"))
+
+	def __len__(self) -> int:
+		self.graph.write()
+		return self.graph.connection.execute("SELECT COUNT(*) FROM edges").fetchone()[0]
+
+
+def encode(node: Node) -> str:
+	data = node.to_dict()
+	del data['id'], data['node_type']
+	return json.dumps(data)
+
+
+def decode(node_type: str, node_id: str, data: str) -> Node:
+	data = json.loads(data)
+	if node_type == 'track':
+		return Track(track_id=node_id, name=data['name'], album=data['album'], album_type=data['album_type'],
+					 attr=data['attr'])
+	return Artist(artist_id=node_id, name=data['name'], attr=data['attr'])
+
+
+def remove_database(path: str):
+	for suffix in ("", "-wal", "-shm"):
+		if os.path.exists(path + suffix):
+			os.remove(path + suffix)
@@ -0,0 +1,112 @@
+import ast
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+import pandas as pd
+
+FORMATS = ('csv', 'parquet')
+
+# endpoints whose last fetch time each node keeps, as attr fetched_<endpoint>
+FETCHED_ENDPOINTS = ('search', 'artist_top_tracks', 'artist_related_artists', 'artists', 'audio_features')
+
+FLOAT_COLUMNS = ['attr.popularity'] + [f"attr.fetched_{endpoint}" for endpoint in FETCHED_ENDPOINTS]
+BOOLEAN_COLUMNS = ['seen', 'attr.seen']
+LIST_COLUMNS = ['attr.genres']
+
+
+def file_format(path: str) -> str:
+	return 'parquet' if path.endswith('.parquet') else 'csv'
+
+
+def type_vertices(vertices: pd.DataFrame, audio_features: List[str]) -> pd.DataFrame:
+	vertices = vertices.copy()
+	for column in FLOAT_COLUMNS + [f"attr.{name}" for name in audio_features]:
+		if column in vertices.columns:
+			vertices[column] = pd.to_numeric(vertices[column], errors='coerce').astype('float64')
+	for column in BOOLEAN_COLUMNS:
+		if column in vertices.columns:
+			vertices[column] = vertices[column].map(parse_boolean).astype('boolean')
+	for column in LIST_COLUMNS:
+		if column in vertices.columns:
+			vertices[column] = vertices[column].map(parse_list)
+	return vertices
+
+
+def write_vertices(vertices: pd.DataFrame, path: str, audio_features: List[str]):
+	vertices = type_vertices(vertices, audio_features)
+	if file_format(path) == 'parquet':
+		vertices.to_parquet(path, index=False)
+	else:
+		vertices.to_csv(path, index=False)
+
+
+def write_edges(edges: pd.DataFrame, path: str):
+	if file_format(path) == 'parquet':
+		edges.to_parquet(path, index=False)
+	else:
+		edges.to_csv(path, index=False)
+
+
+def read_vertices(path: str, audio_features: List[str]) -> pd.DataFrame:
+	if file_format(path) == 'parquet':
+		vertices = pd.read_parquet(path)
+	else:
+		vertices = pd.read_csv(path, dtype={'id': str})
+	return type_vertices(vertices, audio_features)
+
+
+def read_vertex_chunks(
+		path: str,
+		audio_features: List[str],
+		chunksize: int = 100_000,
+		columns: List[str] = None
+) -> Iterator[pd.DataFrame]:
+	if file_format(path) == 'parquet':
+		# pandas reads parquet through pyarrow, which can also read it a batch at a time
+		import pyarrow.parquet as pq
+		for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+			yield type_vertices(batch.to_pandas(), audio_features)
+		return
+	for vertices in pd.read_csv(path, usecols=columns, dtype={'id': str}, chunksize=chunksize):
+		yield type_vertices(vertices, audio_features)
+
+
+def read_edge_chunks(path: str, chunksize: int = 100_000, dtype: Dict[str, Any] = None) -> Iterator[pd.DataFrame]:
+	if file_format(path) == 'parquet':
+		import pyarrow.parquet as pq
+		for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+			yield batch.to_pandas()
+		return
+	yield from pd.read_csv(path, dtype=dtype, chunksize=chunksize)
+
+
+def read_edges(path: str, dtype: Dict[str, Any] = None) -> pd.DataFrame:
+	if file_format(path) == 'parquet':
+		return pd.read_parquet(path)
+	return pd.read_csv(path, dtype=dtype)
+
+
+def is_missing(value: Any) -> bool:
+	if isinstance(value, (list, tuple, np.ndarray)):
+		return False
+	return value is None or pd.isna(value)
+
+
+def parse_boolean(value: Any) -> Any:
+	if is_missing(value):
+		return None
+	if isinstance(value, str):
+		return value == 'True'
+	return bool(value)
+
+
+def parse_list(value: Any) -> Any:
+	# csv files hold lists as their python repr, parquet files as arrays
+	if is_missing(value):
+		return None
+	if isinstance(value, str):
+		try:
+			value = ast.literal_eval(value)
+		except (ValueError, SyntaxError):
+			return [value]
+	return list(value)
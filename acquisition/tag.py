@@ -1,49 +1,67 @@
-import time, os, json
-from typing import List, Dict, Any, Tuple
+import time, os, json, collections
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
 
 import asyncio, aiohttp, async_timeout
 import pandas as pd
-from asyncio.exceptions import InvalidStateError
 from urllib.parse import quote_plus
 from urllib3.exceptions import HTTPError
 
+from acquisition.metrics import instrument_request, metrics
+from acquisition.ratelimit import RateLimited, RateLimiter
+from acquisition.storage import file_format, read_vertex_chunks, read_vertices, write_vertices
+from acquisition.tag_tables import export_tag_tables
+from acquisition.track import AUDIO_FEATURES
+
+# last.fm error codes for rate limiting, and for failures that are worth retrying
+RATE_LIMIT_ERRORS = [29]
+TEMPORARY_ERRORS = [8, 11, 16]
+
 
 def main():
 	start_time = time.time()
+	lastfm_rate = float(os.environ.get("LASTFM_RATE", 5))
 	lastfm = LastFMClient(
 		client_id=os.environ["LASTFM_CLIENT_ID"],
-		client_secret=os.environ["LASTFM_CLIENT_SECRET"]
+		client_secret=os.environ["LASTFM_CLIENT_SECRET"],
+		limiter=RateLimiter(rate=lastfm_rate, max_rate=lastfm_rate * 2, classify=classify_lastfm_error)
 	)
 	
 	vertices_path = os.environ["VERTICES_PATH"]
 
-	final_vertices = []
-	tag = True
-	for vertices in pd.read_csv(vertices_path, chunksize=1000):
-		not_artists = vertices[vertices['node_type'] != 'artist']
-		if len(not_artists) > 0:
-			final_vertices.append(not_artists)
-
-		artists = vertices[vertices['node_type'] == 'artist']
-		if len(artists) > 0:
-			if tag:
-				res = asyncio.get_event_loop().run_until_complete(tag_artists(lastfm, artists))
-				if res:
-					print("rate limited; not tagging the rest of the artists")
-					tag = False
-			final_vertices.append(artists)
+	concurrency = int(os.environ.get("LASTFM_CONCURRENCY", 16))
+
+	output = PartialOutput(vertices_path)
+	if output.rows > 0:
+		print(f"Picking up after {output.rows} rows tagged by a previous run")
+
+	chunks = skip_rows(read_vertex_chunks(vertices_path, AUDIO_FEATURES, chunksize=1000), output.rows)
+	rate_limited = asyncio.get_event_loop().run_until_complete(tag_vertices(lastfm, chunks, concurrency, output.write))
+	if rate_limited:
+		print("rate limited after retrying; untagged artists will be picked up by the next run")
+	print(f"Rate limiter: {lastfm.limiter.stats()}")
 
+	output.finish()
+	export_tag_tables(vertices_path)
+	metrics.write(os.environ.get("METRICS_PATH", "metrics"))
 	print(f"Completed: {time.time() - start_time}")
-	pd.concat([df for df in final_vertices], ignore_index=True).to_csv(vertices_path, index=False)
 
 
 class LastFMClient:
-	def __init__(self, client_id: str, client_secret: str, base_url: str="https://ws.audioscrobbler.com/2.0/"):
+	def __init__(self, client_id: str, client_secret: str, base_url: str="https://ws.audioscrobbler.com/2.0/",
+				 limiter: RateLimiter = None):
 		self.client_id = client_id
 		self.client_secret = client_secret
 		self.base_url = base_url
+		self.limiter = limiter
 
 	async def get_top_tags(self, session: aiohttp.ClientSession, artist_index: int, artist_name: str) -> (int, Dict[str, Any]):
+		request = instrument_request('lastfm', 'artist.getTopTags', self.request_top_tags)
+		with metrics.timer('lastfm_call_seconds', endpoint='artist.getTopTags'):
+			if not self.limiter:
+				return await request(session, artist_index, artist_name)
+			return await self.limiter.call_async(request, session, artist_index, artist_name)
+
+	async def request_top_tags(self, session: aiohttp.ClientSession, artist_index: int, artist_name: str) -> (int, Dict[str, Any]):
 		params = {
 			'artist': artist_name,
 			'api_key': self.client_id,
@@ -55,6 +73,10 @@ class LastFMClient:
 		with async_timeout.timeout(5):
 			async with session.get(url) as resp:
 				try:
+					if resp.status == 429:
+						retry_after = resp.headers.get('Retry-After')
+						raise RateLimited("Rate limit exceeded", float(retry_after) if retry_after else None)
+
 					res = await resp.json()
 					if "toptags" in res:
 						tags = {}
@@ -64,8 +86,10 @@ class LastFMClient:
 						return artist_index, tags
 					if "error" in res:
 						message = res.get('message', res['error'])
-						if "Rate" in message:
+						if "Rate" in message or res['error'] in RATE_LIMIT_ERRORS:
 							raise RateLimited(message)
+						elif res['error'] in TEMPORARY_ERRORS:
+							raise TemporaryError(message)
 						else:
 							raise HTTPError(message)
 				except Exception as e:
@@ -74,53 +98,157 @@ class LastFMClient:
 		return artist_index, []
 
 
-class RateLimited(Exception):
+class TemporaryError(Exception):
 	pass
 
 
-async def tag_artists(lastfm: LastFMClient, artists: pd.DataFrame) -> str:
-	print(f"Adding tags for {len(artists)} artists")
-	tasks = []
+def classify_lastfm_error(e: Exception) -> Tuple[bool, bool, Union[float, None]]:
+	if isinstance(e, RateLimited):
+		return True, True, e.retry_after
+	return isinstance(e, (TemporaryError, aiohttp.ClientError, asyncio.TimeoutError)), False, None
+
+
+class PartialOutput:
+	# tagged chunks are appended to a temporary csv file next to the input, which replaces the input only once every
+	# chunk is written; the progress file records how much of it is complete, for a rerun to pick up from
+	def __init__(self, path: str):
+		self.path = path
+		self.partial_path = path + ".partial"
+		self.progress_path = path + ".partial.json"
+		self.source = source_signature(path)
+		self.rows = 0
+		self.size = 0
+		self.columns = None
+
+		if os.path.exists(self.progress_path) and os.path.exists(self.partial_path):
+			with open(self.progress_path) as f:
+				progress = json.load(f)
+			if progress['source'] == self.source:
+				self.rows = progress['rows']
+				self.size = progress['size']
+				self.columns = progress['columns']
+
+		# drop anything written after the last recorded chunk
+		with open(self.partial_path, "a+b") as f:
+			f.truncate(self.size)
+
+	def write(self, vertices: pd.DataFrame):
+		if self.columns is None:
+			self.columns = list(vertices.columns)
+
+		text = vertices.reindex(columns=self.columns).to_csv(index=False, header=self.size == 0).encode()
+		with open(self.partial_path, "ab") as f:
+			f.write(text)
+			f.flush()
+			os.fsync(f.fileno())
+		self.rows += len(vertices)
+		self.size += len(text)
+
+		with open(self.progress_path + ".tmp", "w") as f:
+			json.dump({'source': self.source, 'rows': self.rows, 'size': self.size, 'columns': self.columns}, f)
+		os.replace(self.progress_path + ".tmp", self.progress_path)
+
+	def finish(self):
+		if file_format(self.path) == 'parquet':
+			# parquet files can't be appended to, so the tagged rows are converted once they are all written
+			write_vertices(read_vertices(self.partial_path, AUDIO_FEATURES), self.path + ".tmp.parquet", AUDIO_FEATURES)
+			os.replace(self.path + ".tmp.parquet", self.path)
+			os.remove(self.partial_path)
+		else:
+			os.replace(self.partial_path, self.path)
+		os.remove(self.progress_path)
+
+
+def source_signature(path: str) -> List[int]:
+	stat = os.stat(path)
+	return [stat.st_size, stat.st_mtime_ns]
+
+
+def skip_rows(chunks: Iterable[pd.DataFrame], rows: int) -> Iterable[pd.DataFrame]:
+	for vertices in chunks:
+		if rows >= len(vertices):
+			rows -= len(vertices)
+			continue
+		yield vertices.iloc[rows:].copy()
+		rows = 0
+
+
+class TaggedChunk:
+	def __init__(self, vertices: pd.DataFrame):
+		if "tags" not in vertices.columns:
+			vertices["tags"] = None
+		self.vertices = vertices
+		self.tags = {}
+		self.remaining = 0
+
+	def untagged_artists(self) -> List[Tuple[int, str]]:
+		vertices = self.vertices
+		untagged = vertices[(vertices['node_type'] == 'artist') & vertices['tags'].isna()]
+		missing_names = untagged['name'].isna() | (untagged['name'] == '')
+		for index in untagged.index[missing_names]:
+			print(f"missing artist name at:\t{index}")
+		return list(zip(untagged.index[~missing_names], untagged['name'][~missing_names]))
+
+	def apply(self) -> pd.DataFrame:
+		if self.tags:
+			tags = pd.Series(self.tags, dtype=object)
+			self.vertices.loc[tags.index, 'tags'] = tags
+		return self.vertices
+
+
+async def tag_vertices(
+		lastfm: LastFMClient,
+		chunks: Iterable[pd.DataFrame],
+		concurrency: int,
+		on_chunk: Callable[[pd.DataFrame], None]
+) -> bool:
+	# chunks are handed to on_chunk in the order they were read, as soon as all of their artists are tagged;
+	# the bounded queue keeps the reader at most a couple of chunks ahead of the workers
+	queue = asyncio.Queue(maxsize=concurrency * 2)
+	pending = collections.deque()
 	rate_limited = False
 
-	if "tags" not in artists.columns:
-		artists["tags"] = pd.Series([None])
-
-	async with aiohttp.ClientSession() as session:
-		for index, row in artists.iterrows():
-			if pd.notna(row['tags']):
-				print(f"artist already tagged:\t{row['name']}")
-				continue
-			if 'name' not in row or not row['name']:
-				print(f"missing artist name at:\t{index}")
-				continue
-			else:
-				task = asyncio.ensure_future(lastfm.get_top_tags(session, index, row['name']))
-				tasks.append(task)
+	def emit_tagged_chunks():
+		while pending and pending[0].remaining <= 0:
+			on_chunk(pending.popleft().apply())
 
+	async def worker(session: aiohttp.ClientSession):
+		nonlocal rate_limited
+		while True:
+			chunk, artist_index, artist_name = await queue.get()
+			try:
+				_, tags = await lastfm.get_top_tags(session, artist_index, artist_name)
+				chunk.tags[artist_index] = json.dumps(tags if tags else {'none': 0})
+			except RateLimited as _:
+				# artists that still fail after the limiter's retries are left untagged for the next run
+				rate_limited = True
+			except Exception as e:
+				print(f"exception while tagging artist:\n{e}")
+			finally:
+				chunk.remaining -= 1
+				queue.task_done()
+
+	async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+		workers = [asyncio.ensure_future(worker(session)) for _ in range(concurrency)]
 		try:
-			await asyncio.gather(*tasks, return_exceptions=False)
-		except RateLimited as _:
-			rate_limited = True
-			for t in tasks:
-				if not task.done():
-					t.cancel()
-		except Exception as e:
-			print(f"exception while getting tags:\n{e}")
-
-	for task in tasks:
-		try:
-			if not task.cancelled():
-				artist_index, tags = task.result()
-				if tags and artist_index:
-					artists.loc[artist_index, 'tags'] = json.dumps(tags)
-				else:
-					artists.loc[artist_index, 'tags'] = json.dumps({'none': 0})
-		except (RateLimited, InvalidStateError) as _:
-			continue
-		except Exception as e:
-			print(f"exception while tagging artist:\n{e}")
+			for vertices in chunks:
+				chunk = TaggedChunk(vertices)
+				untagged_artists = chunk.untagged_artists()
+				print(f"Adding tags for {len(untagged_artists)} artists")
+
+				chunk.remaining = len(untagged_artists)
+				pending.append(chunk)
+				for artist_index, artist_name in untagged_artists:
+					await queue.put((chunk, artist_index, artist_name))
+				emit_tagged_chunks()
+
+			await queue.join()
+		finally:
+			for task in workers:
+				task.cancel()
+			await asyncio.gather(*workers, return_exceptions=True)
 
+	emit_tagged_chunks()
 	return rate_limited
 
 
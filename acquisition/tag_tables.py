@@ -0,0 +1,88 @@
+import itertools
+import json
+import os
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+from acquisition.storage import read_vertex_chunks
+
+
+def main():
+	export_tag_tables(os.environ["VERTICES_PATH"])
+
+
+def export_tag_tables(vertices_path: str):
+	directory = os.environ.get("TAGS_PATH") or os.path.join(os.path.dirname(vertices_path), "tags")
+	tables = normalize_tags(read_artist_tags(vertices_path))
+	write_tag_tables(directory, tables)
+	print(f"Wrote {len(tables['artist_tags'])} tags of {len(tables['artists'])} artists "
+		  f"over {len(tables['tags'])} distinct tags to {directory}")
+
+
+def read_artist_tags(path: str, chunksize: int = 100_000) -> pd.DataFrame:
+	frames = [
+		explode_tags(vertices[(vertices['node_type'] == 'artist') & vertices['tags'].notna()])
+		for vertices in read_vertex_chunks(path, [], chunksize=chunksize, columns=['id', 'node_type', 'tags'])
+	]
+	if not frames:
+		return pd.DataFrame({'artist_id': [], 'tag': [], 'count': []})
+	return pd.concat(frames, ignore_index=True)
+
+
+def explode_tags(artists: pd.DataFrame) -> pd.DataFrame:
+	# one (artist, tag, count) row per entry of each artist's tags, which the tagger stores as a JSON object
+	tags = [json.loads(text) for text in artists['tags']]
+	pairs = pd.DataFrame({
+		'artist_id': np.repeat(artists['id'].to_numpy(), [len(t) for t in tags]),
+		'tag': list(itertools.chain.from_iterable(tags)),
+		'count': pd.to_numeric(list(itertools.chain.from_iterable(t.values() for t in tags)), errors='coerce'),
+	})
+	# artists Last.fm has no tags for are marked {"none": 0}, so they aren't looked up again
+	return pairs[~((pairs['tag'] == 'none') & (pairs['count'] == 0))]
+
+
+def normalize_tags(pairs: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+	tag_ids, tags = pd.factorize(pairs['tag'], sort=True)
+	artist_ids = pairs['artist_id'].unique()
+	return {
+		'artist_tags': pd.DataFrame({
+			'artist_id': pairs['artist_id'].to_numpy(),
+			'tag_id': tag_ids,
+			'count': pairs['count'].fillna(0).to_numpy()
+		}),
+		'tags': pd.DataFrame({
+			'tag_id': np.arange(len(tags)),
+			'tag': np.asarray(tags),
+			'artists': np.bincount(tag_ids, minlength=len(tags))
+		}),
+		'artists': pd.DataFrame({'row': np.arange(len(artist_ids)), 'artist_id': np.asarray(artist_ids)}),
+	}
+
+
+def write_tag_tables(directory: str, tables: Dict[str, pd.DataFrame]):
+	os.makedirs(directory, exist_ok=True)
+	for name in ('artist_tags', 'tags', 'artists'):
+		tables[name].to_csv(os.path.join(directory, f"{name}.csv"), index=False)
+
+	# laid out like scipy.sparse.save_npz, so scipy.sparse.load_npz reads it back as an artist x tag coo_matrix
+	artist_tags = tables['artist_tags']
+	rows = pd.Index(tables['artists']['artist_id']).get_indexer(artist_tags['artist_id'])
+	shape = (len(tables['artists']), len(tables['tags']))
+	write_sparse(os.path.join(directory, "artist_tags.npz"), rows, artist_tags['tag_id'], artist_tags['count'], shape)
+
+
+def write_sparse(path: str, rows: Iterable[int], cols: Iterable[int], data: Iterable[float], shape: tuple):
+	np.savez(
+		path,
+		format=np.array(b'coo'),
+		shape=np.array(shape, dtype=np.int64),
+		row=np.asarray(rows, dtype=np.int32),
+		col=np.asarray(cols, dtype=np.int32),
+		data=np.asarray(data, dtype=np.float32)
+	)
+
+
+if __name__ == '__main__':
+	main()
@@ -1,20 +1,68 @@
-from typing import Any, Dict
+import math
+import sys
+from array import array
+from types import MappingProxyType
+from typing import Any, Dict, Mapping
+
+# audio features are kept in a fixed-layout float array rather than in each track's attr dict
+AUDIO_FEATURES = (
+	"danceability", "energy", "key", "loudness", "mode", "speechiness", "acousticness", "instrumentalness",
+	"liveness", "valence", "tempo", "duration_ms", "time_signature"
+)
+AUDIO_FEATURE_INDEX = {name: i for i, name in enumerate(AUDIO_FEATURES)}
 
 
 class Track:
-	def __init__(self, name: str, track_id: str, album: str, album_type: str, attr: Dict[str, Any] = None):
-		self.attr = {}
-		if attr:
-			self.attr = attr
+	__slots__ = ('id', 'name', 'album', 'album_type', 'features', 'other_attr')
+	node_type = 'track'
 
+	def __init__(self, name: str, track_id: str, album: str, album_type: str, attr: Dict[str, Any] = None):
 		self.id = track_id
 		self.name = name
 		self.album = album
-		self.album_type = album_type
-		self.node_type = 'track'
+		self.album_type = sys.intern(album_type) if isinstance(album_type, str) else album_type
+		self.set_attrs(attr or {})
+
+	@property
+	def attr(self) -> Mapping[str, Any]:
+		# unpacked on every access, so it is read-only: changes go through attr = ... or set_attrs
+		return MappingProxyType(self.attr_dict())
+
+	def attr_dict(self) -> Dict[str, Any]:
+		attr = dict(self.other_attr) if self.other_attr else {}
+		if self.features is not None:
+			for name, value in zip(AUDIO_FEATURES, self.features):
+				if not math.isnan(value):
+					attr[name] = value
+		return attr
+
+	@attr.setter
+	def attr(self, attrs: Dict[str, Any]):
+		self.set_attrs(attrs)
 
 	def set_attrs(self, attrs: Dict[str, Any]):
-		self.attr = attrs
+		features = None
+		other_attr = {}
+		for name, value in attrs.items():
+			if name in AUDIO_FEATURE_INDEX and isinstance(value, (int, float)) and not isinstance(value, bool):
+				if features is None:
+					features = array('d', [math.nan]) * len(AUDIO_FEATURES)
+				features[AUDIO_FEATURE_INDEX[name]] = value
+			else:
+				other_attr[name] = value
+
+		self.features = features
+		self.other_attr = other_attr or None
+
+	def to_dict(self) -> Dict[str, Any]:
+		return {
+			'attr': self.attr_dict(),
+			'id': self.id,
+			'name': self.name,
+			'album': self.album,
+			'album_type': self.album_type,
+			'node_type': self.node_type
+		}
 
 	def __eq__(self, other):
 		return self.id == other.id \
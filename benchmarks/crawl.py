@@ -0,0 +1,123 @@
+import argparse
+import contextlib
+import json
+import os
+import resource
+import sys
+import time
+
+from acquisition.__main__ import crawl_playlists, crawl_prioritized
+from acquisition.graph import GRAPH_BACKENDS, create_graph
+from acquisition.network import Network, classify_spotify_error
+from acquisition.ratelimit import RateLimiter
+from acquisition.scheduler import Budget, Frontier, parse_score
+from acquisition.track import AUDIO_FEATURES
+from benchmarks.fake_spotify import FakeSpotify
+
+# metrics where a bigger number is a regression
+LOWER_IS_BETTER = ('calls_per_artist', 'peak_rss_mib')
+
+
+def run(args: argparse.Namespace) -> dict:
+	spotify = FakeSpotify(
+		artists=args.artists,
+		tracks_per_artist=args.tracks_per_artist,
+		related_per_artist=args.related_per_artist,
+		latency=args.latency,
+		failure_rate=args.failure_rate,
+		rate_limit_rate=args.rate_limit_rate,
+		retry_after=args.retry_after,
+		seed=args.seed
+	)
+	# the same limiter settings as acquisition.__main__.build_network
+	limiter = RateLimiter(rate=args.rate, max_rate=args.rate * 2, classify=classify_spotify_error)
+	network = Network(spotify=spotify, audio_features=AUDIO_FEATURES, max_tracks=50,
+					  graph=create_graph(args.backend), limiter=limiter, page_workers=args.page_workers)
+	playlist_names = [(f"playlist {i}", f"playlist-{i}-{args.playlist_tracks}") for i in range(args.playlists)]
+
+	start_time = time.time()
+	# the crawler reports on every artist; only the summary below is of interest here
+	with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+		if args.schedule == 'priority':
+			frontier = Frontier(network.graph, parse_score(args.score), args.max_distance)
+			crawl_prioritized(network, playlist_names, args.workers, frontier, Budget(args.max_calls))
+		else:
+			crawl_playlists(network, playlist_names, args.workers)
+	elapsed = time.time() - start_time
+
+	stats = spotify.stats()
+	# each crawled artist asks for its related artists exactly once
+	artists = stats['successes'].get('artist_related_artists', 0)
+	calls = sum(stats['calls'].values())
+	return {
+		'artists': artists,
+		'seconds': elapsed,
+		'artists_per_second': artists / elapsed if elapsed else 0.0,
+		'calls': calls,
+		'calls_per_artist': calls / artists if artists else 0.0,
+		'calls_by_endpoint': stats['calls'],
+		'nodes': len(network.graph.nodes),
+		'edges': len(network.graph.edges),
+		'limiter': limiter.stats(),
+		'peak_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+	}
+
+
+def regressions(result: dict, baseline: dict, tolerance: float) -> list:
+	found = []
+	if result['artists_per_second'] < baseline['artists_per_second'] * (1 - tolerance):
+		found.append('artists_per_second')
+	for name in LOWER_IS_BETTER:
+		if result[name] > baseline[name] * (1 + tolerance):
+			found.append(name)
+	return found
+
+
+def main():
+	parser = argparse.ArgumentParser(description="crawl a synthetic catalogue through a fake Spotify client")
+	parser.add_argument("--artists", type=int, default=10_000)
+	parser.add_argument("--tracks-per-artist", type=int, default=10)
+	parser.add_argument("--related-per-artist", type=int, default=10)
+	parser.add_argument("--playlists", type=int, default=2)
+	parser.add_argument("--playlist-tracks", type=int, default=50)
+	parser.add_argument("--latency", type=float, default=0.02, help="mean seconds per request")
+	parser.add_argument("--failure-rate", type=float, default=0.01, help="share of requests answered with a 500")
+	parser.add_argument("--rate-limit-rate", type=float, default=0.005, help="share of requests answered with a 429")
+	parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After seconds sent with each 429")
+	parser.add_argument("--rate", type=float, default=200, help="requests per second allowed by the rate limiter")
+	parser.add_argument("--workers", type=int, default=8)
+	parser.add_argument("--page-workers", type=int, default=4)
+	parser.add_argument("--backend", choices=list(GRAPH_BACKENDS), default='networkx')
+	parser.add_argument("--schedule", choices=['depth', 'priority'], default='depth')
+	parser.add_argument("--score", default="popularity,degree:10,distance:25")
+	parser.add_argument("--max-calls", type=int)
+	parser.add_argument("--max-distance", type=int, default=2)
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--output", help="write the results as JSON to this path")
+	parser.add_argument("--baseline", help="compare against results previously written with --output")
+	parser.add_argument("--tolerance", type=float, default=0.1)
+	args = parser.parse_args()
+
+	result = run(args)
+	print(f"Crawled {result['artists']} artists in {result['seconds']:.2f}s "
+		  f"({result['artists_per_second']:.1f} artists/s, {result['calls_per_artist']:.2f} calls/artist, "
+		  f"peak RSS {result['peak_rss_mib']:.1f} MiB)")
+	print(f"Graph has {result['nodes']} nodes and {result['edges']} edges")
+	print(f"Calls: {result['calls_by_endpoint']}")
+	print(f"Rate limiter: {result['limiter']}")
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(result, f, indent=2)
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			found = regressions(result, json.load(f), args.tolerance)
+		if found:
+			print(f"Regressed against {args.baseline}: {', '.join(found)}")
+			sys.exit(1)
+		print(f"No regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+	main()
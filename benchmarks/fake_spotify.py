@@ -0,0 +1,160 @@
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+from spotipy.exceptions import SpotifyException
+
+from acquisition.track import AUDIO_FEATURES
+
+GENRES = [f"genre {i}" for i in range(200)]
+
+
+class FakeSpotify:
+	# stands in for spotipy.Spotify with a synthetic catalogue: every artist has its own tracks, some featuring
+	# another artist, and related artists drawn mostly from its neighbourhood so the crawl finds clusters
+	def __init__(
+			self,
+			artists: int = 10_000,
+			tracks_per_artist: int = 10,
+			related_per_artist: int = 10,
+			search_filler: int = 50,
+			latency: float = 0.0,
+			failure_rate: float = 0.0,
+			rate_limit_rate: float = 0.0,
+			retry_after: float = 0.05,
+			seed: int = 0
+	):
+		self.latency = latency
+		self.failure_rate = failure_rate
+		self.rate_limit_rate = rate_limit_rate
+		self.retry_after = retry_after
+		self.search_filler = search_filler
+
+		self.rng = random.Random(seed)
+		self.lock = threading.Lock()
+		self.calls = Counter()
+		self.successes = Counter()
+
+		rng = random.Random(seed)
+		self.artist_responses = [
+			{
+				'id': f"a{i:021d}",
+				'name': f"artist {i}",
+				'popularity': rng.randint(0, 100),
+				'genres': rng.sample(GENRES, rng.randint(0, 4))
+			}
+			for i in range(artists)
+		]
+		self.artist_index = {artist['id']: i for i, artist in enumerate(self.artist_responses)}
+		self.name_index = {artist['name']: i for i, artist in enumerate(self.artist_responses)}
+
+		self.tracks = []
+		self.catalogues = [[] for _ in range(artists)]
+		for i in range(artists):
+			for j in range(tracks_per_artist):
+				credits = [i]
+				if rng.random() < 0.3:
+					credits.append(self.neighbour(rng, i))
+				track = {
+					'id': f"t{len(self.tracks):021d}",
+					'name': f"track {i}-{j}",
+					'album': {'name': f"album {i}-{j // 5}", 'album_type': 'album' if j < 5 else 'single'},
+					'artists': credits
+				}
+				self.tracks.append(track)
+				for credit in credits:
+					self.catalogues[credit].append(len(self.tracks) - 1)
+
+		self.related = [
+			list(dict.fromkeys(self.neighbour(rng, i) for _ in range(related_per_artist)))
+			for i in range(artists)
+		]
+
+	def neighbour(self, rng: random.Random, i: int) -> int:
+		if rng.random() < 0.8:
+			return (i + rng.randint(1, 50)) % len(self.artist_responses)
+		return rng.randrange(len(self.artist_responses))
+
+	def playlist_entries(self, playlist_id: str) -> List[int]:
+		rng = random.Random(playlist_id)
+		return [rng.randrange(len(self.tracks)) for _ in range(int(playlist_id.split('-')[-1]))]
+
+	def respond(self, endpoint: str):
+		with self.lock:
+			self.calls[endpoint] += 1
+			roll = self.rng.random()
+			delay = self.rng.uniform(0.5, 1.5) * self.latency
+
+		if delay > 0:
+			time.sleep(delay)
+		if roll < self.rate_limit_rate:
+			raise SpotifyException(429, -1, f"{endpoint}: rate limited", headers={'Retry-After': self.retry_after})
+		if roll < self.rate_limit_rate + self.failure_rate:
+			raise SpotifyException(500, -1, f"{endpoint}: server error")
+
+		with self.lock:
+			self.successes[endpoint] += 1
+
+	def artist_response(self, i: int) -> Dict[str, Any]:
+		return self.artist_responses[i]
+
+	def track_response(self, t: int) -> Dict[str, Any]:
+		track = self.tracks[t]
+		return {**track, 'artists': [self.artist_response(i) for i in track['artists']]}
+
+	def search(self, q: str, limit: int = 10, offset: int = 0, type: str = 'track', market: str = None):
+		self.respond('search')
+		# the artist's own catalogue comes first, then tracks that only mention the name in passing
+		catalogue = self.catalogues[self.name_index[q]] if q in self.name_index else []
+		filler = [(self.name_index.get(q, 0) + k * 7919) % len(self.tracks) for k in range(self.search_filler)]
+		results = catalogue + filler
+		return {'tracks': {
+			'items': [self.track_response(t) for t in results[offset:offset + limit]],
+			'total': len(results),
+			'limit': limit,
+			'offset': offset
+		}}
+
+	def artist_top_tracks(self, artist_id: str, country: str = 'US'):
+		self.respond('artist_top_tracks')
+		return {'tracks': [self.track_response(t) for t in self.catalogues[self.artist_index[artist_id]][:10]]}
+
+	def artist_related_artists(self, artist_id: str):
+		self.respond('artist_related_artists')
+		return {'artists': [self.artist_response(i) for i in self.related[self.artist_index[artist_id]]]}
+
+	def artists(self, artists: List[str]):
+		self.respond('artists')
+		return {'artists': [
+			self.artist_response(self.artist_index[artist_id]) if artist_id in self.artist_index else None
+			for artist_id in artists
+		]}
+
+	def audio_features(self, tracks: List[str] = []):
+		self.respond('audio_features')
+		return [
+			{'id': track_id, **{name: (int(track_id[1:]) % (k + 7)) / (k + 7) for k, name in enumerate(AUDIO_FEATURES)}}
+			for track_id in tracks
+		]
+
+	def playlist(self, playlist_id: str, fields: str = None, market: str = None):
+		self.respond('playlist')
+		entries = self.playlist_entries(playlist_id)
+		# like the real endpoint, the playlist comes with its first page of tracks
+		return {'id': playlist_id, 'name': playlist_id, 'tracks': {
+			'items': [{'track': self.track_response(t)} for t in entries[:100]],
+			'total': len(entries),
+			'limit': 100,
+			'offset': 0
+		}}
+
+	def playlist_tracks(self, playlist_id: str, fields: str = None, limit: int = 100, offset: int = 0,
+						market: str = None):
+		self.respond('playlist_tracks')
+		entries = self.playlist_entries(playlist_id)[offset:offset + limit]
+		return {'items': [{'track': self.track_response(t)} for t in entries]}
+
+	def stats(self) -> Dict[str, Any]:
+		return {'calls': dict(self.calls), 'successes': dict(self.successes)}
@@ -0,0 +1,65 @@
+import argparse
+import time
+from unittest.mock import Mock
+
+import numpy as np
+import pandas as pd
+
+from acquisition.graph import GRAPH_BACKENDS
+from acquisition.network import Network
+
+AUDIO_FEATURES = [
+	"danceability", "energy", "key", "loudness", "mode", "speechiness", "acousticness", "instrumentalness",
+	"liveness", "valence", "tempo", "duration_ms", "time_signature"
+]
+
+
+def synthetic_graph(nodes: int, artist_ratio: float = 0.2, seed: int = 0) -> (pd.DataFrame, pd.DataFrame):
+	rng = np.random.default_rng(seed)
+	artists = int(nodes * artist_ratio)
+	tracks = nodes - artists
+
+	track_ids = [f"t{i}" for i in range(tracks)]
+	artist_ids = [f"a{i}" for i in range(artists)]
+	vertices = pd.DataFrame({
+		'id': track_ids + artist_ids,
+		'name': [f"track {i}" for i in range(tracks)] + [f"artist {i}" for i in range(artists)],
+		'album': [f"album {i // 10}" for i in range(tracks)] + [None] * artists,
+		'album_type': ['album'] * tracks + [None] * artists,
+		'node_type': ['track'] * tracks + ['artist'] * artists,
+	})
+	for name in AUDIO_FEATURES:
+		vertices[f"attr.{name}"] = np.concatenate([rng.random(tracks), np.full(artists, np.nan)])
+	vertices['attr.popularity'] = np.concatenate([np.full(tracks, np.nan), rng.integers(0, 100, artists)])
+	vertices['seen'] = [None] * tracks + (rng.random(artists) < 0.5).tolist()
+
+	# every track has a main artist and, now and then, a featured one
+	sources = np.arange(tracks)
+	featured = sources[rng.random(tracks) < 0.3]
+	edges = pd.DataFrame({
+		'source': [track_ids[i] for i in np.concatenate([sources, featured])],
+		'target': [artist_ids[i] for i in rng.integers(0, artists, tracks + len(featured))],
+	})
+	return vertices, edges
+
+
+def main():
+	parser = argparse.ArgumentParser(description="time Network.from_dataframe on a synthetic graph")
+	parser.add_argument("--nodes", type=int, default=1_000_000)
+	parser.add_argument("--backend", choices=list(GRAPH_BACKENDS), default='networkx')
+	args = parser.parse_args()
+
+	vertices, edges = synthetic_graph(args.nodes)
+	print(f"Loading {len(vertices)} vertices and {len(edges)} edges")
+
+	start_time = time.time()
+	network = Network.from_dataframe(spotify=Mock(), audio_features=AUDIO_FEATURES, max_tracks=50,
+									 vertices=vertices, edges=edges, backend=args.backend)
+	elapsed = time.time() - start_time
+
+	print(f"Loaded {len(network.graph.nodes)} nodes and {len(network.graph.edges)} edges in {elapsed:.2f}s "
+		  f"({len(vertices) / elapsed:.0f} vertices/s)")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,51 @@
+import argparse
+import random
+import tracemalloc
+
+from acquisition.artist import Artist
+from acquisition.graph import GRAPH_BACKENDS, Graph, create_graph
+from acquisition.track import AUDIO_FEATURES, Track
+
+GENRES = [f"genre {i}" for i in range(300)]
+
+
+def build_graph(tracks: int, backend: str = 'networkx', seed: int = 0) -> Graph:
+	rng = random.Random(seed)
+	artists = max(tracks // 4, 1)
+	artist_genres = [rng.sample(GENRES, rng.randint(0, 5)) for _ in range(min(artists, 2000))]
+
+	graph = create_graph(backend)
+	for i in range(tracks):
+		track = Track(track_id=f"t{i:021d}", name=f"track {i}", album=f"album {i // 10}", album_type="album")
+		track.set_attrs({name: rng.random() for name in AUDIO_FEATURES})
+
+		artist_ids = [rng.randrange(artists) for _ in range(rng.choice([1, 1, 2]))]
+		graph.put_track(track, [
+			Artist(artist_id=f"a{a:021d}", name=f"artist {a}", attr={
+				'popularity': a % 100,
+				# responses come back with fresh lists and strings every time
+				'genres': [''.join(genre) for genre in artist_genres[a % len(artist_genres)]]
+			})
+			for a in artist_ids
+		])
+	return graph
+
+
+def main():
+	parser = argparse.ArgumentParser(description="measure graph memory per node")
+	parser.add_argument("--tracks", type=int, default=200_000)
+	parser.add_argument("--backend", choices=list(GRAPH_BACKENDS), default='networkx')
+	args = parser.parse_args()
+
+	tracemalloc.start()
+	graph = build_graph(args.tracks, args.backend)
+	current, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	nodes = len(graph.nodes)
+	print(f"{nodes} nodes and {len(graph.edges)} edges use {current / 2 ** 20:.1f} MiB "
+		  f"({current / nodes:.0f} bytes per node, peak {peak / 2 ** 20:.1f} MiB)")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,62 @@
+from unittest.mock import Mock
+
+import pytest
+
+from acquisition.network import Network
+
+
+def artist_response(i):
+    return {"id": f"a{i}", "name": f"artist {i}", "popularity": i, "genres": []}
+
+
+def top_tracks(artist_id):
+    i = int(artist_id[1:])
+    return {
+        "tracks": [
+            {
+                "id": f"t{i}-{j}",
+                "name": f"track {i}-{j}",
+                "album": {"name": f"album {i}", "album_type": "album"},
+                "artists": [artist_response(i), artist_response((i * 7 + j) % 40)]
+            }
+            for j in range(3)
+        ]
+    }
+
+
+def related_artists(artist_id):
+    i = int(artist_id[1:])
+    return {"artists": [artist_response((i * 3 + j) % 40) for j in range(4)]}
+
+
+def make_spotify(crash_after=None):
+    # a catalogue of 40 artists with three tracks each; after crash_after top tracks requests, the process "dies"
+    calls = []
+
+    def crashing_top_tracks(artist_id):
+        calls.append(artist_id)
+        if crash_after is not None and len(calls) > crash_after:
+            raise KeyboardInterrupt("container restarted")
+        return top_tracks(artist_id)
+
+    spotify = Mock()
+    spotify.search.return_value = {"tracks": {"items": [], "total": 0}}
+    spotify.artist_top_tracks.side_effect = crashing_top_tracks
+    spotify.artist_related_artists.side_effect = related_artists
+    spotify.audio_features.side_effect = lambda ids: [{"id": i, "a": 1.0} for i in ids]
+    spotify.artists.side_effect = lambda ids: {
+        "artists": [{**artist_response(int(i[1:])), "popularity": 99} for i in ids]
+    }
+    return spotify
+
+
+@pytest.fixture
+def fake_spotify():
+    return make_spotify
+
+
+@pytest.fixture
+def fake_network():
+    def make(crash_after=None):
+        return Network(audio_features=["a"], max_tracks=10, spotify=make_spotify(crash_after))
+    return make
@@ -26,3 +26,13 @@ class TestArtist:
         a = Artist(artist_id="123", name="the beatles")
         b = Artist(artist_id="123", name="The Beatles")
         assert a != b
+
+    def test_shared_genres(self):
+        attr = {"genres": ["rock", "pop"]}
+        a = Artist(artist_id="123", name="the beatles", attr=attr)
+        b = Artist(artist_id="456", name="the kinks", attr={"genres": ["rock", "pop"]})
+        assert a.attr["genres"] is b.attr["genres"]
+        assert ("rock", "pop") == a.attr["genres"]
+        assert {"genres": ["rock", "pop"]} == attr
+        assert a.to_dict() == {"attr": {"genres": ("rock", "pop")}, "id": "123", "name": "the beatles",
+                               "node_type": "artist"}
@@ -0,0 +1,40 @@
+from pandas import DataFrame
+
+from acquisition.artist_graph import ArtistGraph, from_track_edges
+
+
+class TestArtistGraph:
+    def test_pairs_are_undirected(self):
+        artist_graph = ArtistGraph()
+        artist_graph.add_collaboration(["a", "b", "c", "a"])
+        artist_graph.add_collaboration(["c", "b"])
+        artist_graph.add_related("c", ["a", "c"])
+
+        assert {"b": 1, "c": 1} == artist_graph.collaborators("a")
+        assert 2 == artist_graph.collaborators("b")["c"]
+        assert ["a"] == artist_graph.related("c")
+        assert ["c"] == artist_graph.related("a")
+        assert 0 == artist_graph.degree("d")
+
+        expected = [("a", "b", 1, False), ("a", "c", 1, True), ("b", "c", 2, False)]
+        assert expected == sorted(artist_graph.to_dataframe().itertuples(index=False, name=None))
+        assert expected == sorted(artist_graph.pop_changes().itertuples(index=False, name=None))
+        assert 0 == len(artist_graph.pop_changes())
+
+    def test_load(self):
+        artist_graph = ArtistGraph()
+        artist_graph.load(DataFrame({
+            "source": ["a"], "target": ["b"], "collaborations": [3], "related": [True]
+        }))
+        assert (3, True) == artist_graph.neighbours("b")["a"]
+
+    def test_from_track_edges(self):
+        edges = DataFrame({
+            "source": ["t1", "t1", "t2", "t3", "t3", "t3"],
+            "target": ["a", "b", "a", "a", "b", "c"],
+        })
+        artist_graph = from_track_edges(edges)
+        assert {"b": 2, "c": 1} == artist_graph.collaborators("a")
+        assert 3 == len(artist_graph)
+        # rebuilt pairs were already written with the graph they came from
+        assert 0 == len(artist_graph.pop_changes())
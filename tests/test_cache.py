@@ -0,0 +1,85 @@
+import time
+from unittest.mock import Mock
+
+from acquisition.artist import Artist
+from acquisition.cache import ResponseCache
+from acquisition.network import Network
+
+
+class TestResponseCache:
+    def test_get_put(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache.db"))
+        params = cache.key(("0001",), {})
+
+        assert (False, None, None) == cache.get("artist_top_tracks", params)
+        fetched = time.time() - 60
+        cache.put("artist_top_tracks", params, {"tracks": []}, fetched)
+        assert (True, {"tracks": []}, fetched) == cache.get("artist_top_tracks", params)
+        assert 1 == cache.hits
+        assert 1 == cache.misses
+
+    def test_ttl(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache.db"), ttls={"search": 0.01})
+        params = cache.key(("Noname",), {"type": "track"})
+
+        cache.put("search", params, {"tracks": {"items": []}})
+        time.sleep(0.02)
+        assert (False, None, None) == cache.get("search", params)
+
+    def test_cap_ttls(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache.db"))
+        cache.cap_ttls(0.01)
+        params = cache.key(("0001",), {})
+
+        cache.put("artist_top_tracks", params, {"tracks": []})
+        time.sleep(0.02)
+        assert (False, None, None) == cache.get("artist_top_tracks", params)
+        assert 0.01 == cache.default_ttl
+
+    def test_eviction(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache.db"), max_size=30)
+        cache.put("artist_top_tracks", cache.key(("0001",), {}), {"tracks": ["000"]})
+        cache.put("artist_top_tracks", cache.key(("0002",), {}), {"tracks": ["111"]})
+
+        # least recently used response is evicted to stay under the size limit
+        assert 1 == cache.evictions
+        assert not cache.get("artist_top_tracks", cache.key(("0001",), {}))[0]
+        assert cache.get("artist_top_tracks", cache.key(("0002",), {}))[0]
+
+    def test_persistent(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+        cache = ResponseCache(path)
+        cache.put("audio_features", cache.key(({"000": True}.keys(),), {}), [{"id": "000"}])
+        cache.close()
+
+        cache = ResponseCache(path)
+        assert (True, [{"id": "000"}]) == cache.get("audio_features", cache.key((["000"],), {}))[:2]
+
+
+class TestNetworkCache:
+    def test_cached_call(self, tmp_path):
+        network = Network(audio_features=["a", "b"], max_tracks=10, spotify=Mock(),
+                          cache=ResponseCache(str(tmp_path / "cache.db")))
+        network.spotify.artist_related_artists.return_value = {"artists": [{"id": "0002", "name": "Cam O'bi"}]}
+
+        expected = [Artist(artist_id="0002", name="Cam O'bi")]
+        assert expected == network.get_related_artists(Artist(artist_id="0001", name="Noname"))
+        assert expected == network.get_related_artists(Artist(artist_id="0001", name="Noname"))
+        network.spotify.artist_related_artists.assert_called_once_with("0001")
+
+    def test_cached_fetch_time(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache.db"))
+        network = Network(audio_features=["a", "b"], max_tracks=10, spotify=Mock(), cache=cache)
+        network.spotify.artist_related_artists.return_value = {"artists": []}
+        fetched = time.time() - 3600
+        cache.put("artist_related_artists", cache.key(("0001",), {}), {"artists": []}, fetched)
+
+        # a cached response is as old as the request that fetched it
+        artist = Artist(artist_id="0001", name="Noname")
+        network.get_related_artists(artist)
+        assert fetched == artist.attr["fetched_artist_related_artists"]
+        network.spotify.artist_related_artists.assert_not_called()
+
+        artist = Artist(artist_id="0002", name="Cam O'bi")
+        network.get_related_artists(artist)
+        assert time.time() - artist.attr["fetched_artist_related_artists"] < 60
@@ -0,0 +1,90 @@
+import pytest
+
+from acquisition.__main__ import add_artists, crawl_layer, crawl_prioritized
+from acquisition.artist import Artist
+from acquisition.checkpoint import Checkpoint
+from acquisition.network import Network
+from acquisition.scheduler import Budget, Frontier, parse_score
+from acquisition.snapshot import SnapshotWriter
+
+
+def sorted_frames(graph):
+    vertices, edges = graph.to_dataframe()
+    vertices = vertices.sort_values("id").reset_index(drop=True)
+    edges = edges.sort_values(["source", "target"]).reset_index(drop=True)
+    return vertices, edges
+
+
+class TestCheckpoint:
+    @pytest.mark.parametrize("crash_after,depth", [(5, 1), (10, 2)])
+    def test_resume_matches_uninterrupted_crawl(self, tmp_path, fake_spotify, fake_network, crash_after, depth):
+        seeds = [Artist(artist_id=f"a{i}", name=f"artist {i}") for i in range(3)]
+
+        expected = fake_network()
+        add_artists(expected, seeds, 0, 3)
+
+        # crawl until the process dies partway through the second layer
+        crashed = fake_network(crash_after=crash_after)
+        checkpoint = Checkpoint(SnapshotWriter(str(tmp_path)), interval=2)
+        checkpoint.start_playlist(0, "seeds")
+        with pytest.raises(KeyboardInterrupt):
+            add_artists(crashed, seeds, 0, 3, checkpoint=checkpoint)
+
+        # resume from what was written to disk
+        writer = SnapshotWriter(str(tmp_path))
+        checkpoint = Checkpoint(writer, interval=2)
+        state = checkpoint.load()
+        assert depth == state["depth"]
+
+        vertices, edges = writer.read()
+        resumed = Network.from_dataframe(spotify=fake_spotify(), audio_features=["a"], max_tracks=10,
+                                         vertices=vertices, edges=edges)
+        checkpoint.start_playlist(state["playlist"], state["name"])
+        crawl_layer(resumed, state["frontier"], state["next_frontier"], state["depth"], 3, checkpoint=checkpoint)
+
+        expected_vertices, expected_edges = sorted_frames(expected.graph)
+        resumed_vertices, resumed_edges = sorted_frames(resumed.graph)
+        assert expected.graph.seen_artists == resumed.graph.seen_artists
+        assert expected_edges.equals(resumed_edges)
+        assert list(expected_vertices["id"]) == list(resumed_vertices["id"])
+        assert list(expected_vertices["attr.a"].fillna(0)) == list(resumed_vertices["attr.a"].fillna(0))
+
+    def test_finish_playlist(self, tmp_path, fake_network):
+        network = fake_network()
+        checkpoint = Checkpoint(SnapshotWriter(str(tmp_path)), interval=2)
+        checkpoint.start_playlist(4, "seeds")
+        add_artists(network, [Artist(artist_id="a1", name="artist 1")], 0, 1, checkpoint=checkpoint)
+        checkpoint.finish_playlist(network.graph)
+
+        state = Checkpoint(SnapshotWriter(str(tmp_path)), interval=2).load()
+        assert 5 == state["playlist"]
+        assert [] == state["frontier"] + state["next_frontier"]
+
+    def test_resume_priority_crawl(self, tmp_path, fake_spotify, fake_network):
+        seeds = [Artist(artist_id=f"a{i}", name=f"artist {i}", attr={"popularity": i}) for i in range(3)]
+
+        # crawl until the process dies partway through the budget
+        crashed = fake_network(crash_after=8)
+        checkpoint = Checkpoint(SnapshotWriter(str(tmp_path)), interval=2)
+        frontier = Frontier(crashed.graph, parse_score("popularity"))
+        with pytest.raises(KeyboardInterrupt):
+            crawl_prioritized(crashed, [], 1, frontier, Budget(max_calls=45), checkpoint,
+                              {"playlist": 0, "schedule": {"entries": [(a, 0) for a in seeds], "spent_calls": 0,
+                                                           "spent_seconds": 0.0}})
+
+        writer = SnapshotWriter(str(tmp_path))
+        state = Checkpoint(writer, interval=2).load()
+        assert 28 == state["schedule"]["spent_calls"]
+        assert all(isinstance(artist, Artist) for artist, _ in state["schedule"]["entries"])
+
+        # the resumed crawl only spends what is left of the budget
+        vertices, edges = writer.read()
+        resumed = Network.from_dataframe(spotify=fake_spotify(), audio_features=["a"], max_tracks=10,
+                                         vertices=vertices, edges=edges)
+        frontier = Frontier(resumed.graph, parse_score("popularity"))
+        crawl_prioritized(resumed, [], 1, frontier, Budget(max_calls=45), Checkpoint(writer, interval=2), state)
+        assert 17 <= resumed.requests <= 19
+
+        state = Checkpoint(writer, interval=2).load()
+        assert 1 == state["playlist"]
+        assert not state.get("schedule")
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from pandas import DataFrame
+
+from acquisition.features import FeatureMatrix, load_features
+from acquisition.graph import Graph
+from acquisition.snapshot import SnapshotWriter
+from acquisition.track import Track
+
+
+def vertices(ids, start=0.0):
+    return DataFrame({
+        "id": ids + ["0001"],
+        "node_type": ["track"] * len(ids) + ["artist"],
+        "attr.a": [start + i for i in range(len(ids))] + [None],
+        "attr.b": [None] * len(ids) + [None],
+    })
+
+
+class TestFeatureMatrix:
+    def test_append(self, tmp_path):
+        matrix = FeatureMatrix(str(tmp_path), ["a", "b"])
+        assert 2 == matrix.update(vertices(["000", "111"]))
+
+        # known tracks are overwritten in place, new ones appended after them
+        assert 1 == matrix.update(vertices(["111", "222"], start=10.0))
+
+        features, ids = load_features(str(tmp_path))
+        assert isinstance(features, np.memmap)
+        assert np.float32 == features.dtype
+        assert ["000", "111", "222"] == list(ids)
+        assert [0.0, 10.0, 11.0] == features[:, 0].tolist()
+        assert np.isnan(features[:, 1]).all()
+
+        # reopening keeps the same rows
+        matrix = FeatureMatrix(str(tmp_path), ["a", "b"])
+        assert {"000": 0, "111": 1, "222": 2} == matrix.index
+
+    def test_unfinished_append(self, tmp_path):
+        matrix = FeatureMatrix(str(tmp_path), ["a", "b"])
+        matrix.update(vertices(["000"]))
+
+        # rows and IDs written by an append that died before updating the header are dropped
+        with open(matrix.path, "ab") as f:
+            f.write(np.zeros(2, dtype=np.float32).tobytes())
+        with open(matrix.ids_path, "a") as f:
+            f.write("111\n")
+
+        matrix = FeatureMatrix(str(tmp_path), ["a", "b"])
+        assert 1 == len(matrix)
+        features, ids = load_features(str(tmp_path))
+        assert ["000"] == list(ids)
+        assert (1, 2) == features.shape
+
+    def test_missing_ids(self, tmp_path):
+        matrix = FeatureMatrix(str(tmp_path), ["a", "b"])
+        matrix.update(vertices(["000", "111"]))
+        with open(matrix.ids_path, "w") as f:
+            f.write("000\n")
+
+        with pytest.raises(ValueError):
+            load_features(str(tmp_path))
+        with pytest.raises(ValueError):
+            FeatureMatrix(str(tmp_path), ["a", "b"])
+
+    def test_columns_must_match(self, tmp_path):
+        FeatureMatrix(str(tmp_path), ["a", "b"])
+        with pytest.raises(ValueError):
+            FeatureMatrix(str(tmp_path), ["b", "a"])
+
+    def test_snapshot(self, tmp_path):
+        graph = Graph()
+        graph.add_track(Track(track_id="000", name="Diddy Bop", album="Telefone", album_type="album",
+                              attr={"a": 0.5}))
+        graph.add_track(Track(track_id="111", name="Yesterday", album="Telefone", album_type="album"))
+
+        writer = SnapshotWriter(str(tmp_path), audio_features=["a"], features=FeatureMatrix(str(tmp_path), ["a"]))
+        writer.flush(graph, "seeds")
+
+        features, ids = load_features(str(tmp_path))
+        assert ["000"] == list(ids)
+        assert [[0.5]] == features.tolist()
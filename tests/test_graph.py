@@ -1,8 +1,10 @@
+import copy
 import random
 
 from pandas import DataFrame
 
-from acquisition.graph import Graph
+from acquisition.graph import create_graph
+from acquisition.seen import SeenStore
 from acquisition.track import Track
 from acquisition.artist import Artist
 
@@ -31,8 +33,10 @@ tracks = [
 
 
 class TestGraph:
+    backend = 'networkx'
+
     def test_put_track(self):
-        graph = Graph()
+        graph = create_graph(self.backend)
         track, artists = tracks[0]
         nodes = ["000", "0001", "0002", "0003"]         # track ID and all artist IDs
         edges = [("000", "0001"), ("000", "0002"), ("000", "0003")]     # track has edge to each artist
@@ -66,7 +70,7 @@ class TestGraph:
             "target": ["0001", "0002", "0003", "0001", "0001", "2222", "2223"],
         })
 
-        graph = Graph()
+        graph = create_graph(self.backend)
         for track, artists in tracks:
             graph.put_track(track, artists)
 
@@ -78,7 +82,7 @@ class TestGraph:
 
     def test_unseen_artists(self):
         # setup
-        graph = Graph()
+        graph = create_graph(self.backend)
         for track, artists in tracks:
             graph.put_track(track, artists)
 
@@ -97,3 +101,164 @@ class TestGraph:
             Artist(artist_id="2222", name="Joseph Chilliams"),
             Artist(artist_id="2223", name="Ravyn Lenae")
         ]), key=lambda a: a.id)
+
+    def test_seen_artists(self):
+        # setup
+        graph = create_graph(self.backend)
+        for track, artists in tracks:
+            graph.put_track(track, artists)
+
+        # only artists put more than once are marked seen
+        assert {"0001"} == graph.seen_artists
+        assert graph.is_seen("0001")
+        assert not graph.is_seen("0002")
+
+        # explicitly adding an artist as seen or unseen keeps the index up to date
+        graph.add_artist(Artist(artist_id="0002", name="Cam O'bi"), seen=True)
+        assert graph.is_seen("0002")
+        graph.add_artist(Artist(artist_id="0002", name="Cam O'bi"), seen=False)
+        assert not graph.is_seen("0002")
+
+    def test_merge(self):
+        # setup: two shards crawled from the same base, each adding their own tracks
+        a = create_graph(self.backend)
+        a.put_track(*copy.deepcopy(tracks[0]))
+        a.put_track(*copy.deepcopy(tracks[1]))
+        a.clear_changes()
+
+        b = create_graph(self.backend)
+        b.put_track(*copy.deepcopy(tracks[2]))
+        b.add_artist(Artist(artist_id="0003", name="Raury", attr={"popularity": 60}), seen=True)
+        b.add_artist(Artist(artist_id="0001", name="Noname", attr={"popularity": None, "genres": ["rap"]}))
+
+        # run test
+        a.merge(b)
+
+        assert sorted(["000", "111", "222", "0001", "0002", "0003", "2222", "2223"]) == sorted(a.nodes)
+        assert sorted([("000", "0001"), ("000", "0002"), ("000", "0003"), ("111", "0001"), ("222", "0001"),
+                       ("222", "2222"), ("222", "2223")]) == sorted(a.edges)
+
+        # seen flags are kept from either side, attrs are combined
+        assert {"0001", "0003"} == a.seen_artists
+        assert {"popularity": 60} == a.nodes["0003"]["artist"].attr
+        assert {"genres": ("rap",)} == a.nodes["0001"]["artist"].attr
+
+        # only nodes that changed are flushed by the next snapshot
+        vertices, edges = a.pop_changes()
+        assert sorted(["222", "0001", "0003", "2222", "2223"]) == sorted(vertices["id"])
+        assert 3 == len(edges)
+
+    def test_artist_graph(self):
+        graph = create_graph(self.backend)
+        for track, artists in copy.deepcopy(tracks):
+            graph.put_track(track, artists)
+        graph.put_track(Track(track_id="333", name="Ace", album="Room 25", album_type="album"),
+                        [Artist(artist_id="0001", name="Noname"), Artist(artist_id="2223", name="Ravyn Lenae")])
+        graph.add_related(Artist(artist_id="0002", name="Cam O'bi"), [Artist(artist_id="2222", name="Joseph Chilliams")])
+
+        artist_graph = graph.artist_graph
+        assert 2 == artist_graph.collaborators("0001")["2223"]
+        assert {"0002": 1, "0003": 1, "2222": 1, "2223": 2} == artist_graph.collaborators("0001")
+        assert 5 == artist_graph.collaborations("0001")
+        assert ["2222"] == artist_graph.related("0002")
+        assert (0, True) == artist_graph.neighbours("2222")["0002"]
+        assert 3 == artist_graph.degree("0002")
+
+        # putting a known track again counts nothing
+        graph.put_track(*copy.deepcopy(tracks[0]))
+        assert 1 == artist_graph.collaborators("0001")["0002"]
+
+    def test_merge_artist_graph(self):
+        a = create_graph(self.backend)
+        a.put_track(*copy.deepcopy(tracks[0]))
+        b = create_graph(self.backend)
+        b.put_track(*copy.deepcopy(tracks[0]))
+        b.put_track(*copy.deepcopy(tracks[2]))
+        b.add_related(Artist(artist_id="0003", name="Raury"), [Artist(artist_id="2222", name="Joseph Chilliams")])
+
+        # a track both shards found is only counted once
+        a.merge(b)
+        assert {"0002": 1, "0003": 1, "2222": 1, "2223": 1} == a.artist_graph.collaborators("0001")
+        assert ["2222"] == a.artist_graph.related("0003")
+
+
+class TestArrayGraph(TestGraph):
+    backend = 'array'
+
+    def test_matches_networkx(self):
+        expected = create_graph('networkx')
+        graph = create_graph(self.backend)
+        for track, artists in copy.deepcopy(tracks):
+            expected.put_track(track, artists)
+        for track, artists in copy.deepcopy(tracks):
+            graph.put_track(track, artists)
+        graph.add_edge("0001", "000")
+
+        assert ("0001", "000") in graph.edges
+        assert ("000", "0001") in graph.edges
+        assert ("0002", "000") not in graph.edges
+        assert 8 == len(graph.edges)
+        assert graph.nodes["0001"].get("seen")
+        assert expected.get_node_attributes("track") == graph.get_node_attributes("track")
+        assert expected.get_node_attributes("seen") == graph.get_node_attributes("seen")
+        assert expected.pop_changes()[0].equals(graph.pop_changes()[0])
+
+
+class TestSQLiteGraph(TestGraph):
+    backend = 'sqlite'
+
+    def test_reopen(self, tmp_path):
+        path = str(tmp_path / "graph.db")
+        graph = create_graph(self.backend, path=path)
+        for track, artists in copy.deepcopy(tracks):
+            graph.put_track(track, artists)
+        graph.add_edge("0001", "000")
+        artist = graph.get_artist("0001")
+        artist.attr["popularity"] = 50
+        graph.touch("0001", artist)
+        graph.close()
+
+        graph = create_graph(self.backend, path=path)
+        assert 8 == len(graph.edges)
+        assert graph.is_seen("0001")
+        assert 50 == graph.get_artist("0001").attr["popularity"]
+        assert "Forever" == graph.get_track("222").name
+        graph.close()
+
+    def test_small_batches(self):
+        expected = create_graph('networkx')
+        graph = create_graph(self.backend)
+        graph.batch_size = 1
+        for track, artists in copy.deepcopy(tracks):
+            expected.put_track(track, artists)
+        for track, artists in copy.deepcopy(tracks):
+            graph.put_track(track, artists)
+
+        assert expected.to_dataframe()[0].equals(graph.to_dataframe()[0])
+        assert expected.to_dataframe()[1].equals(graph.to_dataframe()[1])
+        graph.close()
+
+    def test_pending_edges(self):
+        graph = create_graph(self.backend)
+        graph.add_edge("000", "0001")
+        graph.write()
+        graph.add_edge("000", "0002")
+        graph.add_edge("111", "0001")
+
+        # stored and pending edges are read together, by source
+        assert ["0001", "0002"] == graph.successors("000")
+        assert graph.has_edge("000", "0002")
+        assert not graph.has_edge("0002", "000")
+        assert 2 == graph.in_degree("0001")
+        assert [["0001", "0002"]] == list(graph.successor_lists())
+        graph.close()
+
+    def test_iter_seen_artists(self, tmp_path):
+        graph = create_graph(self.backend)
+        graph.add_artists([Artist(artist_id=f"a{i}", name=f"{i}") for i in range(5)], [True, False, True, False, True])
+
+        seen_store = SeenStore(str(tmp_path / "seen.db"), capacity=100, batch_size=2)
+        seen_store.add(graph.iter_seen_artists())
+        assert ["a0", "a2", "a4"] == [f"a{i}" for i in range(5) if f"a{i}" in seen_store]
+        seen_store.close()
+        graph.close()
@@ -0,0 +1,127 @@
+import copy
+
+from acquisition.__main__ import add_artists, load_artist_graph, merge_shard, refresh_graph
+from acquisition.artist import Artist
+from acquisition.graph import create_graph
+from acquisition.network import Network, graph_from_dataframe
+from acquisition.scheduler import Budget, parse_score
+from acquisition.snapshot import SnapshotWriter
+from acquisition.track import Track
+
+
+class TestAddArtists:
+    def test_concurrent_matches_sequential(self, fake_network):
+        seeds = [Artist(artist_id=f"a{i}", name=f"artist {i}") for i in range(3)]
+
+        sequential = fake_network()
+        add_artists(sequential, seeds, 0, 3)
+
+        concurrent = fake_network()
+        add_artists(concurrent, seeds, 0, 3, workers=4)
+
+        sequential_vertices, sequential_edges = sequential.graph.to_dataframe()
+        concurrent_vertices, concurrent_edges = concurrent.graph.to_dataframe()
+        # fetch times are all that differ between the two
+        assert list(sequential_vertices.columns) == list(concurrent_vertices.columns)
+        fetched = [column for column in sequential_vertices.columns if column.startswith("attr.fetched_")]
+        sequential_vertices = sequential_vertices.drop(columns=fetched)
+        concurrent_vertices = concurrent_vertices.drop(columns=fetched)
+
+        assert len(sequential.graph.nodes) > len(seeds)
+        assert sequential_vertices.equals(concurrent_vertices)
+        assert sequential_edges.equals(concurrent_edges)
+        assert sequential.graph.seen_artists == concurrent.graph.seen_artists
+
+
+class TestMergeShard:
+    def test_merge_matches_sequential(self, fake_spotify, fake_network):
+        seeds = [Artist(artist_id=f"a{i}", name=f"artist {i}") for i in range(4)]
+        expected = fake_network()
+        add_artists(expected, seeds[:2], 0, 1)
+        add_artists(expected, seeds[2:], 0, 1)
+
+        parent = fake_network()
+        add_artists(parent, seeds[:2], 0, 1)
+        parent.graph.clear_changes()
+
+        # a shard starts from the same graph, and only sends back what it added
+        shard = Network.from_dataframe(fake_spotify(), ["a"], 10, *parent.graph.to_dataframe())
+        add_artists(shard, seeds[2:], 0, 1)
+        artist_edges = shard.graph.artist_graph.pop_changes()
+        vertices, edges = shard.graph.pop_changes()
+        assert len(vertices) < len(shard.graph.nodes)
+
+        merge_shard(parent.graph, vertices, edges, artist_edges)
+        assert sorted(expected.graph.nodes) == sorted(parent.graph.nodes)
+        assert sorted(expected.graph.edges) == sorted(parent.graph.edges)
+        assert expected.graph.seen_artists == parent.graph.seen_artists
+        assert expected.graph.artist_graph.to_dataframe().sort_values(["source", "target"]).reset_index(drop=True) \
+            .equals(parent.graph.artist_graph.to_dataframe().sort_values(["source", "target"]).reset_index(drop=True))
+
+
+class TestLoadArtistGraph:
+    def test_resumed_runs_share_snapshot(self, tmp_path):
+        artists = [Artist(artist_id="a1", name="one"), Artist(artist_id="a2", name="two")]
+        # a fresh run, then resumed runs that load the snapshot's graph and pairs, and put t1 again
+        runs = [("first", False, ["t1"]), ("again", True, ["t1"]), ("more", True, ["t1", "t2"])]
+        for name, resume, track_ids in runs:
+            writer = SnapshotWriter(str(tmp_path))
+            graph = create_graph("networkx")
+            if resume:
+                graph = graph_from_dataframe(*writer.read())
+                load_artist_graph(graph, writer)
+            for track_id in track_ids:
+                graph.put_track(Track(track_id=track_id, name=track_id, album="album", album_type="album"),
+                                copy.deepcopy(artists))
+            if name == "more":
+                graph.add_related(artists[0], artists[1:])
+            writer.flush(graph, name)
+
+        writer = SnapshotWriter(str(tmp_path))
+        writer.compact()
+        assert [("a1", "a2", 2, True)] == list(writer.read_artist_edges().itertuples(index=False, name=None))
+
+
+class TestRefresh:
+    def test_refresh_only_stale(self, tmp_path, fake_network):
+        network = fake_network()
+        add_artists(network, [Artist(artist_id=f"a{i}", name=f"artist {i}") for i in range(3)], 0, 2)
+        crawl_calls = network.requests
+        score = parse_score("popularity")
+
+        # everything was fetched just now
+        refresh_graph(network, ["artists", "artist_top_tracks", "artist_related_artists"], 3600, score, Budget())
+        assert 1 == network.spotify.artists.call_count
+        assert crawl_calls + 1 == network.requests
+
+        # two crawled artists go stale
+        graph = network.graph
+        stale = sorted(graph.seen_artists)[:2]
+        for artist_id in stale:
+            artist = graph.get_artist(artist_id)
+            artist.attr = {**artist.attr, "fetched_artists": 0.0, "fetched_artist_top_tracks": 0.0}
+        network.spotify.reset_mock()
+        writer = SnapshotWriter(str(tmp_path))
+
+        refresh_graph(network, ["artists", "artist_top_tracks", "artist_related_artists"], 3600, score, Budget(),
+                      writer=writer)
+        assert [stale] == [sorted(call.args[0]) for call in network.spotify.artists.call_args_list]
+        assert sorted(stale) == sorted(call.args[0] for call in network.spotify.artist_top_tracks.call_args_list)
+        assert 0 == network.spotify.artist_related_artists.call_count
+        assert 0 == network.spotify.search.call_count
+
+        # updated in place, and written to the snapshot
+        assert all(99 == graph.get_artist(artist_id).attr["popularity"] for artist_id in stale)
+        assert all(graph.get_artist(artist_id).attr["fetched_artists"] > 0 for artist_id in stale)
+        vertices, _ = writer.read()
+        assert set(stale) <= set(vertices["id"])
+        assert (vertices.set_index("id").loc[stale, "attr.popularity"] == 99).all()
+
+    def test_refresh_budget(self, fake_network):
+        network = fake_network()
+        add_artists(network, [Artist(artist_id=f"a{i}", name=f"artist {i}") for i in range(3)], 0, 2)
+        before = network.spotify.artist_top_tracks.call_count
+
+        # the budget is checked between artists
+        refresh_graph(network, ["artist_top_tracks"], 0, parse_score("popularity"), Budget(max_calls=2))
+        assert before + 2 == network.spotify.artist_top_tracks.call_count
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import pytest
+
+from acquisition.metrics import Metrics, instrument_request, metrics, timed
+
+
+class TestMetrics:
+    def test_counters_and_histograms(self):
+        m = Metrics()
+        m.increment("requests_total", endpoint="search")
+        m.increment("requests_total", 2, endpoint="search")
+        m.observe("request_seconds", 0.003, endpoint="search")
+        m.observe("request_seconds", 0.2, endpoint="search")
+
+        summary = m.summary()
+        assert {'requests_total{endpoint="search"}': 3} == summary["counters"]
+        histogram = summary["histograms"]['request_seconds{endpoint="search"}']
+        assert 2 == histogram["count"]
+        assert 0.203 == pytest.approx(histogram["sum"])
+        assert 0.005 == histogram["p50"]
+        assert 0.25 == histogram["p99"]
+
+    def test_prometheus(self):
+        m = Metrics()
+        m.increment("errors_total", endpoint="search", error="429")
+        m.observe("request_seconds", 0.003, endpoint="search")
+
+        lines = m.to_prometheus().splitlines()
+        assert "# TYPE errors_total counter" in lines
+        assert 'errors_total{endpoint="search",error="429"} 1' in lines
+        assert "# TYPE request_seconds histogram" in lines
+        assert 'request_seconds_bucket{endpoint="search",le="0.001"} 0' in lines
+        assert 'request_seconds_bucket{endpoint="search",le="0.005"} 1' in lines
+        assert 'request_seconds_bucket{endpoint="search",le="+Inf"} 1' in lines
+        assert 'request_seconds_count{endpoint="search"} 1' in lines
+
+    def test_merge(self):
+        a = Metrics()
+        a.increment("requests_total")
+        a.observe("request_seconds", 0.01)
+        b = Metrics()
+        b.increment("requests_total", 2)
+        b.observe("request_seconds", 0.02)
+
+        a.merge(b.state())
+        assert {"requests_total": 3} == a.summary()["counters"]
+        assert 2 == a.summary()["histograms"]["request_seconds"]["count"]
+
+    def test_write(self, tmp_path):
+        m = Metrics()
+        m.increment("requests_total")
+        m.write(str(tmp_path))
+
+        with open(tmp_path / "metrics.json") as f:
+            assert {"requests_total": 1} == json.load(f)["counters"]
+        assert "requests_total 1" in (tmp_path / "metrics.prom").read_text()
+
+
+class TestInstrumentation:
+    def setup_method(self):
+        metrics.reset()
+
+    def test_instrument_request(self):
+        responses = [ValueError("boom"), "ok"]
+
+        def request():
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        request = instrument_request("spotify", "search", request)
+        with pytest.raises(ValueError):
+            request()
+        assert "ok" == request()
+
+        summary = metrics.summary()
+        assert 1 == summary["counters"]['spotify_retries_total{endpoint="search"}']
+        assert 1 == summary["counters"]['spotify_errors_total{endpoint="search",error="ValueError"}']
+        assert 2 == summary["histograms"]['spotify_request_seconds{endpoint="search"}']["count"]
+
+    def test_timed_coroutine(self):
+        @timed("operation_seconds", operation="tag")
+        async def tag():
+            return "tagged"
+
+        assert "tagged" == asyncio.run(tag())
+        assert 1 == metrics.summary()["histograms"]['operation_seconds{operation="tag"}']["count"]
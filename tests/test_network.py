@@ -1,9 +1,16 @@
 import copy
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import Mock
 
+from pandas import DataFrame
+
 from acquisition.track import Track
 from acquisition.artist import Artist
-from acquisition.network import Network
+import acquisition.network as network_module
+from acquisition.network import Network, graph_from_chunks, graph_from_dataframe
+from acquisition.similarity import GraphSimilarity
 
 tracks_response = {
     "tracks": [
@@ -207,3 +214,285 @@ class TestNetworkTopTracks:
         # check correctness
         assert expected == single_track
         network.spotify.audio_features.assert_called_once_with({"000": True}.keys())
+
+
+class TestNetworkRefreshArtists:
+    def test_refresh_artists(self):
+        network = Network(audio_features=["a"], max_tracks=10, spotify=Mock(), page_workers=1)
+        network.spotify.artists.side_effect = lambda ids: {"artists": [
+            {"id": i, "name": i, "popularity": 70, "genres": ["rap"]} if i != "a3" else None for i in ids
+        ]}
+        artists = [Artist(artist_id=f"a{i}", name=f"a{i}", attr={"popularity": None}) for i in range(60)]
+
+        # up to 50 artists per request; artists Spotify doesn't know keep what they had
+        assert 59 == network.refresh_artists(artists)
+        assert [50, 10] == [len(call.args[0]) for call in network.spotify.artists.call_args_list]
+        assert 70 == artists[0].attr["popularity"]
+        assert ("rap",) == artists[0].attr["genres"]
+        assert "fetched_artists" in artists[0].attr
+        assert {"popularity": None} == artists[3].attr
+
+    def test_refresh_artists_sad(self):
+        network = Network(audio_features=["a"], max_tracks=10, spotify=Mock())
+        network.spotify.artists.side_effect = Exception("spotify machine broke")
+        artists = [Artist(artist_id="a0", name="a0")]
+
+        assert 0 == network.refresh_artists(artists)
+        assert {} == artists[0].attr
+
+
+class TestNetworkFromDataframe:
+    def test_from_dataframe_seen(self):
+        vertices = DataFrame({
+            "id": ["000", "0001", "0002"],
+            "name": ["Diddy Bop", "Noname", "Cam O'bi"],
+            "album": ["Telefone", None, None],
+            "album_type": ["album", None, None],
+            "node_type": ["track", "artist", "artist"],
+            "attr.seen": [None, True, None]
+        })
+        edges = DataFrame({"source": ["000", "000"], "target": ["0001", "0002"]})
+
+        network = Network.from_dataframe(spotify=Mock(), audio_features=["a", "b"], max_tracks=10,
+                                         vertices=vertices, edges=edges)
+
+        assert network.graph.is_seen("0001")
+        assert not network.graph.is_seen("0002")
+        assert network.artist_from_response({"id": "0001", "name": "Noname"}).attr.get("seen")
+        assert not network.artist_from_response({"id": "0002", "name": "Cam O'bi"}).attr.get("seen")
+
+    def test_from_dataframe(self):
+        vertices = DataFrame({
+            "id": ["000", "111", "0001", "0002", "???"],
+            "name": ["Diddy Bop", "Yesterday", "Noname", "Cam O'bi", "mystery"],
+            "album": ["Telefone", "Telefone", None, None, None],
+            "album_type": ["album", "album", None, None, None],
+            "node_type": ["track", "track", "artist", "artist", "playlist"],
+            "attr.poetic": [1.0, None, None, None, None],
+            "attr.genres": [None, None, ["chicago rap"], None, None]
+        })
+        edges = DataFrame({"source": ["000", "000", "111"], "target": ["0001", "0002", "0001"]})
+
+        network = Network.from_dataframe(spotify=Mock(), audio_features=["poetic"], max_tracks=10,
+                                         vertices=vertices, edges=edges)
+        graph = network.graph
+
+        assert Track(track_id="000", name="Diddy Bop", album="Telefone", album_type="album") == graph.get_track("000")
+        assert {"poetic": 1.0} == graph.get_track("000").attr
+        assert {} == graph.get_track("111").attr
+        assert {"genres": ("chicago rap",)} == graph.nodes["0001"]["artist"].attr
+        assert "???" not in graph.nodes
+
+        # edges keep their direction, and the loaded graph can still be extended
+        assert ("000", "0001") in graph.edges
+        assert ("0001", "000") not in graph.edges
+        graph.put_track(Track(track_id="222", name="Forever", album="Telefone", album_type="album"),
+                        [Artist(artist_id="0001", name="Noname")])
+        assert ("222", "0001") in graph.edges
+        assert graph.is_seen("0001")
+
+    def test_from_chunks(self):
+        vertices = DataFrame({
+            "id": ["000", "111", "0001", "0002", "0003"],
+            "name": ["Diddy Bop", "Yesterday", "Noname", "Cam O'bi", "Raury"],
+            "album": ["Telefone", "Telefone", None, None, None],
+            "album_type": ["album", "album", None, None, None],
+            "node_type": ["track", "track", "artist", "artist", "artist"],
+            "seen": [None, None, True, None, None]
+        })
+        edges = DataFrame({"source": ["000", "000", "000", "111", "111"],
+                           "target": ["0001", "0002", "0003", "0001", "0002"]})
+        expected = graph_from_dataframe(vertices, edges)
+
+        for backend in ["networkx", "array", "sqlite"]:
+            # a chunk per row, so the edges of each track are split across chunks
+            graph = graph_from_chunks((vertices[i:i + 1] for i in range(len(vertices))),
+                                      (edges[i:i + 1] for i in range(len(edges))), backend)
+            assert sorted(expected.nodes) == sorted(graph.nodes)
+            assert sorted(expected.edges) == sorted(graph.edges)
+            assert graph.is_seen("0001")
+            assert not graph.changed_nodes and not graph.new_edges
+            assert expected.artist_graph.neighbours("0001") == graph.artist_graph.neighbours("0001")
+            assert {"0001": 2, "0003": 1} == graph.artist_graph.collaborators("0002")
+            graph.close()
+
+
+class TestNetworkAudioFeatureQueue:
+    def test_queue_audio_features(self):
+        network = Network(audio_features=["poetic"], max_tracks=10, spotify=Mock())
+        network.spotify.audio_features.side_effect = lambda ids: [{"id": i, "poetic": 1.0} for i in ids]
+
+        batch = [Track(track_id=str(i), name=str(i), album="Telefone", album_type="album") for i in range(150)]
+
+        # nothing is requested until a full batch of IDs has been queued
+        network.queue_audio_features(batch[:60])
+        network.queue_audio_features(batch[:60])
+        assert 0 == network.spotify.audio_features.call_count
+
+        network.queue_audio_features(batch[60:])
+        assert 1 == network.spotify.audio_features.call_count
+        assert 100 == len(network.spotify.audio_features.call_args[0][0])
+
+        network.flush_audio_features()
+        assert 2 == network.spotify.audio_features.call_count
+        assert 50 == len(network.spotify.audio_features.call_args[0][0])
+        assert all(1.0 == track.attr["poetic"] and "fetched_audio_features" in track.attr for track in batch)
+
+    def test_queue_audio_features_graph(self):
+        network = Network(audio_features=["poetic"], max_tracks=10, spotify=Mock())
+        network.spotify.audio_features.side_effect = lambda ids: [{"id": i, "poetic": 1.0} for i in ids]
+
+        for track, artists in copy.deepcopy(tracks):
+            network.graph.put_track(
+                Track(track_id=track.id, name=track.name, album=track.album, album_type=track.album_type), artists
+            )
+        network.graph.get_track("000").set_attrs({"poetic": 0.5})
+
+        # tracks already holding features are dropped; the rest are set on the graph's own track objects
+        network.queue_audio_features([copy.deepcopy(track) for track, _ in tracks])
+        network.flush_audio_features()
+
+        network.spotify.audio_features.assert_called_once_with({"111": True, "222": True}.keys())
+        assert {"poetic": 0.5} == network.graph.get_track("000").attr
+        assert 1.0 == network.graph.get_track("111").attr["poetic"]
+        assert 1.0 == network.graph.get_track("222").attr["poetic"]
+
+    def test_queue_audio_features_missing(self):
+        network = Network(audio_features=["poetic"], max_tracks=10, spotify=Mock())
+        # spotify answers None for a track it has no features for, and may leave one out altogether
+        network.spotify.audio_features.return_value = [None, {"id": "111", "poetic": 1.0}]
+        for track, artists in copy.deepcopy(tracks):
+            network.graph.put_track(
+                Track(track_id=track.id, name=track.name, album=track.album, album_type=track.album_type), artists
+            )
+        graph_tracks = [network.graph.get_track(track.id) for track, _ in tracks]
+
+        network.queue_audio_features(graph_tracks)
+        network.flush_audio_features()
+        assert 1.0 == network.graph.get_track("111").attr["poetic"]
+        for track_id in ("000", "222"):
+            attr = network.graph.get_track(track_id).attr
+            assert "poetic" not in attr and "fetched_audio_features" in attr
+
+        # tracks fetched without features aren't requested again, nor waited on by the similarity index
+        network.queue_audio_features(graph_tracks)
+        network.flush_audio_features()
+        assert 1 == network.spotify.audio_features.call_count
+        similarity = GraphSimilarity(network.graph, ["poetic"])
+        assert ["111"] == similarity.tracks.ids
+        assert not similarity.waiting
+
+
+def search_page(artist_name, type, limit, offset):
+    # 120 results: the artist's 70 tracks come first, then tracks by other artists
+    items = [
+        {
+            "name": f"track {i}",
+            "id": f"t{i}",
+            "album": {"name": "album", "album_type": "album"},
+            "artists": [{"id": "0001" if i < 70 else "9999", "name": "Noname" if i < 70 else "Somebody Else"}]
+        }
+        for i in range(offset, min(offset + limit, 120))
+    ]
+    return {"tracks": {"items": items, "total": 120}}
+
+
+def playlist_page(playlist_id, offset, limit):
+    items = [
+        {"track": {
+            "name": f"track {i}",
+            "id": f"t{i}",
+            "album": {"name": "album", "album_type": "album"},
+            "artists": [{"id": f"a{i}", "name": f"artist {i}"}]
+        }}
+        for i in range(offset, min(offset + limit, 250))
+    ]
+    return {"items": items}
+
+
+class TestNetworkPages:
+    def test_search_tracks(self):
+        spotify = Mock()
+        spotify.search.side_effect = search_page
+        network = Network(audio_features=["a"], max_tracks=200, spotify=spotify)
+
+        artist = Artist(artist_id="0001", name="Noname")
+        found = network.search_tracks("Noname", artist=artist)
+
+        # stops at the page at offset 100, the first without any of the artist's tracks
+        assert [f"track {i}" for i in range(70)] == [track.name for track, _ in found]
+        assert [0, 50, 100] == sorted(call.kwargs["offset"] for call in spotify.search.call_args_list)
+        assert "fetched_search" in artist.attr
+
+    def test_close(self):
+        spotify = Mock()
+        spotify.search.side_effect = search_page
+        network = Network(audio_features=["a"], max_tracks=200, spotify=spotify)
+        network.search_tracks("Noname")
+        executor = network.page_executor
+
+        network.close()
+        assert executor._shutdown
+        assert network.page_executor is None
+
+        # a later request starts a new pool
+        assert 70 == len(network.search_tracks("Noname"))
+        network.close()
+
+    def test_one_pool_across_threads(self, monkeypatch):
+        pools = []
+
+        class SlowPool(ThreadPoolExecutor):
+            def __init__(self, *args, **kwargs):
+                # widens the window for a second thread to start a pool too
+                time.sleep(0.05)
+                super().__init__(*args, **kwargs)
+                pools.append(self)
+
+        monkeypatch.setattr(network_module, "ThreadPoolExecutor", SlowPool)
+        spotify = Mock()
+        spotify.search.side_effect = search_page
+        network = Network(audio_features=["a"], max_tracks=200, spotify=spotify)
+
+        threads = [threading.Thread(target=network.search_tracks, args=("Noname",)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        network.close()
+        assert 1 == len(pools)
+        assert pools[0]._shutdown
+
+    def test_search_tracks_none(self):
+        spotify = Mock()
+        spotify.search.side_effect = search_page
+        network = Network(audio_features=["a"], max_tracks=200, spotify=spotify)
+
+        assert [] == network.search_tracks("Nobody")
+        assert 1 == spotify.search.call_count
+
+    def test_search_tracks_sad(self):
+        spotify = Mock()
+        spotify.search.side_effect = Exception("boom")
+        network = Network(audio_features=["a"], max_tracks=200, spotify=spotify)
+
+        artist = Artist(artist_id="0001", name="Noname")
+        assert [] == network.search_tracks("Noname", artist=artist)
+        # a failed search isn't recorded as fetched
+        assert "fetched_search" not in artist.attr
+
+    def test_get_playlist(self):
+        spotify = Mock()
+        spotify.playlist.return_value = {"name": "mix", "tracks": {**playlist_page("p", 0, 100), "total": 250}}
+        spotify.playlist_tracks.side_effect = playlist_page
+
+        for page_workers in [1, 4]:
+            spotify.playlist_tracks.reset_mock()
+            network = Network(audio_features=["a"], max_tracks=50, spotify=spotify, page_workers=page_workers)
+
+            playlist = network.get_playlist("p")
+
+            # the first page comes with the playlist, the rest are merged in offset order
+            assert "mix" == playlist.name
+            assert [f"track {i}" for i in range(250)] == [track.name for track, _ in playlist.entries]
+            assert [100, 200] == sorted(call.kwargs["offset"] for call in spotify.playlist_tracks.call_args_list)
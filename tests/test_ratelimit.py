@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock
+
+import pytest
+from spotipy import Spotify
+from spotipy.exceptions import SpotifyException
+
+from acquisition.artist import Artist
+from acquisition.network import Network, classify_spotify_error, spotify_session
+from acquisition.ratelimit import RateLimited, RateLimiter
+
+
+class TestRateLimiter:
+    def test_token_bucket(self):
+        limiter = RateLimiter(rate=50, burst=1)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+
+        # first request uses the burst, the other five wait for a token each
+        assert time.monotonic() - start >= 5 / 50 * 0.9
+
+    def test_retry_after(self):
+        limiter = RateLimiter(rate=1000, base_delay=0.001)
+        request = Mock(side_effect=[RateLimited("slow down", retry_after=0.05), "ok"])
+
+        start = time.monotonic()
+        assert "ok" == limiter.call(request)
+        assert time.monotonic() - start >= 0.05
+        assert 1 == limiter.throttles
+        assert 1 == limiter.retries
+
+    def test_adapts_rate(self):
+        limiter = RateLimiter(rate=100, max_rate=200, base_delay=0.001)
+        limiter.call(Mock(side_effect=[RateLimited("slow down", retry_after=0), "ok"]))
+        assert limiter.rate < 100
+
+        throttled = limiter.rate
+        for _ in range(10):
+            limiter.call(Mock(return_value="ok"))
+        assert throttled < limiter.rate <= 200
+
+    def test_gives_up(self):
+        limiter = RateLimiter(rate=1000, max_retries=2, base_delay=0.001)
+        request = Mock(side_effect=RateLimited("slow down", retry_after=0))
+
+        with pytest.raises(RateLimited):
+            limiter.call(request)
+        assert 3 == request.call_count
+
+    def test_does_not_retry_other_errors(self):
+        limiter = RateLimiter(rate=1000, base_delay=0.001)
+        request = Mock(side_effect=ValueError("bad request"))
+
+        with pytest.raises(ValueError):
+            limiter.call(request)
+        assert 1 == request.call_count
+
+    def test_call_async(self):
+        limiter = RateLimiter(rate=1000, base_delay=0.001)
+        responses = [RateLimited("slow down", retry_after=0), "ok"]
+
+        async def request():
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        assert "ok" == asyncio.run(limiter.call_async(request))
+        assert 1 == limiter.retries
+
+
+class TooManyRequests(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(429)
+        self.send_header("Retry-After", "7")
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b'{"error": {"status": 429, "message": "API rate limit exceeded"}}')
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSpotifyRateLimiting:
+    def test_retry_after_through_spotipy(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), TooManyRequests)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            spotify = Spotify(auth="token", requests_session=spotify_session(), retries=0, status_retries=0)
+            spotify.prefix = f"http://127.0.0.1:{server.server_address[1]}/v1/"
+
+            # a real 429 reaches the limiter with its Retry-After header, rather than as spotipy's retry error
+            classified = []
+            limiter = RateLimiter(rate=1000, max_retries=0,
+                                  classify=lambda e: classified.append(classify_spotify_error(e)) or classified[-1])
+            with pytest.raises(SpotifyException):
+                limiter.call(spotify.artist, "0001")
+            assert [(True, True, 7.0)] == classified
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_classify_spotify_error(self):
+        assert (True, True, 3.0) == classify_spotify_error(
+            SpotifyException(429, -1, "too many requests", headers={"Retry-After": "3"}))
+        assert (True, False, None) == classify_spotify_error(SpotifyException(503, -1, "unavailable"))
+        assert (False, False, None) == classify_spotify_error(SpotifyException(404, -1, "not found"))
+        assert (False, False, None) == classify_spotify_error(Exception("spotify machine broke"))
+
+    def test_network_retries(self):
+        limiter = RateLimiter(rate=1000, base_delay=0.001, classify=classify_spotify_error)
+        network = Network(audio_features=["a", "b"], max_tracks=10, spotify=Mock(), limiter=limiter)
+        network.spotify.artist_related_artists.side_effect = [
+            SpotifyException(429, -1, "too many requests", headers={"Retry-After": "0"}),
+            SpotifyException(502, -1, "bad gateway"),
+            {"artists": [{"id": "0002", "name": "Cam O'bi"}]}
+        ]
+
+        assert [Artist(artist_id="0002", name="Cam O'bi")] == \
+            network.get_related_artists(Artist(artist_id="0001", name="Noname"))
+        assert 3 == network.spotify.artist_related_artists.call_count
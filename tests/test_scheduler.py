@@ -0,0 +1,105 @@
+import pytest
+
+from acquisition.__main__ import crawl_frontier
+from acquisition.artist import Artist
+from acquisition.graph import Graph
+from acquisition.scheduler import Budget, Frontier, parse_score, stale_artists
+from acquisition.track import Track
+
+
+def artist(i, popularity=None):
+    return Artist(artist_id=f"a{i}", name=f"artist {i}", attr={"popularity": popularity})
+
+
+class TestScore:
+    def test_parse_score(self):
+        graph = Graph()
+        graph.put_track(Track(track_id="t1", name="track", album="album", album_type="album"), [artist(1)])
+
+        score = parse_score("popularity, degree:10, distance:25")
+        assert 50 + 10 - 50 == score(graph, artist(1, 50), 2)
+        assert 50 - 50 == score(graph, artist(2, 50), 2)
+
+    def test_parse_score_unknown(self):
+        with pytest.raises(ValueError):
+            parse_score("fame")
+
+
+class TestFrontier:
+    def test_pop_best_first(self):
+        graph = Graph()
+        graph.add_artist(artist(3), seen=True)
+        frontier = Frontier(graph, parse_score("popularity"), max_distance=1)
+        frontier.push([artist(1, 10), artist(2, 90), artist(3, 99)], 0)
+        frontier.push([artist(4, 50), artist(1, 95)], 1)
+        frontier.push([artist(5, 100)], 2)
+
+        # seen artists and artists past the maximum distance are never crawled; repeats keep their best entry
+        assert [("a1", 1), ("a2", 0)] == [(a.id, distance) for a, distance in frontier.pop(2)]
+        assert [("a4", 1)] == [(a.id, distance) for a, distance in frontier.entries()]
+        assert [("a4", 1)] == [(a.id, distance) for a, distance in frontier.pop(5)]
+        assert [] == frontier.pop(5)
+
+        # crawled artists are not queued again
+        frontier.push([artist(1, 100)], 0)
+        assert [] == frontier.pop(5)
+
+    def test_repeats_replace_entries(self):
+        frontier = Frontier(Graph(), parse_score("popularity"))
+        for popularity in range(1000):
+            frontier.push([artist(1, popularity % 10), artist(2, 5)], 0)
+
+        # only better scores are queued again, and replaced entries don't pile up
+        assert 2 == len(frontier)
+        assert len(frontier.heap) <= 2 * 2 + 64
+        assert [("a1", 9), ("a2", 5)] == [(a.id, a.attr["popularity"]) for a, _ in frontier.pop(5)]
+        assert 0 == len(frontier)
+
+
+class TestStaleArtists:
+    def test_by_score_then_age(self):
+        graph = Graph()
+        for i, (fetched, popularity) in enumerate([(None, 10), (50.0, 10), (95.0, 90), (10.0, 90)]):
+            attr = {"popularity": popularity}
+            if fetched is not None:
+                attr["fetched_artists"] = fetched
+            graph.add_artist(Artist(artist_id=f"a{i}", name=f"artist {i}", attr=attr), seen=i != 1)
+
+        stale = stale_artists(graph, ["artists"], 10.0, parse_score("popularity"), now=100.0)
+        assert ["a3", "a0", "a1"] == [artist.id for artist in stale]
+
+        stale = stale_artists(graph, ["artists"], 10.0, parse_score("popularity"), now=100.0,
+                              include=lambda artist: graph.is_seen(artist.id))
+        assert ["a3", "a0"] == [artist.id for artist in stale]
+
+        # an artist is stale if any of the endpoints is
+        stale = stale_artists(graph, ["artists", "artist_top_tracks"], 10.0, parse_score("popularity"), now=100.0)
+        assert 4 == len(stale)
+
+
+class TestBudget:
+    def test_calls(self):
+        budget = Budget(max_calls=10, spent_calls=4)
+        budget.start(100)
+        assert not budget.exhausted(105)
+        assert budget.exhausted(106)
+
+    def test_seconds(self):
+        assert Budget(max_seconds=0).exhausted(0)
+        assert not Budget().exhausted(10 ** 9)
+
+
+class TestCrawlFrontier:
+    def test_stops_at_budget(self, fake_network):
+        network = fake_network()
+        frontier = Frontier(network.graph, parse_score("popularity"))
+        frontier.push([artist(i, i) for i in range(3)], 0)
+        budget = Budget(max_calls=30)
+        budget.start(network.requests)
+
+        crawl_frontier(network, frontier, budget)
+
+        # three requests per artist, starting from the most popular seed
+        assert 10 == network.spotify.artist_related_artists.call_count
+        assert "a2" == network.spotify.artist_related_artists.call_args_list[0].args[0]
+        assert 0 < len(frontier.entries())
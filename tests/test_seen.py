@@ -0,0 +1,84 @@
+import os
+
+from acquisition.artist import Artist
+from acquisition.graph import create_graph
+from acquisition.seen import BloomFilter, SeenStore
+from acquisition.track import Track
+
+
+class TestBloomFilter:
+    def test_contains(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f"a{i}")
+
+        assert all(f"a{i}" in bloom for i in range(1000))
+        false_positives = sum(f"b{i}" in bloom for i in range(10000))
+        assert false_positives < 300
+
+
+class TestSeenStore:
+    def test_add(self, tmp_path):
+        store = SeenStore(str(tmp_path / "seen.db"), capacity=100, batch_size=2)
+        store.add(["a1"])
+        assert "a1" in store
+        store.add(["a2", "a1"])
+        assert "a2" in store
+        assert "a3" not in store
+        assert 2 == store.stats()["seen"]
+
+    def test_persistent(self, tmp_path):
+        path = str(tmp_path / "seen.db")
+        store = SeenStore(path, capacity=100)
+        store.add(["a1", "a2"])
+        store.close()
+
+        # the saved filter is reused as long as it matches the table
+        assert os.path.exists(path + ".bloom.npz")
+        store = SeenStore(path, capacity=100)
+        assert "a1" in store and "a2" in store
+        assert "a3" not in store
+
+    def test_rebuilds_filter(self, tmp_path):
+        path = str(tmp_path / "seen.db")
+        store = SeenStore(path, capacity=100)
+        store.add(["a1"])
+        store.close()
+
+        # a crash after flushing leaves the table ahead of the saved filter
+        store = SeenStore(path, capacity=100)
+        store.add(["a2"])
+        store.flush()
+
+        store = SeenStore(path, capacity=100)
+        assert "a1" in store and "a2" in store
+
+    def test_grows(self, tmp_path):
+        store = SeenStore(str(tmp_path / "seen.db"), capacity=10, batch_size=1)
+        store.add(f"a{i}" for i in range(50))
+        store.flush()
+        assert 50 <= store.bloom.capacity
+        assert all(f"a{i}" in store for i in range(50))
+
+
+class TestGraphSeenStore:
+    def test_skips_artists_seen_by_earlier_crawls(self, tmp_path):
+        path = str(tmp_path / "seen.db")
+        for backend in ["networkx", "array"]:
+            earlier = create_graph(backend)
+            earlier.seen_store = SeenStore(path)
+            earlier.add_artist(Artist(artist_id="0001", name="Noname"), seen=True)
+            earlier.seen_store.close()
+
+            graph = create_graph(backend)
+            graph.seen_store = SeenStore(path)
+            assert graph.is_seen("0001")
+            assert ["0002"] == [a.id for a in graph.get_unseen_artists([
+                Artist(artist_id="0001", name="Noname"), Artist(artist_id="0002", name="Cam O'bi")
+            ])]
+
+            # only the fresh track and artist end up in the new graph
+            graph.put_track(Track(track_id="000", name="Diddy Bop", album="Telefone", album_type="album"),
+                            [Artist(artist_id="0002", name="Cam O'bi")])
+            assert ["000", "0002"] == list(graph.nodes)
+            graph.seen_store.close()
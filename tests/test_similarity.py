@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+from pandas import DataFrame
+
+from acquisition.artist import Artist
+from acquisition.graph import create_graph
+from acquisition.similarity import GraphSimilarity, SimilarityIndex, to_dataframe
+from acquisition.track import Track
+
+FEATURES = ["energy", "tempo"]
+
+
+def track(track_id, energy, tempo):
+    return Track(track_id=track_id, name=track_id, album="Album", album_type="album",
+                 attr={"energy": energy, "tempo": tempo})
+
+
+@pytest.fixture(params=["networkx", "array", "sqlite"])
+def graph(request):
+    graph = create_graph(request.param)
+    graph.put_track(track("t1", 0.9, 170.0), [Artist(artist_id="a1", name="Fast")])
+    graph.put_track(track("t2", 0.8, 160.0), [Artist(artist_id="a2", name="Faster")])
+    graph.put_track(track("t3", 0.1, 70.0), [Artist(artist_id="a3", name="Slow")])
+    graph.put_track(Track(track_id="t4", name="t4", album="Album", album_type="album"),
+                    [Artist(artist_id="a4", name="Unknown")])
+    return graph
+
+
+class TestSimilarityIndex:
+    def test_exact(self):
+        index = SimilarityIndex(2)
+        index.add(["x", "y", "z"], np.array([[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]]))
+
+        assert ["y", "z"] == [i for i, _ in index.most_similar("x", 2)]
+        assert pytest.approx(1.0) == index.query(np.array([2.0, 0.0]), 1)[0][1]
+        assert [["y"], ["x"], ["y"]] == [[i for i, _ in r] for r in index.most_similar_batch(["x", "y", "z"], 1)]
+
+        # known IDs are overwritten rather than appended
+        index.add(["z"], np.array([[1.0, 0.0]]))
+        assert 3 == len(index)
+        assert "z" == index.most_similar("x", 1)[0][0]
+
+    def test_approximate_matches_exact(self):
+        rng = np.random.default_rng(1)
+        vectors = rng.standard_normal((3000, 8))
+        ids = [str(i) for i in range(len(vectors))]
+        exact = SimilarityIndex(8)
+        approximate = SimilarityIndex(8, approximate=True, tables=16, bits=6)
+        # added in several batches, as a growing graph would
+        for start in range(0, len(ids), 700):
+            exact.add(ids[start:start + 700], vectors[start:start + 700])
+            approximate.add(ids[start:start + 700], vectors[start:start + 700])
+
+        recall = np.mean([
+            len({i for i, _ in exact.most_similar(item_id, 5)} & {i for i, _ in approximate.most_similar(item_id, 5)}) / 5
+            for item_id in ids[:100]
+        ])
+        assert recall > 0.8
+
+
+class TestGraphSimilarity:
+    def test_artists_by_tracks(self, graph):
+        similarity = GraphSimilarity(graph, FEATURES)
+        assert 3 == len(similarity.tracks)
+        assert "a2" == similarity.most_similar("a1", 1)[0][0]
+        assert "a3" == similarity.most_similar("a1", 2)[1][0]
+        assert "t1" == similarity.similar_tracks("t2", 1)[0][0]
+        assert "t3" == similarity.tracks_like({"energy": 0.2, "tempo": 80.0}, 1)[0][0]
+
+        frame = to_dataframe(similarity.most_similar_batch(["a1", "a3"], 1), ["a1", "a3"])
+        assert ["a1", "a3"] == frame["id"].tolist()
+        assert "a2" == frame["neighbour"][0]
+
+    def test_update(self, graph):
+        similarity = GraphSimilarity(graph, FEATURES)
+        graph.put_track(track("t5", 0.15, 75.0), [Artist(artist_id="a1", name="Fast")])
+        assert 1 == similarity.update()
+        assert 0 == similarity.update()
+
+        # a1 now has a slow track too, so a3 is no longer its furthest neighbour
+        assert 4 == len(similarity.tracks)
+        assert "t3" == similarity.similar_tracks("t5", 1)[0][0]
+        assert sorted(similarity.artist_tracks["a1"]) == ["t1", "t5"]
+
+    def test_update_waits_for_features(self, graph):
+        similarity = GraphSimilarity(graph, FEATURES)
+        # t4 was added without features, and they come in later
+        graph.get_track("t4").attr = {"energy": 0.85, "tempo": 165.0}
+        graph.touch("t4", graph.get_track("t4"))
+        assert 1 == similarity.update()
+        assert "t4" in similarity.tracks
+        assert not similarity.waiting
+
+        # tracks Spotify has no features for are not checked again
+        graph.put_track(Track(track_id="t5", name="t5", album="Album", album_type="album",
+                              attr={"fetched_audio_features": 1.0}), [Artist(artist_id="a4", name="Unknown")])
+        assert 0 == similarity.update()
+        assert not similarity.waiting
+
+    def test_update_standardizes_again(self, graph):
+        similarity = GraphSimilarity(graph, FEATURES)
+        for i in range(10):
+            graph.put_track(track(f"n{i}", 0.5, 100.0 + i), [Artist(artist_id="a5", name="New")])
+        assert 10 == similarity.update()
+
+        # the statistics follow the tracks once their number doubles
+        tempos = [170.0, 160.0, 70.0] + [100.0 + i for i in range(10)]
+        assert 13 == similarity.standardized_tracks
+        assert pytest.approx(np.mean(tempos)) == similarity.mean[1]
+        assert "n9" == similarity.tracks_like({"energy": 0.5, "tempo": 109.0}, 1)[0][0]
+        assert "a5" in similarity.artists
+
+    def test_artists_by_tags(self, graph):
+        artist_tags = DataFrame({
+            "artist_id": ["a1", "a1", "a2", "a3"],
+            "tag_id": [0, 1, 0, 2],
+            "count": [100.0, 20.0, 80.0, 100.0],
+        })
+        similarity = GraphSimilarity(graph, FEATURES, artist_tags=artist_tags)
+        assert [("a2", pytest.approx(100 / np.hypot(100, 20)))] == similarity.most_similar("a1", 1)
+
+        # only the most common tags become dimensions
+        similarity = GraphSimilarity(graph, FEATURES, artist_tags=artist_tags, tag_dims=1)
+        assert 1 == similarity.artists.dim
+        assert {"a1", "a2"} == set(similarity.artists.ids)
+
+        # tag rows of new artists are indexed on update
+        similarity.update(artist_tags=DataFrame({"artist_id": ["a4"], "tag_id": [0], "count": [50.0]}))
+        assert {"a1", "a2", "a4"} == set(similarity.artists.ids)
+        assert pytest.approx(1.0) == similarity.most_similar("a4", 1)[0][1]
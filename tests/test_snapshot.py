@@ -0,0 +1,96 @@
+import os
+
+from acquisition.artist import Artist
+from acquisition.graph import Graph
+from acquisition.snapshot import SnapshotWriter
+from acquisition.track import Track
+
+
+def put_tracks(graph, track_ids):
+    for track_id in track_ids:
+        graph.put_track(
+            Track(track_id=track_id, name=f"track {track_id}", album="Telefone", album_type="album"),
+            [Artist(artist_id="0001", name="Noname"), Artist(artist_id=f"a{track_id}", name=f"artist {track_id}")]
+        )
+
+
+class TestSnapshotWriter:
+    def test_flush_only_writes_changes(self, tmp_path):
+        writer = SnapshotWriter(str(tmp_path))
+        graph = Graph()
+
+        put_tracks(graph, ["000", "111"])
+        first = writer.flush(graph, "first")
+        assert 5 == first["vertex_count"]
+        assert 4 == first["edge_count"]
+
+        # nothing changed since the last flush
+        assert writer.flush(graph, "empty") is None
+
+        put_tracks(graph, ["222"])
+        second = writer.flush(graph, "second")
+        assert 3 == second["vertex_count"]       # new track, its new artist and the re-put (now seen) artist
+        assert 2 == second["edge_count"]
+
+        vertices, edges = writer.read()
+        assert 7 == len(vertices)
+        assert 6 == len(edges)
+        assert vertices.set_index("id").loc["0001", "seen"]
+        assert not vertices.set_index("id").loc["a222", "seen"]
+
+    def test_manifest_persists(self, tmp_path):
+        graph = Graph()
+        put_tracks(graph, ["000"])
+        SnapshotWriter(str(tmp_path)).flush(graph, "first")
+
+        put_tracks(graph, ["111"])
+        writer = SnapshotWriter(str(tmp_path))
+        segment = writer.flush(graph, "second")
+
+        assert "vertices_00001.csv" == segment["vertices"]
+        assert ["first", "second"] == [s["name"] for s in writer.manifest["segments"]]
+
+    def test_compact(self, tmp_path):
+        writer = SnapshotWriter(str(tmp_path))
+        graph = Graph()
+        for track_id in ["000", "111", "222"]:
+            put_tracks(graph, [track_id])
+            writer.flush(graph, track_id)
+
+        expected_vertices, expected_edges = writer.read()
+        segment = writer.compact()
+
+        assert 1 == len(writer.manifest["segments"])
+        assert ["artist_edges.csv", "edges.csv", "manifest.json", "vertices.csv"] == sorted(os.listdir(str(tmp_path)))
+        assert len(expected_vertices) == segment["vertex_count"]
+
+        vertices, edges = SnapshotWriter(str(tmp_path)).read()
+        assert expected_vertices.equals(vertices)
+        assert expected_edges.equals(edges)
+        assert 3 == len(SnapshotWriter(str(tmp_path)).read_artist_edges())
+
+    def test_artist_edges(self, tmp_path):
+        writer = SnapshotWriter(str(tmp_path))
+        graph = Graph()
+        put_tracks(graph, ["000"])
+        assert 1 == writer.flush(graph, "first")["artist_edge_count"]
+
+        # a related link alone is enough for a segment, and rewrites the pair with its latest values
+        graph.add_related(Artist(artist_id="a000", name="artist 000"), [Artist(artist_id="0001", name="Noname")])
+        segment = writer.flush(graph, "second")
+        assert 0 == segment["vertex_count"]
+        assert 1 == segment["artist_edge_count"]
+
+        artist_edges = writer.read_artist_edges()
+        assert [("0001", "a000", 1, True)] == list(artist_edges.itertuples(index=False, name=None))
+
+    def test_parquet_segments(self, tmp_path):
+        writer = SnapshotWriter(str(tmp_path), file_format="parquet")
+        graph = Graph()
+        put_tracks(graph, ["000"])
+        segment = writer.flush(graph, "first")
+
+        assert "vertices_00000.parquet" == segment["vertices"]
+        vertices, edges = writer.read()
+        assert ["000", "0001", "a000"] == list(vertices["id"])
+        assert 2 == len(edges)
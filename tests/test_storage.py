@@ -0,0 +1,37 @@
+from pandas import DataFrame
+
+from acquisition.storage import read_edges, read_vertices, write_edges, write_vertices
+
+vertices = DataFrame({
+    "id": ["000", "0001", "0002"],
+    "name": ["Diddy Bop", "Noname", "Cam O'bi"],
+    "album": ["Telefone", None, None],
+    "album_type": ["album", None, None],
+    "node_type": ["track", "artist", "artist"],
+    "attr.danceability": [0.5, None, None],
+    "attr.popularity": [None, 70, 55],
+    "attr.genres": [None, ["chicago rap", "conscious hip hop"], []],
+    "seen": [None, True, False]
+})
+
+edges = DataFrame({"source": ["000", "000"], "target": ["0001", "0002"]})
+
+
+class TestStorage:
+    def test_parquet_round_trip(self, tmp_path):
+        write_vertices(vertices, str(tmp_path / "vertices.parquet"), ["danceability"])
+        write_edges(edges, str(tmp_path / "edges.parquet"))
+
+        actual = read_vertices(str(tmp_path / "vertices.parquet"), ["danceability"])
+        assert "float64" == str(actual["attr.danceability"].dtype)
+        assert "float64" == str(actual["attr.popularity"].dtype)
+        assert "boolean" == str(actual["seen"].dtype)
+        assert [None, ["chicago rap", "conscious hip hop"], []] == list(actual["attr.genres"])
+        assert edges.equals(read_edges(str(tmp_path / "edges.parquet")))
+
+    def test_csv_parses_lists(self, tmp_path):
+        write_vertices(vertices, str(tmp_path / "vertices.csv"), ["danceability"])
+
+        actual = read_vertices(str(tmp_path / "vertices.csv"), ["danceability"])
+        assert [None, ["chicago rap", "conscious hip hop"], []] == list(actual["attr.genres"])
+        assert [False, True, False] == list(actual["seen"].fillna(False))
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import os
+
+import pytest
+from pandas import DataFrame, concat, isna, read_csv, read_parquet
+
+from acquisition.ratelimit import RateLimited
+from acquisition.storage import read_vertex_chunks
+from acquisition.tag import PartialOutput, skip_rows, tag_vertices
+
+
+class FakeLastFMClient:
+    def __init__(self, latency=0.01, rate_limited=()):
+        self.latency = latency
+        self.rate_limited = rate_limited
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.sessions = set()
+
+    async def get_top_tags(self, session, artist_index, artist_name):
+        self.sessions.add(id(session))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.latency)
+        self.in_flight -= 1
+
+        if artist_name in self.rate_limited:
+            raise RateLimited("Rate limit exceeded")
+        if artist_name == "nobody":
+            return artist_index, []
+        return artist_index, {f"{artist_name} tag": 100}
+
+
+def chunks(n_chunks, chunk_size):
+    for c in range(n_chunks):
+        start = c * chunk_size
+        yield DataFrame({
+            "id": [f"{i}" for i in range(start, start + chunk_size)],
+            "name": [f"artist {i}" if i % 4 else f"track {i}" for i in range(start, start + chunk_size)],
+            "node_type": ["artist" if i % 4 else "track" for i in range(start, start + chunk_size)],
+        }, index=range(start, start + chunk_size))
+
+
+class TestTagVertices:
+    def test_tags_chunks_in_order(self):
+        lastfm = FakeLastFMClient()
+        tagged = []
+
+        rate_limited = asyncio.run(tag_vertices(lastfm, chunks(5, 20), 8, tagged.append))
+
+        assert not rate_limited
+        assert 5 == len(tagged)
+        assert [f"{i}" for i in range(100)] == [i for chunk in tagged for i in chunk["id"]]
+
+        # one session for the whole run, and never more requests in flight than workers
+        assert 1 == len(lastfm.sessions)
+        assert 8 == lastfm.max_in_flight
+
+        vertices = tagged[1]
+        assert {"artist 21 tag": 100} == json.loads(vertices.loc[21, "tags"])
+        assert isna(vertices.loc[20, "tags"])
+
+    def test_skips_tagged_and_rate_limited_artists(self):
+        lastfm = FakeLastFMClient(rate_limited=["artist 2"])
+        vertices = DataFrame({
+            "id": ["1", "2", "3", "4"],
+            "name": ["artist 1", "artist 2", "artist 3", "nobody"],
+            "node_type": ["artist"] * 4,
+            "tags": [json.dumps({"rock": 1}), None, None, None]
+        })
+        tagged = []
+
+        rate_limited = asyncio.run(tag_vertices(lastfm, [vertices], 4, tagged.append))
+
+        assert rate_limited
+        assert [json.dumps({"rock": 1}), "", json.dumps({"artist 3 tag": 100}), json.dumps({"none": 0})] == \
+            list(tagged[0]["tags"].fillna(""))
+
+
+class CrashAfter:
+    def __init__(self, output, chunks):
+        self.output = output
+        self.chunks = chunks
+
+    def write(self, vertices):
+        if self.chunks <= 0:
+            raise KeyboardInterrupt("container restarted")
+        self.output.write(vertices)
+        self.chunks -= 1
+
+
+class TestPartialOutput:
+    def test_rerun_picks_up_partial_output(self, tmp_path):
+        path = str(tmp_path / "vertices.csv")
+        concat(list(chunks(5, 20))).to_csv(path, index=False)
+        original = read_csv(path)
+
+        # first run dies after writing two chunks; the input is untouched
+        output = PartialOutput(path)
+        with pytest.raises(KeyboardInterrupt):
+            asyncio.run(tag_vertices(FakeLastFMClient(), read_csv(path, chunksize=20), 4,
+                                     CrashAfter(output, 2).write))
+        assert original.equals(read_csv(path))
+
+        # rerun only tags the remaining chunks, then replaces the input
+        output = PartialOutput(path)
+        assert 40 == output.rows
+
+        lastfm = FakeLastFMClient()
+        requested = []
+        original_get_top_tags = lastfm.get_top_tags
+
+        async def get_top_tags(session, artist_index, artist_name):
+            requested.append(artist_name)
+            return await original_get_top_tags(session, artist_index, artist_name)
+
+        lastfm.get_top_tags = get_top_tags
+        asyncio.run(tag_vertices(lastfm, skip_rows(read_csv(path, chunksize=20), output.rows), 4, output.write))
+        output.finish()
+
+        assert 45 == len(requested)
+        assert "artist 41" in requested
+        assert "artist 39" not in requested
+
+        tagged = read_csv(path)
+        assert list(original["id"]) == list(tagged["id"])
+        assert {"artist 1 tag": 100} == json.loads(tagged["tags"][1])
+        assert {"artist 99 tag": 100} == json.loads(tagged["tags"][99])
+        assert not os.path.exists(path + ".partial")
+
+    def test_discards_partial_output_for_changed_input(self, tmp_path):
+        path = str(tmp_path / "vertices.csv")
+        concat(list(chunks(2, 20))).to_csv(path, index=False)
+        output = PartialOutput(path)
+        output.write(next(chunks(1, 20)))
+
+        concat(list(chunks(3, 20))).to_csv(path, index=False)
+        assert 0 == PartialOutput(path).rows
+        assert 0 == os.path.getsize(path + ".partial")
+
+    def test_parquet(self, tmp_path):
+        path = str(tmp_path / "vertices.parquet")
+        concat(list(chunks(3, 20))).to_parquet(path, index=False)
+
+        output = PartialOutput(path)
+        asyncio.run(tag_vertices(FakeLastFMClient(), read_vertex_chunks(path, [], chunksize=20), 4, output.write))
+        output.finish()
+
+        tagged = read_parquet(path)
+        assert [f"{i}" for i in range(60)] == list(tagged["id"])
+        assert {"artist 21 tag": 100} == json.loads(tagged["tags"][21])
+        assert isna(tagged["tags"][20])
+        assert not os.path.exists(path + ".partial")
@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+from pandas import DataFrame, read_csv
+
+from acquisition.tag_tables import normalize_tags, read_artist_tags, write_tag_tables
+
+
+def vertices():
+    return DataFrame({
+        "id": ["000", "0001", "0002", "0003", "0004"],
+        "node_type": ["track", "artist", "artist", "artist", "artist"],
+        "tags": [
+            None,
+            json.dumps({"rap": 100, "chicago": 40}),
+            json.dumps({"soul": 100, "rap": 10}),
+            json.dumps({"none": 0}),
+            None
+        ]
+    })
+
+
+class TestTagTables:
+    def test_normalize(self, tmp_path):
+        path = str(tmp_path / "vertices.csv")
+        vertices().to_csv(path, index=False)
+
+        tables = normalize_tags(read_artist_tags(path, chunksize=2))
+
+        # tag IDs follow the sorted vocabulary; untagged artists and the "none" marker are left out
+        assert ["chicago", "rap", "soul"] == list(tables["tags"]["tag"])
+        assert [1, 2, 1] == list(tables["tags"]["artists"])
+        assert ["0001", "0002"] == list(tables["artists"]["artist_id"])
+        assert [("0001", 1, 100), ("0001", 0, 40), ("0002", 2, 100), ("0002", 1, 10)] == list(
+            tables["artist_tags"].itertuples(index=False, name=None)
+        )
+
+    def test_write(self, tmp_path):
+        path = str(tmp_path / "vertices.csv")
+        vertices().to_csv(path, index=False)
+        write_tag_tables(str(tmp_path / "tags"), normalize_tags(read_artist_tags(path)))
+
+        assert ["artist_id", "tag_id", "count"] == list(read_csv(tmp_path / "tags" / "artist_tags.csv").columns)
+        assert ["tag_id", "tag", "artists"] == list(read_csv(tmp_path / "tags" / "tags.csv").columns)
+
+        # a coo matrix in scipy.sparse.save_npz's layout
+        matrix = np.load(tmp_path / "tags" / "artist_tags.npz")
+        assert b"coo" == matrix["format"].item()
+        dense = np.zeros(matrix["shape"])
+        dense[matrix["row"], matrix["col"]] = matrix["data"]
+        assert [[40, 100, 0], [0, 10, 100]] == dense.tolist()
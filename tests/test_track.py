@@ -1,3 +1,5 @@
+import pytest
+
 from acquisition.track import Track
 
 
@@ -44,3 +46,26 @@ class TestTrack:
         a.set_attrs(attr)
 
         assert a.attr == attr
+
+    def test_audio_features_round_trip(self):
+        attr = {"danceability": 0.5, "key": 7, "tempo": None, "fire": True}
+        a = Track(track_id="123", name="Trust Nobody", album="Cheap Queen", album_type="album", attr=attr)
+
+        assert a.attr == {"danceability": 0.5, "key": 7.0, "tempo": None, "fire": True}
+        assert a.to_dict() == {
+            "attr": a.attr, "id": "123", "name": "Trust Nobody", "album": "Cheap Queen", "album_type": "album",
+            "node_type": "track"
+        }
+
+    def test_attr_read_only(self):
+        a = Track(track_id="123", name="Trust Nobody", album="Cheap Queen", album_type="album", attr={"fire": True})
+
+        with pytest.raises(TypeError):
+            a.attr["danceability"] = 0.5
+        a.attr = {**a.attr, "danceability": 0.5}
+        assert {"fire": True, "danceability": 0.5} == a.attr
+
+    def test_slots(self):
+        a = Track(track_id="123", name="Trust Nobody", album="Cheap Queen", album_type="album")
+
+        assert not hasattr(a, "__dict__")